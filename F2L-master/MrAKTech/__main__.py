@@ -13,9 +13,13 @@ from pyrogram import idle, utils as pyroutils
 from MrAKTech import StreamBot
 from MrAKTech.server import web_server
 from MrAKTech.clients import initialize_clients, restart_bot
-from MrAKTech.tools.utils_bot import temp
+from MrAKTech.tools.utils_bot import temp, resume_broadcast
 from MrAKTech.tools.performance_monitor import start_performance_monitoring
 from MrAKTech.tools.advanced_cache import start_cache_cleanup
+from MrAKTech.tools.chunk_cache import chunk_cache
+from MrAKTech.tools.shortener import shortener
+from MrAKTech.tools.render_template import load_templates
+from MrAKTech.database.u_db import u_db
 
 logging.basicConfig(
     level=logging.INFO,
@@ -61,6 +65,9 @@ async def start_services():
     print("------------------ Starting Performance Monitoring ----------------")
     await start_performance_monitoring()
     await start_cache_cleanup()
+    await chunk_cache.load()
+    await u_db.ensure_indexes()
+    load_templates()
     print("------------------------------ DONE ------------------------------")
     print()
     print("--------------------- Initializing High-Speed Web Server ---------------------")
@@ -108,6 +115,7 @@ async def start_services():
     print("   ✅ Performance monitoring enabled")
     print("   ✅ Optimized chunk sizes (up to 2MB)")
     print("   ✅ Enhanced connection handling")
+    await resume_broadcast(StreamBot, "users")
     print("------------ Storage clone bots start ------------")
     await restart_bot()
     print("------------ all clone bots started ------------")
@@ -117,6 +125,7 @@ async def start_services():
 
 async def cleanup():
     await server.cleanup()
+    await shortener.close()
     await StreamBot.stop()
 
 
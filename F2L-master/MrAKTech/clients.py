@@ -6,6 +6,7 @@ from os import environ
 from pyrogram import Client
 from MrAKTech.config import Telegram
 from MrAKTech import multi_clients, work_loads, StreamBot
+from MrAKTech.tools.utils_bot import resume_broadcast
 
 logger = logging.getLogger("multi_client")
 
@@ -33,6 +34,7 @@ async def restart_bot():
             workers=300, in_memory=True
         )
         await ai.start()
+        await resume_broadcast(ai, "storage")
     except Exception as e:
         logger.exception(f"Error while restarting bot with token {Telegram.FILE_STORE_BOT_TOKEN}: {e}")
     logger.info("All bots restarted.") 
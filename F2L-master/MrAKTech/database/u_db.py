@@ -1,9 +1,56 @@
 # Copyright 2021 To 2024-present, Author: MrAKTech
 
+import copy
 import datetime
 import motor.motor_asyncio
 from MrAKTech.config import Telegram
 from MrAKTech.tools.txt import tamilxd
+from MrAKTech.tools.advanced_cache import AdvancedCache
+
+
+DEFAULT_SHORTLINKS = {
+    "shortlink1": {"url": None, "api": None},
+    "shortlink2": {"url": None, "api": None},
+    "shortlink3": {"url": None, "api": None}
+}
+
+DEFAULT_PAGE_SETTINGS = {
+    "shortlink_tutorials": {
+        "shortlink1": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"},
+        "shortlink2": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"},
+        "shortlink3": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"}
+    },
+    "button_visibility": {
+        "watch": True,
+        "download": True,
+        "telegram": True
+    },
+    "button_names": {
+        "watch": "🎮 Watch Online",
+        "download": "📥 Download",
+        "telegram": "📱 Telegram Storage"
+    },
+    "custom_buttons": []
+}
+
+DEFAULT_VERIFY_SETTINGS = {
+    "shortlink_tutorials": {
+        "shortlink1": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"},
+        "shortlink2": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"},
+        "shortlink3": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"}
+    }
+}
+
+# Fields loaded together for link generation and the /web page
+PAGE_FIELDS = (
+    "page_mode",
+    "verify_mode",
+    "page_code",
+    "page_shortlinks",
+    "verify_shortlinks",
+    "page_settings",
+    "verify_settings",
+)
 
 
 class Database:
@@ -17,6 +64,9 @@ class Database:
         self.warn = self.db.WarnsList
         self.bot = self.db.bots
         self.Inactive = self.db.InActiveUsers
+        self.broadcasts = self.db.broadcasts
+        # Page settings snapshots of users and channels, dropped by the setters
+        self.settings_cache = AdvancedCache(max_size=10000, ttl=600)
 
     def new_user(self, id):
         import secrets
@@ -106,6 +156,7 @@ class Database:
     async def add_user(self, id):
         user = self.new_user(id)
         await self.col.insert_one(user)
+        self._drop_page_snapshot("user", id)
 
     async def get_user(self, id):
         return await self.col.find_one({"id": id})
@@ -122,6 +173,7 @@ class Database:
 
     async def delete_user(self, user_id):
         await self.col.delete_many({"id": int(user_id)})
+        self._drop_page_snapshot("user", user_id)
 
     # testing start
 
@@ -168,6 +220,7 @@ class Database:
         myquery = {"id": user_id}
         newvalues = {tag: value}
         await self.col.update_one(myquery, newvalues)
+        self._drop_page_snapshot("user", user_id)
 
     async def reset_settings(self, id):
         await self.col.update_one(
@@ -271,7 +324,7 @@ class Database:
         # Generate a random page code for privacy (8 characters)
         page_code = secrets.token_urlsafe(8)
         
-        return await self.chl.insert_one(
+        result = await self.chl.insert_one(
             {
                 "user_id": int(user_id),
                 "chat_id": int(chat_id),
@@ -281,12 +334,16 @@ class Database:
                 "page_code": page_code,
             }
         )
+        self._drop_page_snapshot("chl", chat_id)
+        return result
 
     async def remove_channel(self, user_id: int, chat_id : int):
         channel = await self.in_channel(int(user_id), int(chat_id))
         if not channel:
             return False
-        return await self.chl.delete_many({"user_id": int(user_id), "chat_id": int(chat_id)})
+        result = await self.chl.delete_many({"user_id": int(user_id), "chat_id": int(chat_id)})
+        self._drop_page_snapshot("chl", chat_id)
+        return result
 
     async def is_channel_exist(self, chat_id):
         channel = await self.chl.find_one({"chat_id": int(chat_id)})
@@ -307,6 +364,7 @@ class Database:
         await self.chl.update_one(
             {"chat_id": int(chat_id)}, {"$set": {f"settings.{type}": value}}
         )
+        self._drop_page_snapshot("chl", chat_id)
 
     async def get_channel_detail(self, chat_id : int):
         return await self.chl.find_one({"chat_id": int(chat_id)})
@@ -318,6 +376,7 @@ class Database:
         await self.chl.update_one(
             {"chat_id": int(chat_id)}, {"$set": {"settings": self.default_setgs}}
         )
+        self._drop_page_snapshot("chl", chat_id)
 
     async def is_chl_settings(self, chat_id):
         chat = await self.get_chl_settings(chat_id)
@@ -527,12 +586,10 @@ class Database:
             {"chat_id": int(chat_id)}, 
             {"$set": {"settings.page_mode": enabled}}
         )
+        self._drop_page_snapshot("chl", chat_id)
     
     async def get_chl_page_mode(self, chat_id):
-        chat = await self.chl.find_one({"chat_id": int(chat_id)})
-        if chat and chat.get("settings"):
-            return chat["settings"].get("page_mode", False)
-        return False
+        return (await self.get_chl_page_snapshot(chat_id))["page_mode"]
     
     async def set_chl_page_shortlink(self, chat_id, shortlink_num, url, api):
         key = f"settings.page_shortlinks.shortlink{shortlink_num}"
@@ -540,16 +597,10 @@ class Database:
             {"chat_id": int(chat_id)}, 
             {"$set": {f"{key}.url": url, f"{key}.api": api}}
         )
+        self._drop_page_snapshot("chl", chat_id)
     
     async def get_chl_page_shortlinks(self, chat_id):
-        chat = await self.chl.find_one({"chat_id": int(chat_id)})
-        if chat and chat.get("settings") and chat["settings"].get("page_shortlinks"):
-            return chat["settings"]["page_shortlinks"]
-        return {
-            "shortlink1": {"url": None, "api": None},
-            "shortlink2": {"url": None, "api": None},
-            "shortlink3": {"url": None, "api": None}
-        }
+        return copy.deepcopy((await self.get_chl_page_snapshot(chat_id))["page_shortlinks"])
     
     async def remove_chl_page_shortlink(self, chat_id, shortlink_num):
         key = f"settings.page_shortlinks.shortlink{shortlink_num}"
@@ -557,15 +608,16 @@ class Database:
             {"chat_id": int(chat_id)}, 
             {"$set": {f"{key}.url": None, f"{key}.api": None}}
         )
+        self._drop_page_snapshot("chl", chat_id)
 
     async def get_chl_page_code(self, chat_id):
-        chat = await self.chl.find_one({"chat_id": int(chat_id)})
-        return chat.get("page_code") if chat else None
+        return (await self.get_chl_page_snapshot(chat_id))["page_code"]
     
     async def regenerate_chl_page_code(self, chat_id):
         import secrets
         new_page_code = secrets.token_urlsafe(8)
         await self.chl.update_one({"chat_id": int(chat_id)}, {"$set": {"page_code": new_page_code}})
+        self._drop_page_snapshot("chl", chat_id)
         return new_page_code
     
     async def get_channel_by_page_code(self, page_code):
@@ -574,10 +626,10 @@ class Database:
     # Page mode methods for users
     async def set_page_mode(self, id, enabled):
         await self.col.update_one({"id": id}, {"$set": {"page_mode": enabled}})
+        self._drop_page_snapshot("user", id)
     
     async def get_page_mode(self, id):
-        user = await self.col.find_one({"id": int(id)})
-        return user.get("page_mode", False) if user else False
+        return (await self.get_page_snapshot(id))["page_mode"]
     
     async def set_page_shortlink(self, id, shortlink_num, url, api):
         key = f"page_shortlinks.shortlink{shortlink_num}"
@@ -585,20 +637,10 @@ class Database:
             {"id": id}, 
             {"$set": {f"{key}.url": url, f"{key}.api": api}}
         )
+        self._drop_page_snapshot("user", id)
     
     async def get_page_shortlinks(self, id):
-        user = await self.col.find_one({"id": int(id)})
-        if user:
-            return user.get("page_shortlinks", {
-                "shortlink1": {"url": None, "api": None},
-                "shortlink2": {"url": None, "api": None},
-                "shortlink3": {"url": None, "api": None}
-            })
-        return {
-            "shortlink1": {"url": None, "api": None},
-            "shortlink2": {"url": None, "api": None},
-            "shortlink3": {"url": None, "api": None}
-        }
+        return copy.deepcopy((await self.get_page_snapshot(id))["page_shortlinks"])
     
     async def remove_page_shortlink(self, id, shortlink_num):
         key = f"page_shortlinks.shortlink{shortlink_num}"
@@ -606,15 +648,16 @@ class Database:
             {"id": id}, 
             {"$set": {f"{key}.url": None, f"{key}.api": None}}
         )
+        self._drop_page_snapshot("user", id)
 
     async def get_page_code(self, id):
-        user = await self.col.find_one({"id": int(id)})
-        return user.get("page_code") if user else None
+        return (await self.get_page_snapshot(id))["page_code"]
     
     async def regenerate_page_code(self, id):
         import secrets
         new_page_code = secrets.token_urlsafe(8)
         await self.col.update_one({"id": id}, {"$set": {"page_code": new_page_code}})
+        self._drop_page_snapshot("user", id)
         return new_page_code
     
     async def get_user_by_page_code(self, page_code):
@@ -623,10 +666,10 @@ class Database:
     # Verify functionality methods
     async def set_verify_mode(self, id, enabled):
         await self.col.update_one({"id": id}, {"$set": {"verify_mode": enabled}})
+        self._drop_page_snapshot("user", id)
     
     async def get_verify_mode(self, id):
-        user = await self.col.find_one({"id": int(id)})
-        return user.get("verify_mode", False) if user else False
+        return (await self.get_page_snapshot(id))["verify_mode"]
     
     async def set_verify_shortlink(self, id, shortlink_num, url, api):
         key = f"verify_shortlinks.shortlink{shortlink_num}"
@@ -634,20 +677,10 @@ class Database:
             {"id": id}, 
             {"$set": {f"{key}.url": url, f"{key}.api": api}}
         )
+        self._drop_page_snapshot("user", id)
     
     async def get_verify_shortlinks(self, id):
-        user = await self.col.find_one({"id": int(id)})
-        if user:
-            return user.get("verify_shortlinks", {
-                "shortlink1": {"url": None, "api": None},
-                "shortlink2": {"url": None, "api": None},
-                "shortlink3": {"url": None, "api": None}
-            })
-        return {
-            "shortlink1": {"url": None, "api": None},
-            "shortlink2": {"url": None, "api": None},
-            "shortlink3": {"url": None, "api": None}
-        }
+        return copy.deepcopy((await self.get_page_snapshot(id))["verify_shortlinks"])
     
     async def remove_verify_shortlink(self, id, shortlink_num):
         key = f"verify_shortlinks.shortlink{shortlink_num}"
@@ -655,6 +688,7 @@ class Database:
             {"id": id}, 
             {"$set": {f"{key}.url": None, f"{key}.api": None}}
         )
+        self._drop_page_snapshot("user", id)
     
     async def set_verify_time_gap(self, id, time_gap):
         await self.col.update_one({"id": id}, {"$set": {"verify_time_gap": time_gap}})
@@ -699,9 +733,10 @@ class Database:
             return True
         return False
     
-    async def get_verify_shortlink_to_use(self, id):
+    async def get_verify_shortlink_to_use(self, id, verification_status=None):
         """Determine which verify shortlink should be used based on verification count"""
-        verification_status = await self.get_verification_status(id)
+        if verification_status is None:
+            verification_status = await self.get_verification_status(id)
         verify_shortlinks = await self.get_verify_shortlinks(id)
         
         # Count how many verifications done today
@@ -759,113 +794,26 @@ class Database:
     # Page settings methods for users
     async def get_page_settings(self, id):
         """Get page mode customization settings for user"""
-        user = await self.col.find_one({"id": int(id)})
-        if user:
-            return user.get("page_settings", {
-                "shortlink_tutorials": {
-                    "shortlink1": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"},
-                    "shortlink2": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"},
-                    "shortlink3": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"}
-                },
-                "button_visibility": {
-                    "watch": True,
-                    "download": True,
-                    "telegram": True
-                },
-                "button_names": {
-                    "watch": "🎮 Watch Online",
-                    "download": "📥 Download",
-                    "telegram": "📱 Telegram Storage"
-                },
-                "custom_buttons": []
-            })
-        return {
-            "shortlink_tutorials": {
-                "shortlink1": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"},
-                "shortlink2": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"},
-                "shortlink3": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"}
-            },
-            "button_visibility": {
-                "watch": True,
-                "download": True,
-                "telegram": True
-            },
-            "button_names": {
-                "watch": "🎮 Watch Online",
-                "download": "📥 Download",
-                "telegram": "📱 Telegram Storage"
-            },
-            "custom_buttons": []
-        }
+        return copy.deepcopy((await self.get_page_snapshot(id))["page_settings"])
     
     async def update_page_settings(self, id, page_settings):
         """Update page mode customization settings for user"""
         await self.col.update_one({"id": id}, {"$set": {"page_settings": page_settings}})
+        self._drop_page_snapshot("user", id)
     
     async def get_verify_settings(self, id):
         """Get verify mode customization settings for user"""
-        user = await self.col.find_one({"id": int(id)})
-        if user:
-            return user.get("verify_settings", {
-                "shortlink_tutorials": {
-                    "shortlink1": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"},
-                    "shortlink2": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"},
-                    "shortlink3": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"}
-                }
-            })
-        return {
-            "shortlink_tutorials": {
-                "shortlink1": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"},
-                "shortlink2": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"},
-                "shortlink3": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"}
-            }
-        }
+        return copy.deepcopy((await self.get_page_snapshot(id))["verify_settings"])
     
     async def update_verify_settings(self, id, verify_settings):
         """Update verify mode customization settings for user"""
         await self.col.update_one({"id": id}, {"$set": {"verify_settings": verify_settings}})
+        self._drop_page_snapshot("user", id)
     
     # Page settings methods for channels
     async def get_chl_page_settings(self, chat_id):
         """Get page mode customization settings for channel"""
-        chat = await self.chl.find_one({"chat_id": int(chat_id)})
-        if chat and chat.get("settings"):
-            return chat["settings"].get("page_settings", {
-                "shortlink_tutorials": {
-                    "shortlink1": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"},
-                    "shortlink2": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"},
-                    "shortlink3": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"}
-                },
-                "button_visibility": {
-                    "watch": True,
-                    "download": True,
-                    "telegram": True
-                },
-                "button_names": {
-                    "watch": "🎮 Watch Online",
-                    "download": "📥 Download",
-                    "telegram": "📱 Telegram Storage"
-                },
-                "custom_buttons": []
-            })
-        return {
-            "shortlink_tutorials": {
-                "shortlink1": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"},
-                "shortlink2": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"},
-                "shortlink3": {"enabled": False, "video_url": None, "button_text": "📺 Tutorial"}
-            },
-            "button_visibility": {
-                "watch": True,
-                "download": True,
-                "telegram": True
-            },
-            "button_names": {
-                "watch": "🎮 Watch Online",
-                "download": "📥 Download",
-                "telegram": "📱 Telegram Storage"
-            },
-            "custom_buttons": []
-        }
+        return copy.deepcopy((await self.get_chl_page_snapshot(chat_id))["page_settings"])
     
     async def update_chl_page_settings(self, chat_id, page_settings):
         """Update page mode customization settings for channel"""
@@ -873,25 +821,11 @@ class Database:
             {"chat_id": int(chat_id)}, 
             {"$set": {"settings.page_settings": page_settings}}
         )
+        self._drop_page_snapshot("chl", chat_id)
     
     async def get_chl_verify_settings(self, chat_id):
         """Get verify mode customization settings for channel"""
-        chat = await self.chl.find_one({"chat_id": int(chat_id)})
-        if chat and chat.get("settings"):
-            return chat["settings"].get("verify_settings", {
-                "shortlink_tutorials": {
-                    "shortlink1": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"},
-                    "shortlink2": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"},
-                    "shortlink3": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"}
-                }
-            })
-        return {
-            "shortlink_tutorials": {
-                "shortlink1": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"},
-                "shortlink2": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"},
-                "shortlink3": {"enabled": False, "video_url": None, "button_text": "📺 Verify Tutorial"}
-            }
-        }
+        return copy.deepcopy((await self.get_chl_page_snapshot(chat_id))["verify_settings"])
     
     async def update_chl_verify_settings(self, chat_id, verify_settings):
         """Update verify mode customization settings for channel"""
@@ -899,6 +833,7 @@ class Database:
             {"chat_id": int(chat_id)}, 
             {"$set": {"settings.verify_settings": verify_settings}}
         )
+        self._drop_page_snapshot("chl", chat_id)
 
     # Channel verify shortlinks methods
     async def set_chl_verify_mode(self, chat_id, enabled):
@@ -907,13 +842,11 @@ class Database:
             {"chat_id": int(chat_id)}, 
             {"$set": {"settings.verify_mode": enabled}}
         )
+        self._drop_page_snapshot("chl", chat_id)
     
     async def get_chl_verify_mode(self, chat_id):
         """Get verify mode status for channel"""
-        chat = await self.chl.find_one({"chat_id": int(chat_id)})
-        if chat and chat.get("settings"):
-            return chat["settings"].get("verify_mode", False)
-        return False
+        return (await self.get_chl_page_snapshot(chat_id))["verify_mode"]
     
     async def set_chl_verify_shortlink(self, chat_id, shortlink_num, url, api):
         """Set verify shortlink for channel"""
@@ -922,17 +855,11 @@ class Database:
             {"chat_id": int(chat_id)}, 
             {"$set": {f"{key}.url": url, f"{key}.api": api}}
         )
+        self._drop_page_snapshot("chl", chat_id)
     
     async def get_chl_verify_shortlinks(self, chat_id):
         """Get verify shortlinks for channel"""
-        chat = await self.chl.find_one({"chat_id": int(chat_id)})
-        if chat and chat.get("settings") and chat["settings"].get("verify_shortlinks"):
-            return chat["settings"]["verify_shortlinks"]
-        return {
-            "shortlink1": {"url": None, "api": None},
-            "shortlink2": {"url": None, "api": None},
-            "shortlink3": {"url": None, "api": None}
-        }
+        return copy.deepcopy((await self.get_chl_page_snapshot(chat_id))["verify_shortlinks"])
     
     async def remove_chl_verify_shortlink(self, chat_id, shortlink_num):
         """Remove verify shortlink for channel"""
@@ -941,6 +868,7 @@ class Database:
             {"chat_id": int(chat_id)}, 
             {"$set": {f"{key}.url": None, f"{key}.api": None}}
         )
+        self._drop_page_snapshot("chl", chat_id)
     
     async def set_chl_verify_time_gap(self, chat_id, time_gap):
         """Set verify time gap for channel"""
@@ -956,6 +884,142 @@ class Database:
             return chat["settings"].get("verify_time_gap", 14400)
         return 14400
 
+    # Page settings snapshots
+    def _page_snapshot(self, doc):
+        doc = doc or {}
+        return {
+            "page_mode": doc.get("page_mode", False),
+            "verify_mode": doc.get("verify_mode", False),
+            "page_code": doc.get("page_code"),
+            "page_shortlinks": doc.get("page_shortlinks") or DEFAULT_SHORTLINKS,
+            "verify_shortlinks": doc.get("verify_shortlinks") or DEFAULT_SHORTLINKS,
+            "page_settings": doc.get("page_settings", DEFAULT_PAGE_SETTINGS),
+            "verify_settings": doc.get("verify_settings", DEFAULT_VERIFY_SETTINGS),
+        }
+
+    def _drop_page_snapshot(self, kind, id):
+        self.settings_cache.delete(f"{kind}_{int(id)}")
+
+    async def get_page_snapshot(self, id):
+        """
+        Page and verify settings of a user, loaded with one projected query
+        and cached until a setter changes them. Treat the result as read-only.
+        """
+        key = f"user_{int(id)}"
+        snapshot = self.settings_cache.get(key)
+        if snapshot is None:
+            user = await self.col.find_one(
+                {"id": int(id)}, {field: 1 for field in PAGE_FIELDS}
+            )
+            snapshot = self._page_snapshot(user)
+            self.settings_cache.set(key, snapshot)
+        return snapshot
+
+    async def get_chl_page_snapshot(self, chat_id):
+        """
+        Page and verify settings of a channel, loaded with one projected query
+        and cached until a setter changes them. Treat the result as read-only.
+        """
+        key = f"chl_{int(chat_id)}"
+        snapshot = self.settings_cache.get(key)
+        if snapshot is None:
+            projection = {f"settings.{field}": 1 for field in PAGE_FIELDS if field != "page_code"}
+            projection["page_code"] = 1
+            chat = await self.chl.find_one({"chat_id": int(chat_id)}, projection)
+            doc = dict(chat.get("settings") or {}) if chat else {}
+            doc["page_code"] = chat.get("page_code") if chat else None
+            snapshot = self._page_snapshot(doc)
+            self.settings_cache.set(key, snapshot)
+        return snapshot
+
+    async def get_page_config(self, page_code):
+        """
+        Resolves a /web page code to its owner and page settings.
+        Returns the page snapshot with "kind" ("user" or "chl") and "id" added,
+        or None if no user or channel has this page code. Users and channels
+        are searched with a single aggregation and the result is cached.
+        """
+        key = f"page_{page_code}"
+        owner = self.settings_cache.get(key)
+        if owner is not None:
+            kind, id = owner
+            if kind == "user":
+                snapshot = await self.get_page_snapshot(id)
+            else:
+                snapshot = await self.get_chl_page_snapshot(id)
+            # A regenerated page code no longer matches the owner's snapshot
+            if snapshot["page_code"] == page_code:
+                return {"kind": kind, "id": id, **snapshot}
+            self.settings_cache.delete(key)
+
+        user_fields = {field: 1 for field in PAGE_FIELDS}
+        chl_fields = {field: f"$settings.{field}" for field in PAGE_FIELDS if field != "page_code"}
+        pipeline = [
+            {"$match": {"page_code": page_code}},
+            {"$project": {"_id": 0, "kind": {"$literal": "user"}, "id": "$id", **user_fields}},
+            {"$unionWith": {
+                "coll": self.chl.name,
+                "pipeline": [
+                    {"$match": {"page_code": page_code}},
+                    {"$project": {
+                        "_id": 0, "kind": {"$literal": "chl"}, "id": "$chat_id",
+                        "page_code": 1, **chl_fields
+                    }},
+                ],
+            }},
+            {"$limit": 1},
+        ]
+        docs = await self.col.aggregate(pipeline).to_list(length=1)
+        if not docs:
+            return None
+        kind, id = docs[0]["kind"], docs[0]["id"]
+        snapshot = self._page_snapshot(docs[0])
+        self.settings_cache.set(f"{kind}_{int(id)}", snapshot)
+        self.settings_cache.set(key, (kind, id))
+        return {"kind": kind, "id": id, **snapshot}
+
+    # --------------------------- Broadcasts ----------------------------
+
+    def broadcast_col(self, kind):
+        return self.su if kind == "storage" else self.col
+
+    async def get_broadcast_batch(self, kind, after, limit):
+        """Next `limit` users of the main or storage bot by _id, after the _id `after`"""
+        query = {"_id": {"$gt": after}} if after else {}
+        return await self.broadcast_col(kind).find(query, {"id": 1}).sort("_id", 1).to_list(length=limit)
+
+    async def count_broadcast_remaining(self, kind, after):
+        return await self.broadcast_col(kind).count_documents({"_id": {"$gt": after}} if after else {})
+
+    async def delete_broadcast_users(self, kind, user_ids):
+        user_ids = [int(user_id) for user_id in user_ids]
+        await self.broadcast_col(kind).delete_many({"id": {"$in": user_ids}})
+        if kind != "storage":
+            for user_id in user_ids:
+                self._drop_page_snapshot("user", user_id)
+
+    async def add_inactive_users(self, user_ids):
+        existing = {user["id"] async for user in self.Inactive.find({"id": {"$in": user_ids}}, {"id": 1})}
+        users = [self.inew_user(user_id) for user_id in user_ids if user_id not in existing]
+        if users:
+            await self.Inactive.insert_many(users)
+
+    async def save_broadcast(self, kind, job):
+        await self.broadcasts.update_one({"_id": kind}, {"$set": job}, upsert=True)
+
+    async def get_broadcast(self, kind):
+        return await self.broadcasts.find_one({"_id": kind})
+
+    async def delete_broadcast(self, kind):
+        await self.broadcasts.delete_one({"_id": kind})
+
+    async def ensure_indexes(self):
+        """Create the indexes used by the per-user, per-channel and page code lookups"""
+        await self.col.create_index("id")
+        await self.col.create_index("page_code")
+        await self.chl.create_index("chat_id")
+        await self.chl.create_index("page_code")
+
 
 # Initialize database instance
 from MrAKTech.config import Telegram
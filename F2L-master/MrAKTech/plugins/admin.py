@@ -1,21 +1,16 @@
 #Copyright 2021 To 2024-present, Author: MrAKTech
 
-import time
-import asyncio
-
 from MrAKTech import StreamBot
 from MrAKTech.config import Telegram
 from MrAKTech.database.u_db import u_db
 from MrAKTech.tools.txt import tamilxd, BUTTON
-from MrAKTech.tools.utils_bot import temp, get_time, broadcast_messages
+from MrAKTech.tools.utils_bot import temp, Broadcast
 
 from pyrogram import filters
 from pyrogram.errors import ChatAdminRequired
 from pyrogram.enums.parse_mode import ParseMode
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 
-lock = asyncio.Lock()
-
 @StreamBot.on_message(filters.command('invite_link') & filters.user(list(Telegram.OWNER_ID)))
 async def gen_invite_link(bot, message):
     if len(message.command) == 1:
@@ -244,44 +239,20 @@ async def Clear_logs(client, message):
 @StreamBot.on_callback_query(filters.regex(r'^broadcast_cancel'))
 async def broadcast_cancel(bot, query):
     await query.message.edit("Trying to cancel broadcasting...")
-    temp.BROADCAST_CANCEL = True
+    temp.BROADCAST_CANCEL.add("users")
 
 @StreamBot.on_message(filters.command(["broadcast", "bcast", "pin_broadcast", "pin_bcast"]) & filters.private & filters.user(list(Telegram.OWNER_ID)) & filters.reply)
 async def broadcast_to_users(bot, message):
-    if lock.locked():
+    if "users" in temp.BROADCASTING:
         return await message.reply('Currently broadcast processing, Wait for complete.')
+    temp.BROADCASTING.add("users")
     #
     if message.command[0] in ['pin_broadcast', 'pin_bcast']:
         pin = True
     else:
         pin = False
-    msg = await message.reply_text('Broadcasting your message...')
-    broadcast_msg = message.reply_to_message
-    total_users = await u_db.total_users_count()
-    done = 0
-    blocked = 0
-    failed = 0
-    success = 0
-    start_time = time.time()
-    temp.BROADCAST_CANCEL = False
-
-    async with lock:
-        async for user in await u_db.get_all_users():
-            if temp.BROADCAST_CANCEL:
-                break
-            sts = await broadcast_messages(user['id'], broadcast_msg, pin)
-            if sts == "Success":
-                success += 1
-            elif sts == "Blocked":
-                blocked += 1
-            elif sts == "Failed":
-                failed += 1
-            done += 1
-            if done % 20 == 0:
-                btn = [[
-                    InlineKeyboardButton('CANCEL', callback_data='broadcast_cancel')
-                ]]
-                await msg.edit(f"Broadcast Processing...\n\nTotal Users: <code>{total_users}</code>\nCompleted: <code>{done} / {total_users}</code>\nSuccess: <code>{success}</code>\nBlocked: <code>{blocked}</code>\nFailed: <code>{failed}</code>", reply_markup=InlineKeyboardMarkup(btn))
-        time_taken = get_time(time.time() - start_time)
-        await msg.edit(f"Broadcast Completed.\nTime Taken: <code>{time_taken}</code>\n\nTotal Users: <code>{total_users}</code>\nCompleted: <code>{done} / {total_users}</code>\nSuccess: <code>{success}</code>\nBlocked: <code>{blocked}</code>\nFailed: <code>{failed}</code>")
-
+    try:
+        msg = await message.reply_text('Broadcasting your message...')
+        await Broadcast("users", message.reply_to_message, pin, msg).run()
+    finally:
+        temp.BROADCASTING.discard("users")
@@ -159,16 +159,18 @@ async def private_receive_handler(c: Client, m: Message):
         c_caption = smart_replace_placeholders_in_caption(c_caption, file_name, file_captionx)
     
     storage = f"https://telegram.me/{Telegram.FILE_STORE_BOT_USERNAME}?start=download_{log_msg.id}"
-    storagex = await short_link(storage, user)
     stream_linkx = f"{random.choice(Domain.CLOUDFLARE_URLS)}watch/{str(log_msg.id)}?hash={get_hash(log_msg)}"
-    stream_link = await short_link(stream_linkx, user)
-    online_link = await short_link(
-        f"{random.choice(Domain.CLOUDFLARE_URLS)}dl/{str(log_msg.id)}?hash={get_hash(log_msg)}",
-        user,
-    )
-    high_link = await short_link(
-        f"{random.choice(Domain.MRAKFAST_URLS)}dl/{str(log_msg.id)}?hash={get_hash(log_msg)}",
-        user,
+    storagex, stream_link, online_link, high_link = await asyncio.gather(
+        short_link(storage, user),
+        short_link(stream_linkx, user),
+        short_link(
+            f"{random.choice(Domain.CLOUDFLARE_URLS)}dl/{str(log_msg.id)}?hash={get_hash(log_msg)}",
+            user,
+        ),
+        short_link(
+            f"{random.choice(Domain.MRAKFAST_URLS)}dl/{str(log_msg.id)}?hash={get_hash(log_msg)}",
+            user,
+        ),
     )
     try:
         # Create basic format dictionary
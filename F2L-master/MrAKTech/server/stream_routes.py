@@ -8,6 +8,7 @@ import math
 import logging
 import mimetypes
 import secrets
+import asyncio
 from aiohttp import web
 from aiohttp.http_exceptions import BadStatusLine
 
@@ -15,10 +16,17 @@ from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from MrAKTech import StreamBot, multi_clients, work_loads
 from MrAKTech.server.exceptions import FIleNotFound, InvalidHash
-from MrAKTech.tools.custom_dl import ByteStreamer, chunk_size, offset_fix
-from MrAKTech.tools.render_template import render_page
+from MrAKTech.tools.custom_dl import (
+    ByteStreamer,
+    StripedFetcher,
+    STRIPE_CLIENTS,
+    chunk_size,
+    offset_fix,
+)
+from MrAKTech.tools.render_template import render_page, render_template
+from MrAKTech.tools.shortener import shortener
 from MrAKTech.tools.utils_bot import temp, readable_time
-from MrAKTech.tools.file_properties import get_file_ids, get_namex
+from MrAKTech.tools.file_properties import get_cached_file_info, get_namex
 from MrAKTech.tools.human_readable import humanbytes
 from MrAKTech.tools.txt import tamilxd
 from MrAKTech.config import Telegram, Server, Domain
@@ -719,7 +727,7 @@ async def api_handler(request):
         india_time = datetime.datetime.now(
             datetime.timezone(datetime.timedelta(hours=5, minutes=30))
         )
-        file_data = await get_file_ids(
+        file_data = await get_cached_file_info(
             StreamBot, int(Telegram.FLOG_CHANNEL), int(data.get("file_id"))
         )
         await StreamBot.send_message(
@@ -763,7 +771,7 @@ async def api_handler(request):
 async def api_handlerx(request):
     try:
         id = await request.json()
-        file_data = await get_file_ids(
+        file_data = await get_cached_file_info(
             StreamBot, int(Telegram.FLOG_CHANNEL), int(id.get("id"))
         )
         return web.json_response(
@@ -793,6 +801,7 @@ async def status_route_handler(_):
         # Import performance monitoring here to avoid circular imports
         from MrAKTech.tools.performance_monitor import performance_monitor
         from MrAKTech.tools.advanced_cache import file_metadata_cache, stream_session_cache, general_cache
+        from MrAKTech.tools.chunk_cache import chunk_cache
         
         # Get bot workloads
         bot_workloads = sorted(work_loads.items(), key=lambda x: x[1], reverse=True)
@@ -808,7 +817,8 @@ async def status_route_handler(_):
         cache_stats = {
             'file_metadata': file_metadata_cache.get_stats(),
             'stream_sessions': stream_session_cache.get_stats(),
-            'general': general_cache.get_stats()
+            'general': general_cache.get_stats(),
+            'chunks': chunk_cache.get_stats()
         }
         
         # Calculate overall cache performance
@@ -845,6 +855,12 @@ async def status_route_handler(_):
                     "size": cache_stats['stream_sessions']['size'],
                     "hit_ratio": f"{cache_stats['stream_sessions']['hit_ratio']:.1f}%",
                     "hits": cache_stats['stream_sessions']['hit_count']
+                },
+                "chunks": {
+                    "size": cache_stats['chunks']['size'],
+                    "disk_usage": humanbytes(cache_stats['chunks']['bytes']),
+                    "hit_ratio": f"{cache_stats['chunks']['hit_ratio']:.1f}%",
+                    "hits": cache_stats['chunks']['hit_count']
                 }
             },
             
@@ -970,49 +986,24 @@ async def web_page_handler(request: web.Request):
     try:
         page_code = request.match_info["page_code"]
         
-        # Try to find user by page code first
-        user_data = await u_db.get_user_by_page_code(page_code)
-        channel_data = None
+        # Resolve the page code to its owner and settings in one (cached) lookup
+        page_config = await u_db.get_page_config(page_code)
+        if not page_config:
+            raise web.HTTPNotFound(text="Page not found")
         
-        if not user_data:
-            # Try to find channel by page code
-            channel_data = await u_db.get_channel_by_page_code(page_code)
-            if not channel_data:
-                raise web.HTTPNotFound(text="Page not found")
+        page_mode = page_config["page_mode"]
+        verify_mode = page_config["verify_mode"]
         
-        # Get shortlink settings
-        if user_data:
-            user_id = user_data["id"]
-            page_mode = await u_db.get_page_mode(user_id)
-            verify_mode = await u_db.get_verify_mode(user_id)
-            
-            if not page_mode:
-                raise web.HTTPNotFound(text="Page mode disabled")
-            
-            # Get shortlink configurations
-            if verify_mode:
-                shortlinks = await u_db.get_verify_shortlinks(user_id)
-                page_settings = await u_db.get_verify_settings(user_id)
-            else:
-                shortlinks = await u_db.get_page_shortlinks(user_id)
-                page_settings = await u_db.get_page_settings(user_id)
+        if not page_mode:
+            raise web.HTTPNotFound(text="Page mode disabled")
+        
+        # Get shortlink configurations
+        if verify_mode:
+            shortlinks = page_config["verify_shortlinks"]
+            page_settings = page_config["verify_settings"]
         else:
-            # Channel data
-            chat_id = channel_data["chat_id"]
-            settings = channel_data.get("settings", {})
-            page_mode = settings.get("page_mode", False)
-            verify_mode = settings.get("verify_mode", False)
-            
-            if not page_mode:
-                raise web.HTTPNotFound(text="Page mode disabled")
-            
-            # Get shortlink configurations for channel
-            if verify_mode:
-                shortlinks = await u_db.get_chl_verify_shortlinks(chat_id)
-                page_settings = await u_db.get_chl_verify_settings(chat_id)
-            else:
-                shortlinks = await u_db.get_chl_page_shortlinks(chat_id)
-                page_settings = await u_db.get_chl_page_settings(chat_id)
+            shortlinks = page_config["page_shortlinks"]
+            page_settings = page_config["page_settings"]
         
         # Extract file information from query parameters
         file_name = request.query.get("file_name", "Unknown File")
@@ -1028,13 +1019,15 @@ async def web_page_handler(request: web.Request):
         total_verifications = 3
         verify_url = None
         
-        if verify_mode and user_data:
-            user_id = user_data["id"]
+        if verify_mode and page_config["kind"] == "user":
+            user_id = page_config["id"]
             verification_status = await u_db.get_verification_status(user_id)
             verify_count = verification_status.get("verify_count_today", 0)
             
             # Determine if verification is required
-            shortlink_to_use, shortlink_config = await u_db.get_verify_shortlink_to_use(user_id)
+            shortlink_to_use, shortlink_config = await u_db.get_verify_shortlink_to_use(
+                user_id, verification_status
+            )
             
             if shortlink_to_use != "direct":
                 verify_required = True
@@ -1042,9 +1035,7 @@ async def web_page_handler(request: web.Request):
                 verification_progress = (verify_count / total_verifications) * 100
                 
                 # Generate verify URL using shortlink API
-                from shortzy import Shortzy
                 try:
-                    shortener = Shortzy(api_key=shortlink_config["api"], base_site=shortlink_config["url"])
                     original_url = f"{Domain.FQDN}/web/{page_code}?file_name={file_name}&file_size={file_size}"
                     if quality:
                         original_url += f"&quality={quality}"
@@ -1053,7 +1044,9 @@ async def web_page_handler(request: web.Request):
                     if episode:
                         original_url += f"&episode={episode}"
                     
-                    verify_url = await shortener.convert(original_url)
+                    verify_url = await shortener.convert(
+                        original_url, shortlink_config["url"], shortlink_config["api"]
+                    )
                 except Exception as e:
                     logger.error(f"Error creating verify shortlink: {e}")
                     verify_url = "#"
@@ -1067,40 +1060,13 @@ async def web_page_handler(request: web.Request):
             download_link = request.query.get("download_link", "#") 
             storage_link = request.query.get("storage_link", "#")
             
-            for shortlink_key, shortlink_config in shortlinks.items():
-                if shortlink_config["url"] and shortlink_config["api"]:
-                    try:
-                        from shortzy import Shortzy
-                        shortener = Shortzy(api_key=shortlink_config["api"], base_site=shortlink_config["url"])
-                        
-                        # Create shortened URLs for each action
-                        watch_short = await shortener.convert(stream_link) if stream_link != "#" else "#"
-                        download_short = await shortener.convert(download_link) if download_link != "#" else "#"
-                        telegram_short = await shortener.convert(storage_link) if storage_link != "#" else "#"
-                        
-                        # Get tutorial settings
-                        tutorial_enabled = False
-                        tutorial_url = None
-                        tutorial_text = "📺 Tutorial"
-                        
-                        if page_settings.get("shortlink_tutorials", {}).get(shortlink_key, {}).get("enabled", False):
-                            tutorial_enabled = True
-                            tutorial_url = page_settings["shortlink_tutorials"][shortlink_key].get("video_url")
-                            tutorial_text = page_settings["shortlink_tutorials"][shortlink_key].get("button_text", "📺 Tutorial")
-                        
-                        shortlink_data[shortlink_key] = {
-                            "url": shortlink_config["url"],
-                            "domain_name": shortlink_config["url"].replace("https://", "").replace("http://", "").split("/")[0],
-                            "watch_link": watch_short,
-                            "download_link": download_short,  
-                            "telegram_link": telegram_short,
-                            "tutorial_enabled": tutorial_enabled,
-                            "tutorial_url": tutorial_url,
-                            "tutorial_text": tutorial_text
-                        }
-                    except Exception as e:
-                        logger.error(f"Error creating shortlinks for {shortlink_key}: {e}")
-                        continue
+            links = (stream_link, download_link, storage_link)
+            entries = await asyncio.gather(*(
+                build_shortlink_entry(shortlink_key, shortlink_config, page_settings, links)
+                for shortlink_key, shortlink_config in shortlinks.items()
+                if shortlink_config["url"] and shortlink_config["api"]
+            ))
+            shortlink_data = {key: entry for key, entry in entries if entry}
         
         # Render the shortlink page
         template_data = {
@@ -1118,9 +1084,8 @@ async def web_page_handler(request: web.Request):
             "verify_url": verify_url
         }
         
-        return await render_page(
-            template_name="shortlink.html",
-            **template_data
+        return web.Response(
+            text=render_template("shortlink.html", **template_data), content_type="text/html"
         )
         
     except Exception as e:
@@ -1128,9 +1093,54 @@ async def web_page_handler(request: web.Request):
         raise web.HTTPInternalServerError(text="Internal server error")
 
 
+async def build_shortlink_entry(shortlink_key, shortlink_config, page_settings, links):
+    """Shorten a page's watch, download and telegram links with one shortlink"""
+    try:
+        watch_short, download_short, telegram_short = await asyncio.gather(*(
+            shortener.convert(link, shortlink_config["url"], shortlink_config["api"])
+            if link != "#" else asyncio.sleep(0, "#")
+            for link in links
+        ))
+    except Exception as e:
+        logger.error(f"Error creating shortlinks for {shortlink_key}: {e}")
+        return shortlink_key, None
+
+    # Get tutorial settings
+    tutorial_enabled = False
+    tutorial_url = None
+    tutorial_text = "📺 Tutorial"
+
+    if page_settings.get("shortlink_tutorials", {}).get(shortlink_key, {}).get("enabled", False):
+        tutorial_enabled = True
+        tutorial_url = page_settings["shortlink_tutorials"][shortlink_key].get("video_url")
+        tutorial_text = page_settings["shortlink_tutorials"][shortlink_key].get("button_text", "📺 Tutorial")
+
+    return shortlink_key, {
+        "url": shortlink_config["url"],
+        "domain_name": shortlink_config["url"].replace("https://", "").replace("http://", "").split("/")[0],
+        "watch_link": watch_short,
+        "download_link": download_short,
+        "telegram_link": telegram_short,
+        "tutorial_enabled": tutorial_enabled,
+        "tutorial_url": tutorial_url,
+        "tutorial_text": tutorial_text
+    }
+
+
 class_cache = {}
 
 
+def get_byte_streamer(index: int) -> ByteStreamer:
+    """Returns the cached ByteStreamer object of a client, creating it on first use"""
+    client = multi_clients[index]
+    if client in class_cache:
+        logger.debug(f"Using cached ByteStreamer object for client {index}")
+    else:
+        logger.debug(f"Creating new ByteStreamer object for client {index}")
+        class_cache[client] = ByteStreamer(client)
+    return class_cache[client]
+
+
 async def media_streamer(request: web.Request, message_id: int, secure_hash: str):
     """
     Optimized media streamer with enhanced performance and caching
@@ -1139,16 +1149,7 @@ async def media_streamer(request: web.Request, message_id: int, secure_hash: str
     
     # Get the least loaded client for optimal performance
     index = min(work_loads, key=work_loads.get)
-    faster_client = multi_clients[index]
-
-    # Enhanced caching system
-    if faster_client in class_cache:
-        tg_connect = class_cache[faster_client]
-        logger.debug(f"Using cached ByteStreamer object for client {index}")
-    else:
-        logger.debug(f"Creating new ByteStreamer object for client {index}")
-        tg_connect = ByteStreamer(faster_client)
-        class_cache[faster_client] = tg_connect
+    tg_connect = get_byte_streamer(index)
     
     logger.debug("before calling get_file_properties")
     file_id = await tg_connect.get_file_properties(message_id)
@@ -1178,9 +1179,18 @@ async def media_streamer(request: web.Request, message_id: int, secure_hash: str
     last_part_cut = (until_bytes % new_chunk_size) + 1
     part_count = math.ceil(req_length / new_chunk_size)
     
+    # Striped mode: fetch the parts with the least loaded clients at the same time
+    fetch_part = None
+    if STRIPE_CLIENTS > 1 and len(multi_clients) > 1 and part_count > 1:
+        stripe = sorted(work_loads, key=work_loads.get)[:STRIPE_CLIENTS]
+        fetch_part = StripedFetcher(
+            [(i, get_byte_streamer(i)) for i in stripe], message_id
+        )
+
     # Create the streaming body
     body = tg_connect.yield_file(
-        file_id, index, offset, first_part_cut, last_part_cut, part_count, new_chunk_size
+        file_id, index, offset, first_part_cut, last_part_cut, part_count, new_chunk_size,
+        fetch_part=fetch_part,
     )
 
     # Enhanced MIME type detection and file handling
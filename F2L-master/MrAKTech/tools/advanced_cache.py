@@ -2,8 +2,12 @@
 
 import asyncio
 import time
+import math
+import heapq
 import hashlib
-from typing import Dict, Any, Optional, Tuple
+import sys
+from collections import OrderedDict
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from MrAKTech.config import Telegram
 
 # Try to import performance packages with fallbacks
@@ -20,105 +24,188 @@ try:
 except ImportError:
     LZ4_AVAILABLE = False
 
-class AdvancedCache:
+class CacheShard:
     """
-    Advanced caching system for improved streaming performance
+    One shard of an AdvancedCache with its own LRU order, expiry heap and stats
     """
     
-    def __init__(self, max_size: int = 1000, ttl: int = 3600):
+    def __init__(self, max_size: int, max_bytes: int = 0):
         self.max_size = max_size
-        self.ttl = ttl  # Time to live in seconds
-        self.cache: Dict[str, Tuple[Any, float]] = {}  # key: (value, timestamp)
-        self.access_times: Dict[str, float] = {}  # LRU tracking
+        self.max_bytes = max_bytes  # 0 means no byte limit
+        # key: (value, expiry time, size), ordered from least to most recently used
+        self.entries: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        # (expiry time, key), may hold stale items for keys that were overwritten or removed
+        self.expiry_heap: List[Tuple[float, str]] = []
+        self.bytes = 0
         self.hit_count = 0
         self.miss_count = 0
+        self.eviction_count = 0
+        self.expired_count = 0
+    
+    def _remove(self, key: str):
+        _, _, size = self.entries.pop(key)
+        self.bytes -= size
+    
+    def purge_expired(self, now: float) -> int:
+        """Drop the entries whose expiry time has passed, cheapest first"""
+        purged = 0
+        heap = self.expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] == expires_at:
+                self._remove(key)
+                purged += 1
+        self.expired_count += purged
+        return purged
+    
+    def _compact_heap(self):
+        # Overwritten entries leave stale heap items behind, rebuild once they dominate
+        if len(self.expiry_heap) > 2 * len(self.entries) + 64:
+            self.expiry_heap = [(expires_at, key) for key, (_, expires_at, _) in self.entries.items()]
+            heapq.heapify(self.expiry_heap)
+    
+    def get(self, key: str, now: float) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.miss_count += 1
+            return None
+        if now > entry[1]:
+            # Remove expired item, its heap item goes stale
+            self._remove(key)
+            self.expired_count += 1
+            self.miss_count += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hit_count += 1
+        return entry[0]
+    
+    def set(self, key: str, value: Any, expires_at: float, size: int, now: float):
+        if key in self.entries:
+            self._remove(key)
+        self.purge_expired(now)
+        self.entries[key] = (value, expires_at, size)
+        self.bytes += size
+        heapq.heappush(self.expiry_heap, (expires_at, key))
+        # Evict least recently used items
+        while len(self.entries) > self.max_size or (
+            self.max_bytes and self.bytes > self.max_bytes and len(self.entries) > 1
+        ):
+            self._remove(next(iter(self.entries)))
+            self.eviction_count += 1
+        self._compact_heap()
+    
+    def delete(self, key: str):
+        if key in self.entries:
+            self._remove(key)
+    
+    def clear(self):
+        self.entries.clear()
+        self.expiry_heap.clear()
+        self.bytes = 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'size': len(self.entries),
+            'bytes': self.bytes,
+            'hit_count': self.hit_count,
+            'miss_count': self.miss_count,
+            'evictions': self.eviction_count,
+            'expired': self.expired_count,
+        }
+
+class AdvancedCache:
+    """
+    Advanced caching system for improved streaming performance
+    Keys are spread over shards, each an O(1) LRU with a heap of expiry times,
+    so expired entries are dropped lazily instead of scanning the whole cache.
+    With max_bytes set, entries are also evicted once their total size
+    (measured with sizeof) goes over the limit.
+    """
+    
+    def __init__(
+        self,
+        max_size: int = 1000,
+        ttl: int = 3600,
+        max_bytes: int = 0,
+        shards: int = 1,
+        sizeof: Callable[[Any], int] = sys.getsizeof,
+    ):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # Default time to live in seconds
+        self.sizeof = sizeof
+        shards = max(1, shards)
+        self.shards = [
+            CacheShard(math.ceil(max_size / shards), math.ceil(max_bytes / shards))
+            for _ in range(shards)
+        ]
+    
+    @property
+    def hit_count(self) -> int:
+        return sum(shard.hit_count for shard in self.shards)
+    
+    @property
+    def miss_count(self) -> int:
+        return sum(shard.miss_count for shard in self.shards)
+    
+    def _shard(self, key: str) -> CacheShard:
+        return self.shards[hash(key) % len(self.shards)]
         
     def _generate_key(self, *args, **kwargs) -> str:
         """Generate cache key from arguments"""
         key_string = str(args) + str(sorted(kwargs.items()))
         return hashlib.md5(key_string.encode()).hexdigest()
     
-    def _is_expired(self, timestamp: float) -> bool:
-        """Check if cache entry is expired"""
-        return time.time() - timestamp > self.ttl
-    
-    def _evict_lru(self):
-        """Evict least recently used items"""
-        if len(self.cache) >= self.max_size:
-            # Find LRU item
-            lru_key = min(self.access_times.keys(), key=lambda k: self.access_times[k])
-            self.cache.pop(lru_key, None)
-            self.access_times.pop(lru_key, None)
-    
     def get(self, key: str) -> Optional[Any]:
         """Get item from cache"""
-        if key in self.cache:
-            value, timestamp = self.cache[key]
-            
-            if self._is_expired(timestamp):
-                # Remove expired item
-                self.cache.pop(key, None)
-                self.access_times.pop(key, None)
-                self.miss_count += 1
-                return None
-            
-            # Update access time
-            self.access_times[key] = time.time()
-            self.hit_count += 1
-            return value
-        
-        self.miss_count += 1
-        return None
+        return self._shard(key).get(key, time.time())
     
-    def set(self, key: str, value: Any):
-        """Set item in cache"""
-        # Evict if necessary
-        self._evict_lru()
-        
-        # Add new item
-        self.cache[key] = (value, time.time())
-        self.access_times[key] = time.time()
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        """Set item in cache, optionally with its own time to live"""
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        size = self.sizeof(value) if self.max_bytes else 0
+        self._shard(key).set(key, value, expires_at, size, now)
     
     def delete(self, key: str):
         """Delete item from cache"""
-        self.cache.pop(key, None)
-        self.access_times.pop(key, None)
+        self._shard(key).delete(key)
     
     def clear(self):
         """Clear all cache"""
-        self.cache.clear()
-        self.access_times.clear()
+        for shard in self.shards:
+            shard.clear()
     
     def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
-        total_requests = self.hit_count + self.miss_count
-        hit_ratio = (self.hit_count / total_requests * 100) if total_requests > 0 else 0
+        shard_stats = [shard.get_stats() for shard in self.shards]
+        hit_count = sum(stats['hit_count'] for stats in shard_stats)
+        miss_count = sum(stats['miss_count'] for stats in shard_stats)
+        total_requests = hit_count + miss_count
+        hit_ratio = (hit_count / total_requests * 100) if total_requests > 0 else 0
         
         return {
-            'size': len(self.cache),
+            'size': sum(stats['size'] for stats in shard_stats),
             'max_size': self.max_size,
-            'hit_count': self.hit_count,
-            'miss_count': self.miss_count,
+            'bytes': sum(stats['bytes'] for stats in shard_stats),
+            'max_bytes': self.max_bytes,
+            'hit_count': hit_count,
+            'miss_count': miss_count,
             'hit_ratio': hit_ratio,
-            'ttl': self.ttl
+            'ttl': self.ttl,
+            'shards': shard_stats
         }
     
     async def cleanup_expired(self):
         """Periodic cleanup of expired entries"""
         while True:
             try:
-                current_time = time.time()
-                expired_keys = [
-                    key for key, (_, timestamp) in self.cache.items()
-                    if current_time - timestamp > self.ttl
-                ]
-                
-                for key in expired_keys:
-                    self.cache.pop(key, None)
-                    self.access_times.pop(key, None)
+                now = time.time()
+                expired = sum(shard.purge_expired(now) for shard in self.shards)
                 
-                if expired_keys:
-                    print(f"Cleaned up {len(expired_keys)} expired cache entries")
+                if expired:
+                    print(f"Cleaned up {expired} expired cache entries")
                 
                 await asyncio.sleep(300)  # Cleanup every 5 minutes
                 
@@ -129,10 +216,13 @@ class AdvancedCache:
 class FileMetadataCache(AdvancedCache):
     """
     Specialized cache for file metadata
+    FileIds are bound to the bot that resolved them, so they are cached per
+    client. File information (name, size, mime type, unique id) is the same
+    for every client and is shared.
     """
     
     def __init__(self):
-        super().__init__(max_size=2000, ttl=7200)  # 2 hours TTL for file metadata
+        super().__init__(max_size=20000, ttl=7200, shards=8)  # 2 hours TTL for file metadata
     
     def cache_file_info(self, message_id: int, file_id: Any):
         """Cache file information"""
@@ -143,6 +233,17 @@ class FileMetadataCache(AdvancedCache):
         """Get cached file information"""
         key = f"file_info_{message_id}"
         return self.get(key)
+    
+    def cache_file_id(self, client_name: str, message_id: int, file_id: Any):
+        """Cache the FileId a client resolved for a message"""
+        key = f"file_id_{client_name}_{message_id}"
+        self.set(key, file_id)
+        self.cache_file_info(message_id, file_id)
+    
+    def get_file_id(self, client_name: str, message_id: int) -> Optional[Any]:
+        """Get the cached FileId a client resolved for a message"""
+        key = f"file_id_{client_name}_{message_id}"
+        return self.get(key)
 
 class StreamSessionCache(AdvancedCache):
     """
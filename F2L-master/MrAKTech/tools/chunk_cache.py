@@ -0,0 +1,163 @@
+# Copyright 2021 To 2024-present, Author: MrAKTech
+
+import os
+import asyncio
+import logging
+from os import environ
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger("chunk_cache")
+
+# Directory and size limit of the on-disk part cache (0 MB disables it)
+CHUNK_CACHE_DIR = str(environ.get("CHUNK_CACHE_DIR", "chunk_cache"))
+CHUNK_CACHE_SIZE = int(environ.get("CHUNK_CACHE_SIZE_MB", "1024")) * 1024 * 1024
+
+
+class ChunkCache:
+    """
+    Size bounded on-disk cache of file parts fetched from telegram.
+    attributes:
+        directory: where the part files are stored, one file per part.
+        max_bytes: total size of the part files before LRU eviction kicks in.
+        entries: (media_id, offset, chunk_size) -> part size, in LRU order.
+
+    Parts are read back with one plain read, hot parts still come out of the
+    page cache. The index is rebuilt from the directory on startup.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[Tuple[int, int, int], int]" = OrderedDict()
+        self.total_bytes = 0
+        self.hit_count = 0
+        self.miss_count = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: Tuple[int, int, int]) -> str:
+        return os.path.join(self.directory, "{}_{}_{}.part".format(*key))
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        parts = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                self._remove(entry.path)
+                continue
+            if not entry.name.endswith(".part"):
+                continue
+            try:
+                key = tuple(int(x) for x in entry.name[:-5].split("_"))
+                stat = entry.stat()
+            except (ValueError, OSError):
+                continue
+            if len(key) == 3:
+                parts.append((stat.st_atime, key, stat.st_size))
+        for _, key, size in sorted(parts):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    async def load(self):
+        """Rebuild the index from the part files already on disk"""
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self._load)
+        await self._evict()
+        logger.info(f"Chunk cache loaded {len(self.entries)} parts ({self.total_bytes} bytes)")
+
+    async def get(self, media_id: int, offset: int, chunk_size: int) -> Optional[bytes]:
+        """Get a part from the cache, None if it isn't cached"""
+        key = (media_id, offset, chunk_size)
+        if key not in self.entries:
+            self.miss_count += 1
+            return None
+        self.entries.move_to_end(key)
+        try:
+            data = await asyncio.to_thread(self._read, self._path(key))
+        except (OSError, ValueError):
+            self._drop(key)
+            self.miss_count += 1
+            return None
+        self.hit_count += 1
+        return data
+
+    async def put(self, media_id: int, offset: int, chunk_size: int, data: bytes):
+        """Store a part in the cache and evict the least recently used parts"""
+        if not data or len(data) > self.max_bytes:
+            return
+        key = (media_id, offset, chunk_size)
+        try:
+            await asyncio.to_thread(self._write, self._path(key), data)
+        except OSError as e:
+            logger.error(f"Failed to cache part {key}: {e}")
+            return
+        self.total_bytes += len(data) - self.entries.get(key, 0)
+        self.entries[key] = len(data)
+        self.entries.move_to_end(key)
+        await self._evict()
+
+    def _drop(self, key: Tuple[int, int, int]) -> str:
+        self.total_bytes -= self.entries.pop(key, 0)
+        return self._path(key)
+
+    async def _evict(self):
+        paths = []
+        while self.total_bytes > self.max_bytes and self.entries:
+            paths.append(self._drop(next(iter(self.entries))))
+        for path in paths:
+            await asyncio.to_thread(self._remove, path)
+
+    def wrap(
+        self, media_id: int, fetch_part: Callable[[int, int], Awaitable[bytes]]
+    ) -> Callable[[int, int], Awaitable[bytes]]:
+        """Returns a fetch_part that serves cached parts and caches fetched ones"""
+
+        async def cached_fetch_part(offset: int, chunk_size: int) -> bytes:
+            data = await self.get(media_id, offset, chunk_size)
+            if data is None:
+                data = await fetch_part(offset, chunk_size)
+                await self.put(media_id, offset, chunk_size, data)
+            return data
+
+        return cached_fetch_part
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        total_requests = self.hit_count + self.miss_count
+        hit_ratio = (self.hit_count / total_requests * 100) if total_requests > 0 else 0
+
+        return {
+            'size': len(self.entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hit_count': self.hit_count,
+            'miss_count': self.miss_count,
+            'hit_ratio': hit_ratio,
+        }
+
+
+# Global chunk cache instance shared by every ByteStreamer
+chunk_cache = ChunkCache(CHUNK_CACHE_DIR, CHUNK_CACHE_SIZE)
@@ -1,15 +1,25 @@
 #Copyright 2021 To 2024-present, Author: MrAKTech
 
 import math
+import time
 import asyncio
 import logging
+from os import environ
+from collections import deque
 from MrAKTech.config import Telegram
-from typing import Dict, Union
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union
 from MrAKTech import work_loads
 from pyrogram import Client, utils, raw
+from .chunk_cache import chunk_cache
+from .advanced_cache import file_metadata_cache
 from .file_properties import get_file_ids
 from pyrogram.session import Session, Auth
-from pyrogram.errors import AuthBytesInvalid
+from pyrogram.errors import (
+    AuthBytesInvalid,
+    FloodWait,
+    InternalServerError,
+    ServiceUnavailable,
+)
 from pyrogram.file_id import FileId, FileType, ThumbnailSource
 
 logger = logging.getLogger("streamer")
@@ -18,6 +28,24 @@ logger = logging.getLogger("streamer")
 MAX_CHUNK_SIZE = 1024 * 1024  # 1MB - Telegram API maximum limit
 MIN_CHUNK_SIZE = 4 * 1024     # 4KB - Minimum reasonable chunk size
 
+# Number of GetFile requests kept in flight per stream
+PREFETCH_PARTS = max(1, int(environ.get("PREFETCH_PARTS", "4")))
+# Number of clients a single stream is striped across (0 or 1 disables striping)
+STRIPE_CLIENTS = int(environ.get("STRIPE_CLIENTS", "0"))
+
+# Seconds a client sits out of a stripe after a DC error, FloodWait says its own
+STRIPE_COOLDOWN = 30
+
+# Errors after which a client sits out of a stripe and its part is retried elsewhere
+STRIPE_FALLBACK_ERRORS = (
+    FloodWait,
+    InternalServerError,
+    ServiceUnavailable,
+    AuthBytesInvalid,
+    TimeoutError,
+    ConnectionError,
+)
+
 async def chunk_size(length):
     """
     Optimized chunk size calculation for better streaming performance
@@ -50,13 +78,47 @@ def validate_chunk_size(chunk_size: int) -> int:
         return MIN_CHUNK_SIZE
     return chunk_size
 
+
+# Part fetches currently in flight, shared by every stream asking for the same part
+inflight_parts: Dict[Tuple[int, int, int], asyncio.Task] = {}
+
+
+def single_flight(
+    media_id: int, fetch_part: Callable[[int, int], Awaitable[bytes]]
+) -> Callable[[int, int], Awaitable[bytes]]:
+    """
+    Wraps fetch_part so that concurrent requests for the same
+    (media_id, offset, chunk_size) wait on a single fetch.
+    The fetch runs in its own task, so a client disconnecting doesn't
+    cancel it for the other streams waiting on the same part.
+    """
+
+    async def shared_fetch_part(offset: int, chunk_size: int) -> bytes:
+        key = (media_id, offset, chunk_size)
+        task = inflight_parts.get(key)
+        if task is None:
+            task = asyncio.create_task(fetch_part(offset, chunk_size))
+            inflight_parts[key] = task
+
+            def done(t: asyncio.Task):
+                inflight_parts.pop(key, None)
+                if not t.cancelled():
+                    t.exception()
+
+            task.add_done_callback(done)
+        else:
+            logger.debug(f"Joined in-flight fetch of part {key}")
+        return await asyncio.shield(task)
+
+    return shared_fetch_part
+
+
 class ByteStreamer:
     def __init__(self, client: Client):
-        """A custom class that holds the cache of a specific client and class functions.
+        """A custom class that streams files with a specific client and class functions.
         attributes:
-            client: the client that the cache is for.
-            cached_file_ids: a dict of cached file IDs.
-            cached_file_properties: a dict of cached file properties.
+            client: the client that the files are streamed with.
+        File IDs are cached per client in the process-wide file_metadata_cache.
         
         functions:
             generate_file_properties: returns the properties for a media of a specific message contained in Tuple.
@@ -66,10 +128,7 @@ class ByteStreamer:
         This is a modified version of the <https://github.com/eyaadh/megadlbot_oss/blob/master/mega/telegram/utils/custom_download.py>
         Thanks to Eyaadh <https://github.com/eyaadh>
         """
-        self.clean_timer = 20 * 60  # Reduced to 20 minutes for better memory management
         self.client: Client = client
-        self.cached_file_ids: Dict[int, FileId] = {}
-        asyncio.create_task(self.clean_cache())
 
     async def get_file_properties(self, message_id: int) -> FileId:
         """
@@ -77,10 +136,11 @@ class ByteStreamer:
         if the properties are cached, then it'll return the cached results.
         or it'll generate the properties from the Message ID and cache them.
         """
-        if message_id not in self.cached_file_ids:
-            await self.generate_file_properties(message_id)
+        file_id = file_metadata_cache.get_file_id(self.client.name, message_id)
+        if file_id is None:
+            file_id = await self.generate_file_properties(message_id)
             logger.debug(f"Cached file properties for message with ID {message_id}")
-        return self.cached_file_ids[message_id]
+        return file_id
     
     async def generate_file_properties(self, message_id: int) -> FileId:
         """
@@ -93,9 +153,9 @@ class ByteStreamer:
             logger.debug(f"Message with ID {message_id} not found")
             from MrAKTech.server.exceptions import FIleNotFound
             raise FIleNotFound
-        self.cached_file_ids[message_id] = file_id
+        file_metadata_cache.cache_file_id(self.client.name, message_id, file_id)
         logger.debug(f"Cached media message with ID {message_id}")
-        return self.cached_file_ids[message_id]
+        return file_id
 
     async def generate_media_session(self, client: Client, file_id: FileId) -> Session:
         """
@@ -199,6 +259,37 @@ class ByteStreamer:
             )
         return location
 
+    async def get_part(
+        self,
+        media_session: Session,
+        location,
+        offset: int,
+        chunk_size: int,
+    ) -> bytes:
+        """
+        Fetches a single part of the media file from telegram servers.
+        Returns empty bytes if telegram didn't return a file part.
+        """
+        r = await media_session.invoke(
+            raw.functions.upload.GetFile(
+                location=location, offset=offset, limit=chunk_size
+            ),
+        )
+        if isinstance(r, raw.types.upload.File):
+            return r.bytes
+        return b""
+
+    async def get_message_part(self, message_id: int, offset: int, chunk_size: int) -> bytes:
+        """
+        Fetches a single part of the media of a message with this client.
+        File IDs are bound to the bot that resolved them, so the message is
+        resolved (and cached) with this client before the part is requested.
+        """
+        file_id = await self.get_file_properties(message_id)
+        media_session = await self.generate_media_session(self.client, file_id)
+        location = await self.get_location(file_id)
+        return await self.get_part(media_session, location, offset, chunk_size)
+
     async def yield_file(
         self,
         file_id: FileId,
@@ -208,9 +299,17 @@ class ByteStreamer:
         last_part_cut: int,
         part_count: int,
         chunk_size: int,
+        fetch_part: Optional[Callable[[int, int], Awaitable[bytes]]] = None,
     ):
         """
         Custom generator that yields the bytes of the media file.
+        Up to PREFETCH_PARTS parts are requested ahead of the one being yielded,
+        so the next parts are already on their way while the response writer
+        drains the current one. Parts are always yielded in offset order.
+        Parts already in the on-disk chunk_cache are served from disk, and
+        concurrent streams asking for the same part share one fetch.
+        fetch_part(offset, limit) overrides how a single part is fetched,
+        e.g. with a StripedFetcher that spreads the parts over several clients.
         Modded from <https://github.com/eyaadh/megadlbot_oss/blob/master/mega/telegram/utils/custom_download.py#L20>
         Thanks to Eyaadh <https://github.com/eyaadh>
         """
@@ -221,52 +320,59 @@ class ByteStreamer:
         # Validate chunk size to ensure it's within Telegram API limits
         chunk_size = validate_chunk_size(chunk_size)
         
-        media_session = await self.generate_media_session(client, file_id)
+        if fetch_part is None:
+            media_session = await self.generate_media_session(client, file_id)
+            location = await self.get_location(file_id)
+
+            async def fetch_part(part_offset: int, limit: int) -> bytes:
+                return await self.get_part(media_session, location, part_offset, limit)
+
+        if chunk_cache.enabled:
+            fetch_part = chunk_cache.wrap(file_id.media_id, fetch_part)
+        fetch_part = single_flight(file_id.media_id, fetch_part)
 
         current_part = 1
+        part_offset = offset
+        next_offset = offset
+        pending: Deque[asyncio.Task] = deque()
 
-        location = await self.get_location(file_id)
+        def schedule_parts():
+            # Keep the read-ahead window full without going past the last part
+            nonlocal next_offset
+            while (
+                len(pending) < PREFETCH_PARTS
+                and current_part + len(pending) <= part_count
+            ):
+                pending.append(
+                    asyncio.create_task(fetch_part(next_offset, chunk_size))
+                )
+                next_offset += chunk_size
 
         try:
-            r = await media_session.invoke(
-                raw.functions.upload.GetFile(
-                    location=location, offset=offset, limit=chunk_size
-                ),
-            )
-            if isinstance(r, raw.types.upload.File):
-                while current_part <= part_count:
-                    chunk = r.bytes
-                    if not chunk:
-                        break
-                    offset += chunk_size
-                    if part_count == 1:
-                        yield chunk[first_part_cut:last_part_cut]
-                        break
-                    if current_part == 1:
-                        yield chunk[first_part_cut:]
-                    if 1 < current_part <= part_count:
-                        yield chunk
-
-                    r = await media_session.invoke(
-                        raw.functions.upload.GetFile(
-                            location=location, offset=offset, limit=chunk_size
-                        ),
-                    )
+            while current_part <= part_count:
+                schedule_parts()
+                chunk = await pending.popleft()
+                if not chunk:
+                    break
+                part_offset += chunk_size
+                if part_count == 1:
+                    yield chunk[first_part_cut:last_part_cut]
+                    break
+                if current_part == 1:
+                    yield chunk[first_part_cut:]
+                if 1 < current_part <= part_count:
+                    yield chunk
 
-                    current_part += 1
+                current_part += 1
         except Exception as e:
             if "LIMIT_INVALID" in str(e):
                 # Telegram API chunk size too large, reduce and retry
                 logger.warning(f"Chunk size {chunk_size} too large, reducing to 512KB")
                 reduced_chunk_size = min(chunk_size, 512 * 1024)  # Max 512KB
                 try:
-                    r = await media_session.invoke(
-                        raw.functions.upload.GetFile(
-                            location=location, offset=offset, limit=reduced_chunk_size
-                        ),
-                    )
-                    if isinstance(r, raw.types.upload.File):
-                        yield r.bytes[first_part_cut:last_part_cut] if part_count == 1 else r.bytes[first_part_cut:]
+                    chunk = await fetch_part(part_offset, reduced_chunk_size)
+                    if chunk:
+                        yield chunk[first_part_cut:last_part_cut] if part_count == 1 else chunk[first_part_cut:]
                 except Exception as retry_error:
                     logger.error(f"Failed to download even with reduced chunk size: {retry_error}")
                     pass
@@ -276,15 +382,60 @@ class ByteStreamer:
         except (TimeoutError, AttributeError):
             pass
         finally:
+            # Drop read-ahead parts the client will never receive
+            for task in pending:
+                if task.done() and not task.cancelled():
+                    task.exception()
+                else:
+                    task.cancel()
             logger.debug(f"Finished yielding file with {current_part} parts.")
             work_loads[index] -= 1
 
-    
-    async def clean_cache(self) -> None:
-        """
-        function to clean the cache to reduce memory usage
-        """
+
+
+
+class StripedFetcher:
+    """
+    Fetches the parts of one file round-robin across several clients.
+    attributes:
+        streamers: list of (work_loads index, ByteStreamer) in the stripe.
+        message_id: the message in FLOG_CHANNEL that holds the media.
+        busy_until: work_loads index -> monotonic time a client may be used again.
+
+    A client that hits FloodWait sits out for the wait Telegram asked for, one
+    that hits a DC error for STRIPE_COOLDOWN seconds, and the part is retried
+    with the other clients. A part only fails once every client failed it.
+    """
+
+    def __init__(self, streamers: List[Tuple[int, ByteStreamer]], message_id: int):
+        self.streamers = list(streamers)
+        self.message_id = message_id
+        self.turn = 0
+        self.busy_until: Dict[int, float] = {}
+
+    async def __call__(self, offset: int, chunk_size: int) -> bytes:
+        failed = set()
         while True:
-            await asyncio.sleep(self.clean_timer)
-            self.cached_file_ids.clear()
-            logger.debug("Cleaned the cache")
\ No newline at end of file
+            candidates = [s for s in self.streamers if s[0] not in failed]
+            if not candidates:
+                raise error
+            now = time.monotonic()
+            ready = [s for s in candidates if self.busy_until.get(s[0], 0) <= now]
+            if not ready:
+                await asyncio.sleep(min(self.busy_until[index] for index, _ in candidates) - now)
+                continue
+            index, streamer = ready[self.turn % len(ready)]
+            self.turn += 1
+            work_loads[index] += 1
+            try:
+                return await streamer.get_message_part(self.message_id, offset, chunk_size)
+            except STRIPE_FALLBACK_ERRORS as e:
+                error = e
+                failed.add(index)
+                wait = e.value if isinstance(e, FloodWait) else STRIPE_COOLDOWN
+                self.busy_until[index] = max(self.busy_until.get(index, 0), time.monotonic() + wait)
+                logger.warning(
+                    f"Client {index} sits out the stripe of message {self.message_id} for {wait}s: {e!r}"
+                )
+            finally:
+                work_loads[index] -= 1
@@ -359,50 +359,30 @@ async def generate_web_link_async(user_id=None, chat_id=None, filename="", forma
         
         page_code = None
         page_mode = False
-        verify_mode = False
         shortlinks_configured = False
         
+        # One cached settings snapshot instead of a query per setting
+        settings = None
         if user_id:
-            # Check if user has page mode enabled
-            page_mode = await u_db.get_page_mode(user_id)
-            verify_mode = await u_db.get_verify_mode(user_id)
-            
-            if page_mode:
-                page_code = await u_db.get_page_code(user_id)
-                
-                # Check if user has any shortlinks configured
-                if verify_mode:
-                    shortlinks = await u_db.get_verify_shortlinks(user_id)
-                else:
-                    shortlinks = await u_db.get_page_shortlinks(user_id)
-                
-                # Check if any shortlinks are configured
-                shortlinks_configured = any(
-                    shortlinks.get(f"shortlink{i}", {}).get("url") and 
-                    shortlinks.get(f"shortlink{i}", {}).get("api")
-                    for i in range(1, 4)
-                )
-                
+            settings = await u_db.get_page_snapshot(user_id)
         elif chat_id:
-            # Check if channel has page mode enabled
-            page_mode = await u_db.get_chl_page_mode(chat_id)
-            verify_mode = await u_db.get_chl_verify_mode(chat_id)
+            settings = await u_db.get_chl_page_snapshot(chat_id)
+        
+        if settings and settings["page_mode"]:
+            page_mode = True
+            page_code = settings["page_code"]
+            
+            # Check if any shortlinks are configured for the active mode
+            if settings["verify_mode"]:
+                shortlinks = settings["verify_shortlinks"]
+            else:
+                shortlinks = settings["page_shortlinks"]
             
-            if page_mode:
-                page_code = await u_db.get_chl_page_code(chat_id)
-                
-                # Check if channel has any shortlinks configured
-                if verify_mode:
-                    shortlinks = await u_db.get_chl_verify_shortlinks(chat_id)
-                else:
-                    shortlinks = await u_db.get_chl_page_shortlinks(chat_id)
-                
-                # Check if any shortlinks are configured
-                shortlinks_configured = any(
-                    shortlinks.get(f"shortlink{i}", {}).get("url") and 
-                    shortlinks.get(f"shortlink{i}", {}).get("api")
-                    for i in range(1, 4)
-                )
+            shortlinks_configured = any(
+                shortlinks.get(f"shortlink{i}", {}).get("url") and 
+                shortlinks.get(f"shortlink{i}", {}).get("api")
+                for i in range(1, 4)
+            )
         
         # If page mode is disabled or no page code, return empty string
         if not page_mode or not page_code:
@@ -7,6 +7,7 @@ from typing import Union
 from pyrogram.types import Message
 from pyrogram.file_id import FileId
 from pyrogram.raw.types.messages import Messages
+from MrAKTech.tools.advanced_cache import file_metadata_cache
 # Define exception locally to avoid circular import
 class FIleNotFound(Exception):
     message = "File not found"
@@ -38,6 +39,26 @@ async def get_file_ids(client: Client, chat_id: int, id: int) -> Optional[FileId
     return file_id
 
 
+async def get_cached_file_ids(client: Client, chat_id: int, id: int) -> FileId:
+    """get_file_ids through the shared file_metadata_cache, per client"""
+    file_id = file_metadata_cache.get_file_id(client.name, id)
+    if file_id is None:
+        file_id = await get_file_ids(client, chat_id, id)
+        file_metadata_cache.cache_file_id(client.name, id, file_id)
+    return file_id
+
+
+async def get_cached_file_info(client: Client, chat_id: int, id: int) -> FileId:
+    """
+    Returns the file properties (name, size, mime type, unique id) of a message.
+    Any client's cached FileId will do, the client is only used on a cache miss.
+    """
+    file_info = file_metadata_cache.get_file_info(id)
+    if file_info is None:
+        file_info = await get_cached_file_ids(client, chat_id, id)
+    return file_info
+
+
 def get_media_from_message(message: "Message") -> Any:
     media_types = (
         "audio",
@@ -3,52 +3,94 @@
 import jinja2
 import urllib.parse
 import logging
-import aiohttp
 import random
+from os import environ
 
 from MrAKTech.config import Telegram, Domain
 from MrAKTech import StreamBot
 from MrAKTech.tools.human_readable import humanbytes
-from MrAKTech.tools.file_properties import get_file_ids
+from MrAKTech.tools.file_properties import get_cached_file_info
+from MrAKTech.tools.advanced_cache import AdvancedCache
 from MrAKTech.server.exceptions import InvalidHash
 
+TEMPLATE_DIR = "MrAKTech/server/template"
+
+# How long a rendered watch page is reused for the same file (0 disables it)
+PAGE_CACHE_TIME = int(environ.get("PAGE_CACHE_TIME", "60"))
+
+# Templates are compiled once and kept in memory, the bytecode cache lets
+# restarts skip recompiling them as well
+template_env = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
+    bytecode_cache=jinja2.FileSystemBytecodeCache(),
+    auto_reload=False,
+)
+
+# (message_id, hash) -> rendered watch page with URL_SLOTS in place of the links
+page_cache = AdvancedCache(max_size=5000, ttl=PAGE_CACHE_TIME)
+
+# Stand-ins for the links that pick a random domain, filled in on every request
+# so cached pages still spread the load across all of them
+URL_SLOTS = {"file_url": "@@MRAK_FILE_URL@@", "mra_url": "@@MRAK_MRA_URL@@"}
+
+
+def load_templates():
+    """Compile every template up front so the first requests don't have to"""
+    templates = template_env.list_templates(extensions=["html"])
+    for name in templates:
+        template_env.get_template(name)
+    logging.info(f"Loaded {len(templates)} templates")
+
+
+def render_template(template_name, **context):
+    return template_env.get_template(template_name).render(**context)
+
+
+def fill_urls(page, id, secure_hash):
+    path = f"dl/{id}/files.mkv?hash={secure_hash}"
+    src = urllib.parse.urljoin(random.choice(Domain.CLOUDFLARE_URLS), path)
+    mra = urllib.parse.urljoin(random.choice(Domain.MRAKFAST_URLS), path)
+    return page.replace(URL_SLOTS["file_url"], src).replace(URL_SLOTS["mra_url"], mra)
+
 
 async def render_page(id, secure_hash, src=None):
-    file_data = await get_file_ids(StreamBot, int(Telegram.FLOG_CHANNEL), int(id))
+    cache_key = f"{id}_{secure_hash}"
+    if PAGE_CACHE_TIME > 0:
+        page = page_cache.get(cache_key)
+        if page is not None:
+            return fill_urls(page, id, secure_hash)
+
+    file_data = await get_cached_file_info(StreamBot, int(Telegram.FLOG_CHANNEL), int(id))
     if file_data.unique_id[:6] != secure_hash:
         logging.debug(f"link hash: {secure_hash} - {file_data.unique_id[:6]}")
         logging.debug(f"Invalid hash for message with - ID {id}")
         raise InvalidHash
 
     file_name = file_data.file_name.replace("_", " ")
-    src = urllib.parse.urljoin(random.choice(Domain.CLOUDFLARE_URLS), f"dl/{id}/files.mkv?hash={secure_hash}")
-    mra = urllib.parse.urljoin(random.choice(Domain.MRAKFAST_URLS), f"dl/{id}/files.mkv?hash={secure_hash}")
 
     tag = file_data.mime_type.split("/")[0].strip()
     file_size = humanbytes(file_data.file_size)
     if tag in ["video", "audio"]:
-        template_file = "MrAKTech/server/template/play.html"
+        template_name = "play.html"
     else:
-        template_file = "MrAKTech/server/template/dl.html"
-        async with aiohttp.ClientSession() as s:
-            async with s.get(src) as u:
-                file_size = humanbytes(int(u.headers.get("Content-Length")))
-
-    with open(template_file) as f:
-        template = jinja2.Template(f.read())
+        template_name = "dl.html"
 
     file_store_link = (
         f"https://telegram.me/{Telegram.FILE_STORE_BOT_USERNAME}?start=download_{id}"
     )
     ads_link = f"https://mraklinkzz.infinityfreeapp.com/post.php?link={secure_hash}{id}"
-    return template.render(
+    page = render_template(
+        template_name,
         file_name=file_name,
-        file_url=src,
-        mra_url=mra,
+        file_url=URL_SLOTS["file_url"],
+        mra_url=URL_SLOTS["mra_url"],
         file_size=file_size,
         mime_type=file_data.mime_type,
         file_unique_id=file_data.unique_id,
         file_id=id,
-        ads_link=src,
+        ads_link=URL_SLOTS["file_url"],
         file_store_link=file_store_link,
     )
+    if PAGE_CACHE_TIME > 0:
+        page_cache.set(cache_key, page)
+    return fill_urls(page, id, secure_hash)
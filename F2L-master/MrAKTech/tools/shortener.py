@@ -0,0 +1,98 @@
+# Copyright 2021 To 2024-present, Author: MrAKTech
+
+import asyncio
+from os import environ
+from typing import Dict, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+from shortzy import Shortzy
+
+from MrAKTech.tools.advanced_cache import AdvancedCache
+
+# How long a shortened link is reused for the same shortener account and long url
+SHORTLINK_CACHE_TIME = int(environ.get("SHORTLINK_CACHE_TIME", "21600"))
+
+# Shortzy sites that don't speak the adlinkfly API
+NON_ADLINKFLY_SITES = ("shareus.in", "shareus.io")
+
+
+class ShortenerService:
+    """
+    Shortens links with adlinkfly style shorteners.
+    attributes:
+        sessions: one aiohttp session per shortener host, reused across calls.
+        cache: (shortener, api key, long url) -> short url.
+        pending: conversions in flight, shared by concurrent callers.
+    """
+
+    def __init__(self):
+        self.sessions: Dict[str, aiohttp.ClientSession] = {}
+        self.cache = AdvancedCache(max_size=50000, ttl=SHORTLINK_CACHE_TIME, shards=8)
+        self.pending: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _site(base_site: str) -> Tuple[str, str]:
+        """(scheme, host) of a shortener site, https when none is given"""
+        base_site = base_site.strip()
+        if "://" not in base_site:
+            base_site = f"https://{base_site}"
+        site = urlparse(base_site)
+        return site.scheme, site.netloc
+
+    def _session(self, host: str) -> aiohttp.ClientSession:
+        session = self.sessions.get(host)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=10),
+                timeout=aiohttp.ClientTimeout(total=20),
+            )
+            self.sessions[host] = session
+        return session
+
+    async def _request(self, link: str, scheme: str, host: str, api_key: str) -> str:
+        if host in NON_ADLINKFLY_SITES:
+            return await Shortzy(api_key, host).convert(link)
+        if urlparse(link).netloc == host:
+            return link
+        params = {"api": api_key, "url": link, "alias": "", "format": "json"}
+        async with self._session(host).get(
+            f"{scheme}://{host}/api", params=params, raise_for_status=True
+        ) as response:
+            data = await response.json(content_type=None)
+        if data.get("status") == "success":
+            return data["shortenedUrl"]
+        raise Exception(data.get("message", f"Shortener {host} failed"))
+
+    async def convert(self, link: str, base_site: str, api_key: str) -> str:
+        """Shorten a link, raises if the shortener fails like Shortzy.convert"""
+        if not api_key:
+            raise Exception("API key not provided")
+        scheme, host = self._site(base_site)
+        key = f"{scheme}://{host}|{api_key}|{link}"
+        short = self.cache.get(key)
+        if short is not None:
+            return short
+        task = self.pending.get(key)
+        if task is None:
+            task = asyncio.create_task(self._request(link, scheme, host, api_key))
+            self.pending[key] = task
+
+            def done(t: asyncio.Task):
+                self.pending.pop(key, None)
+                if not t.cancelled():
+                    t.exception()
+
+            task.add_done_callback(done)
+        short = await asyncio.shield(task)
+        self.cache.set(key, short)
+        return short
+
+    async def close(self):
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
+
+
+# Global shortener service instance
+shortener = ShortenerService()
@@ -3,8 +3,9 @@
 import logging
 import asyncio
 import random
+import time
+from os import environ
 
-from shortzy import Shortzy
 from pyrogram import enums, errors
 from pyrogram.errors import UserNotParticipant, FloodWait, UserIsBlocked
 from pyrogram.enums.parse_mode import ParseMode
@@ -13,10 +14,17 @@ from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from MrAKTech.config import Telegram, Domain
 from MrAKTech.database.u_db import u_db
 from MrAKTech.tools.txt import tamilxd
+from MrAKTech.tools.shortener import shortener
 
 LOGGER = logging.getLogger(__name__)
 SIZE_UNITS = ["B", "KB", "MB", "GB", "TB", "PB"]
 
+# Broadcast sends in flight, most sends per second (lowered on FloodWait),
+# and users read and checkpointed at a time
+BROADCAST_WORKERS = int(environ.get("BROADCAST_WORKERS", "20"))
+BROADCAST_RATE = int(environ.get("BROADCAST_RATE", "20"))
+BROADCAST_BATCH_SIZE = 500
+
 
 class temp(object):
     START_TIME = 0
@@ -24,7 +32,9 @@ class temp(object):
     BOT_ID = None
     U_NAME = None
     B_NAME = None
-    BROADCAST_CANCEL = False
+    # Broadcast kinds ("users" / "storage") running and asked to stop
+    BROADCASTING = set()
+    BROADCAST_CANCEL = set()
 
 
 async def get_domain_link(user):
@@ -50,9 +60,7 @@ async def get_shortlink(channel_id, link):
     settings = await u_db.get_chl_settings(channel_id)
     url = settings["url"]
     api = settings["api"]
-    shortzy = Shortzy(api_key=api, base_site=url)
-    link = await shortzy.convert(link)
-    return link
+    return await shortener.convert(link, url, api)
 
 
 # -------------[ SHORT LINK FUNCTION ]------------#
@@ -76,8 +84,7 @@ async def short_link(link, user=None):
     base_site = user["shortener_url"]
 
     if bool(api_key and base_site):
-        shortzy = Shortzy(api_key, base_site)
-        link = await shortzy.convert(link)
+        link = await shortener.convert(link, base_site, api_key)
 
     return link
 
@@ -88,9 +95,7 @@ async def short_link_with_custom_shortener(link, shortener_url, api_key):
         return link
     
     try:
-        shortzy = Shortzy(api_key, shortener_url)
-        shortened_link = await shortzy.convert(link)
-        return shortened_link
+        return await shortener.convert(link, shortener_url, api_key)
     except Exception as e:
         LOGGER.error(f"Error shortening link: {e}")
         return link
@@ -186,27 +191,178 @@ async def verify_user(bot, message):
 # ---------------------[ BROADCAST ]---------------------#
 
 
-async def broadcast_messages(user_id, message, pin):
+class BroadcastLimiter:
+    """Token bucket shared by all broadcast sends of one bot. It halves its rate on every
+    FloodWait and creeps back up to `rate` per second as sends go through"""
+
+    def __init__(self, rate):
+        self.max_rate = self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            self.refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.refill()
+            self.tokens -= 1
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 1000)
+
+    def flood_wait(self, seconds):
+        # Workers hitting the same FloodWait share one wait and one halving,
+        # tokens only go negative while the limiter is paused
+        self.refill()
+        if self.tokens >= 0:
+            self.rate = max(1, self.rate / 2)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+# The main and storage bots have their own Telegram limits, so one limiter each
+broadcast_limiters = {kind: BroadcastLimiter(BROADCAST_RATE) for kind in ("users", "storage")}
+
+
+async def broadcast_send(limiter, send):
+    """Run `send()` under `limiter`, retrying it after FloodWait"""
+    while True:
+        await limiter.acquire()
+        try:
+            return await send()
+        except FloodWait as e:
+            limiter.flood_wait(e.value)
+            await asyncio.sleep(e.value)
+
+
+async def broadcast_messages(user_id, message, pin, limiter):
     try:
-        m = await message.copy(chat_id=user_id)
+        # Copy and pin retry separately, a FloodWait on the pin must not copy again
+        m = await broadcast_send(limiter, lambda: message.copy(chat_id=user_id))
         if pin:
-            await m.pin(both_sides=True)
+            await broadcast_send(limiter, lambda: m.pin(both_sides=True))
         return "Success"
-    except FloodWait as e:
-        await asyncio.sleep(e.value)
-        return await broadcast_messages(user_id, message, pin)
     except UserIsBlocked:
         return "Blocked"
     except Exception as e:
-        await u_db.delete_user(user_id)
         LOGGER.error(e)
-        await add_inactive_user(user_id)
         return "Failed"
 
 
-async def add_inactive_user(user_id):
-    if not await u_db.iis_user_exist(user_id):
-        await u_db.iadd_user(user_id)
+class Broadcast:
+    """
+    Sends a message to every user of the main ("users") or storage ("storage")
+    bot with BROADCAST_WORKERS sends at a time under that bot's limiter. Failed
+    users are removed after every batch and progress is checkpointed, so
+    resume_broadcast carries on after a restart.
+    """
+
+    def __init__(self, kind, message, pin, status, after=None, counters=None, elapsed=0):
+        self.kind = kind
+        self.message = message
+        self.pin = pin
+        self.status = status
+        self.after = after
+        self.counters = dict.fromkeys(("done", "success", "blocked", "failed"), 0)
+        self.counters.update(counters or {})
+        self.start_time = time.time() - elapsed
+        self.semaphore = asyncio.Semaphore(BROADCAST_WORKERS)
+        self.limiter = broadcast_limiters[kind]
+
+    @property
+    def cancelled(self):
+        return self.kind in temp.BROADCAST_CANCEL
+
+    def progress(self, total):
+        c = self.counters
+        return f"Total Users: <code>{total}</code>\nCompleted: <code>{c['done']} / {total}</code>\nSuccess: <code>{c['success']}</code>\nBlocked: <code>{c['blocked']}</code>\nFailed: <code>{c['failed']}</code>"
+
+    async def checkpoint(self):
+        await u_db.save_broadcast(self.kind, {
+            "from_chat": self.message.chat.id,
+            "message_id": self.message.id,
+            "pin": self.pin,
+            "after": self.after,
+            "counters": self.counters,
+            "elapsed": time.time() - self.start_time,
+            "status_chat": self.status.chat.id,
+        })
+
+    async def send(self, user_id):
+        async with self.semaphore:
+            if self.cancelled:
+                return None
+            return await broadcast_messages(user_id, self.message, self.pin, self.limiter)
+
+    async def send_batch(self, batch):
+        ids = [int(user["id"]) for user in batch]
+        results = await asyncio.gather(*[self.send(user_id) for user_id in ids])
+        failed = []
+        for user_id, sts in zip(ids, results):
+            if sts is None:
+                continue
+            self.counters["done"] += 1
+            if sts == "Success":
+                self.counters["success"] += 1
+            elif sts == "Blocked":
+                self.counters["blocked"] += 1
+            else:
+                self.counters["failed"] += 1
+                failed.append(user_id)
+        if failed:
+            await u_db.delete_broadcast_users(self.kind, failed)
+            await u_db.add_inactive_users(failed)
+
+    async def run(self):
+        temp.BROADCASTING.add(self.kind)
+        temp.BROADCAST_CANCEL.discard(self.kind)
+        btn = [[
+            InlineKeyboardButton('CANCEL', callback_data='broadcast_cancel')
+        ]]
+        try:
+            total = await u_db.count_broadcast_remaining(self.kind, self.after) + self.counters["done"]
+            await self.checkpoint()
+            while not self.cancelled:
+                batch = await u_db.get_broadcast_batch(self.kind, self.after, BROADCAST_BATCH_SIZE)
+                if not batch:
+                    break
+                await self.send_batch(batch)
+                if self.cancelled:
+                    break
+                self.after = batch[-1]["_id"]
+                await self.checkpoint()
+                try:
+                    await self.status.edit(f"Broadcast Processing...\n\n{self.progress(total)}", reply_markup=InlineKeyboardMarkup(btn))
+                except Exception:
+                    pass
+        except Exception as e:
+            LOGGER.exception("Broadcast failed")
+            await self.status.reply(f"Broadcast stopped due to Error - {e}")
+            return
+        finally:
+            temp.BROADCASTING.discard(self.kind)
+        await u_db.delete_broadcast(self.kind)
+        time_taken = get_time(time.time() - self.start_time)
+        await self.status.edit(f"Broadcast Completed.\nTime Taken: <code>{time_taken}</code>\n\n{self.progress(total)}")
+
+
+async def resume_broadcast(bot, kind):
+    """Restart the broadcast of `kind` if it was running when the bot stopped"""
+    job = await u_db.get_broadcast(kind)
+    if not job:
+        return
+    try:
+        message = await bot.get_messages(job["from_chat"], job["message_id"])
+        status = await bot.send_message(job["status_chat"], f"Resuming broadcast after <code>{job['counters']['done']}</code> users...")
+    except Exception:
+        LOGGER.exception(f"Can't resume {kind} broadcast")
+        return
+    asyncio.create_task(Broadcast(kind, message, job["pin"], status, job["after"], job["counters"], job["elapsed"]).run())
+
 
 # ---------------------[ GET TIME ]---------------------#
 
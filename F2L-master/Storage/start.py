@@ -1,7 +1,6 @@
 # Copyright 2021 To 2024-present, Author: MrAKTech
 
 import asyncio
-import time
 
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -10,12 +9,9 @@ from pyrogram.errors import ChatAdminRequired
 
 from MrAKTech.config import Telegram, Domain
 from MrAKTech.database.u_db import u_db
-from MrAKTech.tools.utils_bot import is_subscribed, is_user_joined, temp, get_time, broadcast_messages
+from MrAKTech.tools.utils_bot import is_subscribed, is_user_joined, temp, Broadcast
 from MrAKTech.tools.txt import tamilxd, BUTTON
 
-# Lock for broadcast operations
-lock = asyncio.Lock()
-
 
 def get_all_media_file_data(m):
     media = m.video or m.document or m.audio
@@ -149,47 +145,24 @@ async def close_cb(_, query):
 @Client.on_callback_query(filters.regex(r'^broadcast_cancel'))
 async def broadcast_cancel(bot, query):
     await query.message.edit("Trying to cancel broadcasting...")
-    temp.BROADCAST_CANCEL = True
+    temp.BROADCAST_CANCEL.add("storage")
 
 @Client.on_message(filters.command(["broadcast", "bcast", "pin_broadcast", "pin_bcast"]) & filters.private & filters.user(list(Telegram.OWNER_ID)) & filters.reply)
 async def broadcast_to_users(bot, message):
-    if lock.locked():
+    if "storage" in temp.BROADCASTING:
         return await message.reply('Currently broadcast processing, Wait for complete.')
-    
+    temp.BROADCASTING.add("storage")
+
     if message.command[0] in ['pin_broadcast', 'pin_bcast']:
         pin = True
     else:
         pin = False
-    
-    msg = await message.reply_text('Broadcasting your message...')
-    broadcast_msg = message.reply_to_message
-    total_users = await u_db.stotal_users_count()
-    done = 0
-    blocked = 0
-    failed = 0
-    success = 0
-    start_time = time.time()
-    temp.BROADCAST_CANCEL = False
-
-    async with lock:
-        async for user in await u_db.sget_all_users():
-            if temp.BROADCAST_CANCEL:
-                break
-            sts = await broadcast_messages(user['id'], broadcast_msg, pin)
-            if sts == "Success":
-                success += 1
-            elif sts == "Blocked":
-                blocked += 1
-            elif sts == "Failed":
-                failed += 1
-            done += 1
-            if done % 20 == 0:
-                btn = [[
-                    InlineKeyboardButton('CANCEL', callback_data='broadcast_cancel')
-                ]]
-                await msg.edit(f"Broadcast Processing...\n\nTotal Users: <code>{total_users}</code>\nCompleted: <code>{done} / {total_users}</code>\nSuccess: <code>{success}</code>\nBlocked: <code>{blocked}</code>\nFailed: <code>{failed}</code>", reply_markup=InlineKeyboardMarkup(btn))
-        time_taken = get_time(time.time() - start_time)
-        await msg.edit(f"Broadcast Completed.\nTime Taken: <code>{time_taken}</code>\n\nTotal Users: <code>{total_users}</code>\nCompleted: <code>{done} / {total_users}</code>\nSuccess: <code>{success}</code>\nBlocked: <code>{blocked}</code>\nFailed: <code>{failed}</code>")
+
+    try:
+        msg = await message.reply_text('Broadcasting your message...')
+        await Broadcast("storage", message.reply_to_message, pin, msg).run()
+    finally:
+        temp.BROADCASTING.discard("storage")
 
 @Client.on_message(filters.command("stats") & filters.private & filters.user(list(Telegram.OWNER_ID)))
 async def get_stats(bot, message):
@@ -16,6 +16,8 @@ from database.ia_filterdb import Media
 from info import *
 from utils import temp
 from typing import Union, Optional, AsyncGenerator
+from collections import deque
+import asyncio
 from pyrogram import types
 from aiohttp import web
 
@@ -40,11 +42,15 @@ class JisshuxBot(Client):
         chat_id: Union[int, str],
         limit: int,
         offset: int = 0,
+        prefetch: int = 4,
     ) -> Optional[AsyncGenerator["types.Message", None]]:
         """Iterate through a chat sequentially.
         This convenience method does the same as repeatedly calling :meth:`~pyrogram.Client.get_messages` in a loop, thus saving
         you from the hassle of setting up boilerplate code. It is useful for getting the whole chat messages with a
         single call.
+        Up to ``prefetch`` batches of 200 messages are requested at once, messages are still yielded in order.
+        Every batch is fetched by this client, media file ids are bound to the bot that resolved them and
+        the indexed ones are sent by this bot later.
         Parameters:
             chat_id (``int`` | ``str``):
                 Unique identifier (int) or username (str) of the target chat.
@@ -57,6 +63,10 @@ class JisshuxBot(Client):
             offset (``int``, *optional*):
                 Identifier of the first message to be returned.
                 Defaults to 0.
+
+            prefetch (``int``, *optional*):
+                Number of batches requested ahead of the one being yielded.
+                Defaults to 4.
         Returns:
             ``Generator``: A generator yielding :obj:`~pyrogram.types.Message` objects.
         Example:
@@ -64,15 +74,23 @@ class JisshuxBot(Client):
                 for message in app.iter_messages("pyrogram", 1, 15000):
                     print(message.text)
         """
+        pending = deque()
         current = offset
-        while True:
-            new_diff = min(200, limit - current)
-            if new_diff <= 0:
-                return
-            messages = await self.get_messages(chat_id, list(range(current, current+new_diff+1)))
-            for message in messages:
-                yield message
-                current += 1
+        try:
+            while True:
+                while len(pending) < max(prefetch, 1):
+                    new_diff = min(200, limit - current)
+                    if new_diff <= 0:
+                        break
+                    pending.append(asyncio.ensure_future(self.get_messages(chat_id, list(range(current, current+new_diff+1)))))
+                    current += new_diff + 1
+                if not pending:
+                    return
+                for message in await pending.popleft():
+                    yield message
+        finally:
+            for task in pending:
+                task.cancel()
       
 JisshuBot = JisshuxBot()
 
@@ -21,10 +21,10 @@ logging.getLogger("aiohttp.web").setLevel(logging.ERROR)
 
 from pyrogram import Client, __version__
 from pyrogram.raw.all import layer
-from database.ia_filterdb import Media
+from database.ia_filterdb import Media, build_search_index
 from database.users_chats_db import db
 from info import *
-from utils import temp
+from utils import temp, scheduler
 from typing import Union, Optional, AsyncGenerator
 from pyrogram import types
 from Script import script 
@@ -32,6 +32,8 @@ from datetime import date, datetime
 import pytz
 from aiohttp import web
 from plugins import web_server, check_expired_premium
+from plugins.index import resume_index_jobs
+from plugins.broadcast import resume_broadcasts
 import pyrogram.utils
 import asyncio
 from pyrogram import idle
@@ -69,6 +71,8 @@ async def Jisshu_start():
     temp.BANNED_USERS = b_users
     temp.BANNED_CHATS = b_chats
     await Media.ensure_indexes()
+    await db.ensure_imdb_cache_index()
+    JisshuBot.loop.create_task(build_search_index())
     me = await JisshuBot.get_me()
     temp.ME = me.id
     temp.U_NAME = me.username
@@ -76,6 +80,9 @@ async def Jisshu_start():
     temp.B_LINK = me.mention
     JisshuBot.username = '@' + me.username
     JisshuBot.loop.create_task(check_expired_premium(JisshuBot))
+    JisshuBot.loop.create_task(scheduler.run(JisshuBot))
+    await resume_index_jobs(JisshuBot)
+    await resume_broadcasts(JisshuBot)
     logging.info(f"{me.first_name} with for Pyrogram v{__version__} (Layer {layer}) started on {me.username}.")
     logging.info(script.LOGO)
     tz = pytz.timezone('Asia/Kolkata')
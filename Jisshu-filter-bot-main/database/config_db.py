@@ -1,6 +1,20 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from pymongo import UpdateOne
 from motor.motor_asyncio import AsyncIOMotorClient
 from info import DATABASE_URI
-from datetime import datetime
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Seconds between flushes of buffered search counts and between top list refreshes
+SEARCH_FLUSH_INTERVAL = 5
+TOP_REFRESH_INTERVAL = 60
+TOP_LIST_SIZE = 100
+# Days of searches the top list counts, older daily counts expire with a TTL index
+TOP_SEARCH_DAYS = 30
 
 class Database:
     def __init__(self, uri, db_name):
@@ -8,34 +22,111 @@ class Database:
         self.db = self.client[db_name]
         self.col = self.db.user
         self.config_col = self.db.configuration
+        self.search_col = self.db.search_terms
+        # (term, day) -> searches not written yet
+        self.search_counts = Counter()
+        self.top_terms = None
+        self.top_refreshed = 0
+        self.flusher = None
 
     async def update_top_messages(self, user_id, message_text):
-        user = await self.col.find_one({"user_id": user_id, "messages.text": message_text})
-        
-        if not user:
-            await self.col.update_one(
-                {"user_id": user_id},
-                {"$push": {"messages": {"text": message_text, "count": 1}}},
-                upsert=True
-            )
-        else:
-            await self.col.update_one(
-                {"user_id": user_id, "messages.text": message_text},
-                {"$inc": {"messages.$.count": 1}}
-            )
+        """Count a search in memory, the counts are written in bulk by flush_search_counts"""
+        term = ' '.join(str(message_text).split())[:200]
+        if not term:
+            return
+        self.search_counts[(term, datetime.utcnow().strftime('%Y-%m-%d'))] += 1
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self.flush_search_counts())
 
-    async def get_top_messages(self, limit=30):
+    async def flush_search_counts(self):
+        try:
+            await self.search_col.create_index([('term', 1), ('day', 1)], unique=True)
+            await self.migrate_top_messages()
+            await self.date_search_terms()
+            await self.search_col.create_index('date', expireAfterSeconds=TOP_SEARCH_DAYS * 86400)
+        except Exception:
+            logger.exception('Failed to prepare search_terms')
+        while True:
+            await asyncio.sleep(SEARCH_FLUSH_INTERVAL)
+            counts, self.search_counts = self.search_counts, Counter()
+            if counts:
+                try:
+                    await self.search_col.bulk_write([
+                        UpdateOne(
+                            {'term': term, 'day': day},
+                            {'$inc': {'count': count}, '$setOnInsert': {'date': datetime.strptime(day, '%Y-%m-%d')}},
+                            upsert=True
+                        )
+                        for (term, day), count in counts.items()
+                    ], ordered=False)
+                except Exception:
+                    logger.exception('Failed to save search counts')
+                    self.search_counts.update(counts)
+                    continue
+            if time.monotonic() - self.top_refreshed >= TOP_REFRESH_INTERVAL:
+                try:
+                    await self.refresh_top_terms()
+                except Exception:
+                    logger.exception('Failed to refresh the top searches')
+
+    async def migrate_top_messages(self):
+        """Move the per user search arrays of older versions into search_terms"""
         pipeline = [
             {"$unwind": "$messages"},
             {"$group": {"_id": "$messages.text", "count": {"$sum": "$messages.count"}}},
+        ]
+        results = await self.col.aggregate(pipeline).to_list(None)
+        if not results:
+            return
+        await self.search_col.bulk_write([
+            UpdateOne(
+                {'term': result['_id'], 'day': 'legacy'},
+                {'$inc': {'count': result['count']}, '$setOnInsert': {'date': datetime.utcnow()}},
+                upsert=True
+            )
+            for result in results
+        ], ordered=False)
+        await self.col.delete_many({})
+        logger.info(f'Moved {len(results)} search terms to search_terms')
+
+    async def date_search_terms(self):
+        """Give counts saved before they had a date one, so the TTL index can expire them.
+        Legacy counts are dated now and stay in the top list for TOP_SEARCH_DAYS"""
+        await self.search_col.update_many(
+            {'date': {'$exists': False}, 'day': 'legacy'}, {'$set': {'date': datetime.utcnow()}}
+        )
+        await self.search_col.update_many(
+            {'date': {'$exists': False}},
+            [{'$set': {'date': {'$dateFromString': {'dateString': '$day', 'format': '%Y-%m-%d'}}}}]
+        )
+
+    async def aggregate_top_terms(self, limit):
+        pipeline = [
+            {"$match": {"date": {"$gte": datetime.utcnow() - timedelta(days=TOP_SEARCH_DAYS)}}},
+            {"$group": {"_id": "$term", "count": {"$sum": "$count"}}},
             {"$sort": {"count": -1}},
             {"$limit": limit}
         ]
-        results = await self.col.aggregate(pipeline).to_list(limit)
+        results = await self.search_col.aggregate(pipeline, allowDiskUse=True).to_list(limit)
         return [result['_id'] for result in results]
+
+    async def refresh_top_terms(self):
+        self.top_terms = await self.aggregate_top_terms(TOP_LIST_SIZE)
+        self.top_refreshed = time.monotonic()
+
+    async def get_top_messages(self, limit=30):
+        """Most searched terms, served from the top list kept by flush_search_counts"""
+        if limit > TOP_LIST_SIZE:
+            return await self.aggregate_top_terms(limit)
+        if self.top_terms is None:
+            await self.refresh_top_terms()
+        return self.top_terms[:limit]
     
     async def delete_all_messages(self):
+        self.search_counts.clear()
+        await self.search_col.delete_many({})
         await self.col.delete_many({})
+        self.top_terms = []
 
     def create_configuration_data(
             self,
@@ -1,13 +1,22 @@
 import logging
 from struct import pack
 import re
+import time
+from collections import OrderedDict
 import base64
+import os
+from datetime import datetime, timedelta
+from bson import ObjectId
 from pyrogram.file_id import FileId
-from pymongo.errors import DuplicateKeyError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from umongo import Instance, Document, fields
 from motor.motor_asyncio import AsyncIOMotorClient
 from marshmallow.exceptions import ValidationError
-from info import FILES_DATABASE, DATABASE_NAME, COLLECTION_NAME, MAX_BTN
+from database.spell_index import spell_index
+from info import FILES_DATABASE, DATABASE_NAME, COLLECTION_NAME, MAX_BTN, SEARCH_CANDIDATES, SEARCH_CACHE_TIME, SEARCH_CACHE_IDS, LANGUAGES, QUALITIES
+
+logger = logging.getLogger(__name__)
 
 client = AsyncIOMotorClient(FILES_DATABASE)
 mydb = client[DATABASE_NAME]
@@ -22,72 +31,328 @@ class Media(Document):
     mime_type = fields.StrField(allow_none=True)
     caption = fields.StrField(allow_none=True)
     file_type = fields.StrField(allow_none=True)
+    tokens = fields.ListField(fields.StrField(), allow_none=True)
+    languages = fields.ListField(fields.StrField(), allow_none=True)
+    qualities = fields.ListField(fields.StrField(), allow_none=True)
+    season = fields.IntField(allow_none=True)
+    year = fields.IntField(allow_none=True)
+    # Grows with every saved file, newest files sort first on it
+    created = fields.ObjectIdField(allow_none=True)
 
     class Meta:
-        indexes = ('$file_name', )
+        indexes = ('$file_name', 'tokens', 'languages', 'qualities', 'season', 'year', 'created')
         collection_name = COLLECTION_NAME
 
+class SearchCache:
+    """Ordered result ids of recent searches, so pagination only slices them,
+    and the created key seen at each offset past them, so later pages carry
+    on from there instead of skipping. Entries expire after `ttl` seconds and
+    the least recently used ones are dropped once more than `max_ids` ids are
+    held in total."""
+
+    def __init__(self, ttl, max_ids):
+        self.ttl = ttl
+        self.max_ids = max_ids
+        self.entries = OrderedDict()
+        self.total_ids = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if not entry:
+            return None
+        if entry[0] < time.monotonic():
+            self.drop(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry[1], entry[2], entry[3]
+
+    def set(self, key, ids, total, marks):
+        if self.ttl <= 0 or len(ids) > self.max_ids:
+            return
+        self.drop(key)
+        self.entries[key] = (time.monotonic() + self.ttl, ids, total, marks)
+        self.total_ids += len(ids)
+        while self.total_ids > self.max_ids:
+            self.drop(next(iter(self.entries)))
+
+    def drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.total_ids -= len(entry[1])
+
+    def invalidate(self, files_fields):
+        """Drop every cached search that any of the files with these search fields
+        would show up in, one pass over the cache for the whole batch"""
+        if not self.entries or not files_fields:
+            return
+        for key in [key for key in self.entries if any(matches(*key, fields) for fields in files_fields)]:
+            self.drop(key)
+
+search_cache = SearchCache(SEARCH_CACHE_TIME, SEARCH_CACHE_IDS)
+
+# False until every saved file has its search fields, searches use the file name regex till then
+search_index_ready = False
+
+def tokenize(text):
+    """Split a file name or query into lowercase word tokens, in order and without repeats"""
+    return list(dict.fromkeys(re.findall(r"[^\W_]+", str(text).lower())))
+
+def search_fields(file_name):
+    """Tokens plus the language, quality, season and year filters of a file name"""
+    tokens = tokenize(file_name)
+    name = ' '.join(tokens)
+    season = re.search(r"\b(?:s|season )0*(\d{1,2})(?:e\d+)?\b", name)
+    year = re.search(r"\b(19\d{2}|20\d{2})\b", name)
+    return {
+        'tokens': tokens,
+        'languages': [lang for lang in dict.fromkeys(LANGUAGES) if lang in tokens or lang[:3] in tokens],
+        'qualities': [quality.lower() for quality in QUALITIES if re.search(r"\b" + re.escape(' '.join(tokenize(quality))) + r"\b", name)],
+        'season': int(season.group(1)) if season else None,
+        'year': int(year.group(1)) if year else None,
+    }
+
+# created of files saved before it existed counts up one second at a time from
+# BACKFILL_START, in their insertion order, so they all sort before newer files
+BACKFILL_START = datetime(2000, 1, 1)
+BACKFILL_END = ObjectId.from_datetime(datetime(2010, 1, 1))
+
+def backfill_created(n):
+    timestamp = int((BACKFILL_START + timedelta(seconds=n) - datetime(1970, 1, 1)).total_seconds())
+    return ObjectId(pack('>I', timestamp) + os.urandom(8))
+
+async def build_search_index():
+    """Add search fields to files saved before they existed, then load the spell index"""
+    global search_index_ready
+    updates = []
+    total = 0
+    n = await Media.count_documents({'created': {'$lt': BACKFILL_END}})
+    cursor = Media.collection.find(
+        {'$or': [{'languages': {'$exists': False}}, {'created': {'$exists': False}}]},
+        {'file_name': 1, 'languages': 1, 'created': 1}
+    ).sort('$natural', 1)
+    async for doc in cursor:
+        update = {} if 'languages' in doc else search_fields(doc.get('file_name', ''))
+        if 'created' not in doc:
+            update['created'] = backfill_created(n)
+            n += 1
+        updates.append(UpdateOne({'_id': doc['_id']}, {'$set': update}))
+        if len(updates) >= 1000:
+            await Media.collection.bulk_write(updates, ordered=False)
+            total += len(updates)
+            updates = []
+    if updates:
+        await Media.collection.bulk_write(updates, ordered=False)
+        total += len(updates)
+    if total:
+        logger.info(f'Search index built for {total} files')
+    search_index_ready = True
+    await load_spell_index()
+
+async def load_spell_index():
+    """Fill the spell index with every word of the indexed file names"""
+    pipeline = [
+        {'$project': {'tokens': 1}},
+        {'$unwind': '$tokens'},
+        {'$group': {'_id': '$tokens', 'count': {'$sum': 1}}},
+    ]
+    async for word in Media.collection.aggregate(pipeline, allowDiskUse=True):
+        spell_index.add(word['_id'], word['count'])
+    logger.info(f'Spell index loaded with {len(spell_index.words)} words')
+
 async def get_files_db_size():
     return (await mydb.command("dbstats"))['dataSize']
     
-async def save_file(media):
-    """Save file in database"""
+def media_document(media):
+    """Unsaved Media document for a pyrogram media object, None if it doesn't validate"""
 
     # TODO: Find better way to get same file_id for same media to avoid duplicates
     file_id, file_ref = unpack_new_file_id(media.file_id)
     file_name = re.sub(r"(_|\-|\.|\+)", " ", str(media.file_name))
     try:
-        file = Media(
+        return Media(
             file_id=file_id,
             file_ref=file_ref,
             file_name=file_name,
             file_size=media.file_size,
             mime_type=media.mime_type,
             caption=media.caption.html if media.caption else None,
-            file_type=media.mime_type.split('/')[0]
+            file_type=media.mime_type.split('/')[0],
+            created=ObjectId(),
+            **search_fields(file_name)
         )
     except ValidationError:
+        return None
+
+def files_saved(files):
+    """Keep the search cache and spell index in step with newly saved files"""
+    files_fields = [search_fields(file.file_name) for file in files]
+    search_cache.invalidate(files_fields)
+    for fields in files_fields:
+        for word in fields['tokens']:
+            spell_index.add(word)
+
+async def save_file(media):
+    """Save file in database"""
+    file = media_document(media)
+    if file is None:
         print('Error occurred while saving file in database')
         return 'err'
+    try:
+        await file.commit()
+    except DuplicateKeyError:      
+        print(f'{getattr(media, "file_name", "NO_FILE")} is already saved in database') 
+        return 'dup'
     else:
-        try:
-            await file.commit()
-        except DuplicateKeyError:      
-            print(f'{getattr(media, "file_name", "NO_FILE")} is already saved in database') 
-            return 'dup'
-        else:
-            print(f'{getattr(media, "file_name", "NO_FILE")} is saved to database')
-            return 'suc'
+        files_saved([file])
+        print(f'{getattr(media, "file_name", "NO_FILE")} is saved to database')
+        return 'suc'
+
+async def save_files(medias):
+    """Save several files with one unordered insert_many.
+    Returns the number of saved, duplicate and failed files"""
+    files = [media_document(media) for media in medias]
+    errors = files.count(None)
+    files = [file for file in files if file is not None]
+    if not files:
+        return 0, 0, errors
+    failed = set()
+    duplicate = 0
+    try:
+        await Media.collection.insert_many([file.to_mongo() for file in files], ordered=False)
+    except BulkWriteError as e:
+        for error in e.details['writeErrors']:
+            failed.add(error['index'])
+            if error['code'] == 11000:
+                duplicate += 1
+            else:
+                errors += 1
+    files_saved([file for index, file in enumerate(files) if index not in failed])
+    return len(files) - len(failed), duplicate, errors
+
+def search_filter(words, filters=()):
+    """Every word but the last must be a whole token, the last one may be a prefix.
+    filters are (field, value) pairs matched against the extracted search fields"""
+    conditions = [{'tokens': word} for word in words[:-1]]
+    if words:
+        conditions.append({'tokens': {'$regex': '^' + re.escape(words[-1])}})
+    conditions += [{field: value} for field, value in filters]
+    if not conditions:
+        return {}
+    return {'$and': conditions} if len(conditions) > 1 else conditions[0]
+
+def matches(words, filters, file_fields):
+    """Same rule as search_filter, checked against one file's search fields"""
+    tokens = file_fields['tokens']
+    for field, value in filters:
+        if isinstance(file_fields[field], list):
+            if value not in file_fields[field]:
+                return False
+        elif file_fields[field] != value:
+            return False
+    if not words:
+        return True
+    return all(word in tokens for word in words[:-1]) and any(token.startswith(words[-1]) for token in tokens)
 
-async def get_search_results(query, max_results=MAX_BTN, offset=0, lang=None):
+def search_score(words, tokens):
+    """Rank whole token hits over prefix hits, words in query order, then shorter names"""
+    score = 0
+    for word in words:
+        if word in tokens:
+            score += 2
+        elif any(token.startswith(word) for token in tokens):
+            score += 1
+    positions = [tokens.index(word) for word in words if word in tokens]
+    if len(positions) > 1 and positions == sorted(positions):
+        score += len(positions)
+    return -score, len(tokens)
+
+async def search_ids(words, filter):
+    """Ranked ids of the first SEARCH_CANDIDATES matches, the total match count
+    and the oldest candidate's created key, where later pages carry on from"""
+    cursor = Media.collection.find(filter, {'file_name': 1, 'tokens': 1, 'created': 1}).sort('created', -1).limit(SEARCH_CANDIDATES)
+    docs = await cursor.to_list(length=SEARCH_CANDIDATES)
+    last = docs[-1].get('created') if docs else None
+    docs.sort(key=lambda doc: search_score(words, doc.get('tokens') or tokenize(doc.get('file_name', ''))))
+    if len(docs) < SEARCH_CANDIDATES:
+        total_results = len(docs)
+    else:
+        total_results = await Media.count_documents(filter)
+    return [doc['_id'] for doc in docs], total_results, last
+
+def legacy_search_filter(query, filters):
+    """File name regex filter used before the search index is built"""
     query = query.strip()
     if not query:
         raw_pattern = '.'
     elif ' ' not in query:
-        raw_pattern = r'(\b|[\.\+\-_])' + query + r'(\b|[\.\+\-_])'
+        raw_pattern = r'(\b|[\.\+\-_])' + re.escape(query) + r'(\b|[\.\+\-_])'
     else:
-        raw_pattern = query.replace(' ', r'.*[\s\.\+\-_]') 
-    try:
-        regex = re.compile(raw_pattern, flags=re.IGNORECASE)
-    except:
-        regex = query
-    filter = {'file_name': regex}
+        raw_pattern = r'.*[\s\.\+\-_]'.join(map(re.escape, query.split()))
+    conditions = [{'file_name': re.compile(raw_pattern, flags=re.IGNORECASE)}]
+    for field, value in filters:
+        if field == 'season':
+            pattern = rf'\b(s|season[\s\.\+\-_]*)0*{value}(e\d+)?\b'
+        else:
+            pattern = r'\b' + re.escape(str(value)) + r'\b'
+        conditions.append({'file_name': re.compile(pattern, flags=re.IGNORECASE)})
+    return {'$and': conditions} if len(conditions) > 1 else conditions[0]
+
+async def legacy_search_results(query, filters, max_results, offset):
+    """Newest first file name regex search, no ranking or caching"""
+    filter = legacy_search_filter(query, filters)
     cursor = Media.find(filter)
     cursor.sort('$natural', -1)
-    if lang:
-        lang_files = [file async for file in cursor if lang in file.file_name.lower()]
-        files = lang_files[offset:][:max_results]
-        total_results = len(lang_files)
-        next_offset = offset + max_results
-        if next_offset >= total_results:
-            next_offset = ''
-        return files, next_offset, total_results
     cursor.skip(offset).limit(max_results)
     files = await cursor.to_list(length=max_results)
     total_results = await Media.count_documents(filter)
     next_offset = offset + max_results
     if next_offset >= total_results:
-        next_offset = ''       
+        next_offset = ''
+    return files, next_offset, total_results
+
+async def get_search_results(query, max_results=MAX_BTN, offset=0, lang=None, quality=None, season=None, year=None):
+    words = tuple(tokenize(query))
+    filters = tuple(
+        (field, value) for field, value in (
+            ('languages', lang and lang.lower()),
+            ('qualities', quality and quality.lower()),
+            ('season', season and int(season)),
+            ('year', year and int(year)),
+        ) if value
+    )
+    if not search_index_ready:
+        return await legacy_search_results(query, filters, max_results, offset)
+    filter = search_filter(words, filters)
+    cached = search_cache.get((words, filters))
+    if cached:
+        ids, total_results, marks = cached
+    else:
+        ids, total_results, last = await search_ids(words, filter)
+        # offset -> created key of the file just before it
+        marks = {len(ids): last} if last else {}
+        search_cache.set((words, filters), ids, total_results, marks)
+    page_ids = ids[offset:offset + max_results]
+    files = []
+    if page_ids:
+        found = {file.file_id: file async for file in Media.find({'file_id': {'$in': page_ids}})}
+        files = [found[file_id] for file_id in page_ids if file_id in found]
+    # Pages past the ranked candidates carry on newest first, from the closest
+    # offset whose key is known so only the files in between are skipped
+    if len(page_ids) < max_results and offset + len(page_ids) < total_results and marks:
+        start = max(offset, len(ids))
+        mark = max(o for o in marks if o <= start)
+        conditions = [filter] if filter else []
+        conditions.append({'created': {'$lt': marks[mark]}})
+        cursor = Media.find({'$and': conditions})
+        cursor.sort('created', -1)
+        cursor.skip(start - mark).limit(max_results - len(page_ids))
+        more = await cursor.to_list(length=max_results - len(page_ids))
+        if more:
+            marks[start + len(more)] = more[-1].created
+        files += more
+    next_offset = offset + max_results
+    if next_offset >= total_results:
+        next_offset = ''
     return files, next_offset, total_results
     
 async def get_bad_files(query, file_type=None, offset=0, filter=False):
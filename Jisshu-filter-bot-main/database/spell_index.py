@@ -0,0 +1,48 @@
+from collections import Counter, defaultdict
+from Levenshtein import distance
+
+class SpellIndex:
+    """Trigram index over the words of indexed file names, used to correct
+    misspelled searches locally instead of asking IMDb"""
+
+    def __init__(self):
+        self.words = Counter()
+        self.grams = defaultdict(set)
+
+    @staticmethod
+    def trigrams(word):
+        word = f"#{word}#"
+        return {word[i:i + 3] for i in range(len(word) - 2)}
+
+    def add(self, word, count=1):
+        if word not in self.words and len(word) > 2 and not word.isdigit():
+            for gram in self.trigrams(word):
+                self.grams[gram].add(word)
+        self.words[word] += count
+
+    def correct_word(self, word):
+        """Closest known word within a small edit distance, None if nothing is close"""
+        if word in self.words or len(word) < 3 or word.isdigit():
+            return word
+        max_distance = 1 if len(word) < 6 else 2
+        shared = Counter()
+        for gram in self.trigrams(word):
+            for candidate in self.grams.get(gram, ()):
+                if abs(len(candidate) - len(word)) <= max_distance:
+                    shared[candidate] += 1
+        best = None
+        for candidate, _ in shared.most_common(50):
+            dist = distance(word, candidate)
+            if dist <= max_distance and (best is None or (dist, -self.words[candidate]) < best[0]):
+                best = ((dist, -self.words[candidate]), candidate)
+        return best[1] if best else None
+
+    def correct(self, words):
+        """Corrected query for a list of search words, words that match nothing are dropped.
+        None if there is nothing to correct or nothing left"""
+        corrected = [word for word in map(self.correct_word, words) if word]
+        if not corrected or corrected == list(words):
+            return None
+        return ' '.join(corrected)
+
+spell_index = SpellIndex()
@@ -1,10 +1,32 @@
+import asyncio
 import datetime
+import heapq
+import time
 import pytz
+from pymongo import ReturnDocument
 from motor.motor_asyncio import AsyncIOMotorClient
 #from info import SETTINGS, IS_PM_SEARCH, IS_SEND_MOVIE_UPDATE, PREMIUM_POINT,REF_PREMIUM,IS_VERIFY, SHORTENER_WEBSITE3, SHORTENER_API3, THREE_VERIFY_GAP, LINK_MODE, FILE_CAPTION, TUTORIAL, DATABASE_NAME, DATABASE_URI, IMDB, IMDB_TEMPLATE, PROTECT_CONTENT, AUTO_DELETE, SPELL_CHECK, AUTO_FILTER, LOG_VR_CHANNEL, SHORTENER_WEBSITE, SHORTENER_API, SHORTENER_WEBSITE2, SHORTENER_API2, TWO_VERIFY_GAP
 # from utils import get_seconds
 from info import *
 
+IST = pytz.timezone('Asia/Kolkata')
+
+def verified_today(verified_at):
+    """Whether a verification happened since midnight IST"""
+    current_time = datetime.datetime.now(tz=IST)
+    midnight = datetime.datetime(current_time.year, current_time.month, current_time.day, 0, 0, 0, tzinfo=IST)
+    return (current_time - verified_at.astimezone(IST)).total_seconds() <= (current_time - midnight).total_seconds()
+
+def next_verify_due(user, previous, key, gap):
+    """Whether the verification stored under `key` is due: `previous` was done
+    today, more than `gap` seconds ago, and `key` hasn't been done since"""
+    if not verified_today(user[previous]):
+        return False
+    previous_time = user[previous].astimezone(IST)
+    if datetime.datetime.now(tz=IST) - previous_time > datetime.timedelta(seconds=gap):
+        return user[key].astimezone(IST) < previous_time
+    return False
+
 client = AsyncIOMotorClient(DATABASE_URI)
 mydb = client[DATABASE_NAME]
 
@@ -22,6 +44,19 @@ class Database:
         self.jisshu_ads_link = mydb.jisshu_ads_link
         self.movies_update_channel = mydb.movies_update_channel
         self.botcol = mydb.botcol
+        self.imdb_cache = mydb.imdb_cache
+        self.index_jobs = mydb.index_jobs
+        self.scheduled = mydb.scheduled_actions
+        self.broadcasts = mydb.broadcasts
+        # group id -> [settings, settings_version, last checked]
+        self.settings_cache = {}
+        # user id -> (expires at, verification state), see get_verify_state
+        self.verify_cache = {}
+        # (expiry_time, user id) of upcoming premium expiries, loaded up to
+        # expiry_horizon (None when every expiry is loaded)
+        self.expiry_heap = []
+        self.expiry_horizon = None
+        self.expiry_rearm = asyncio.Event()
 
 
     default = {
@@ -61,11 +96,47 @@ class Database:
         )
 
     async def get_settings(self, group_id):
-        chat = await self.grp.find_one({'id': int(group_id)})
+        """Group settings from the in-process cache. After SETTINGS_CACHE_TIME seconds
+        the cached copy is checked against settings_version, which every write bumps,
+        so changes made by other instances are picked up"""
+        group_id = int(group_id)
+        now = time.monotonic()
+        cached = self.settings_cache.get(group_id)
+        if cached and now - cached[2] < SETTINGS_CACHE_TIME:
+            return cached[0].copy()
+        if cached:
+            chat = await self.grp.find_one({'id': group_id}, {'settings_version': 1})
+            if chat and chat.get('settings_version', 0) == cached[1]:
+                cached[2] = now
+                return cached[0].copy()
+        chat = await self.grp.find_one({'id': group_id}, {'settings': 1, 'settings_version': 1})
+        settings = self.default.copy()
         if chat and 'settings' in chat:
-            return chat['settings']
-        else:
-            return self.default.copy()
+            settings.update(chat['settings'])
+        self.settings_cache[group_id] = [settings, chat.get('settings_version', 0) if chat else 0, now]
+        return settings.copy()
+
+    async def write_settings(self, group_id, update, apply=None):
+        """Apply a settings update and keep the cached copy in step with it,
+        without `apply` the cached copy is dropped and loaded again on the next read"""
+        group_id = int(group_id)
+        update['$inc'] = {'settings_version': 1}
+        chat = await self.grp.find_one_and_update(
+            {'id': group_id}, update, projection={'settings_version': 1}, return_document=ReturnDocument.AFTER
+        )
+        cached = self.settings_cache.get(group_id)
+        if not apply or not chat or not cached or chat['settings_version'] != cached[1] + 1:
+            # Someone else may have changed it in between
+            self.settings_cache.pop(group_id, None)
+            return
+        apply(cached[0])
+        cached[1] = chat['settings_version']
+        cached[2] = time.monotonic()
+
+    async def update_setting(self, group_id, key, value):
+        await self.write_settings(
+            group_id, {'$set': {f'settings.{key}': value}}, lambda settings: settings.update({key: value})
+        )
         
     async def find_join_req(self, id):
         return bool(await self.req.find_one({'id': id}))
@@ -124,6 +195,16 @@ class Database:
 
     async def delete_chat(self, id):
         await self.grp.delete_many({'id': int(id)})
+        self.settings_cache.pop(int(id), None)
+
+    async def delete_users(self, user_ids):
+        await self.col.delete_many({'id': {'$in': [int(user_id) for user_id in user_ids]}})
+
+    async def delete_chats(self, ids):
+        ids = [int(id) for id in ids]
+        await self.grp.delete_many({'id': {'$in': ids}})
+        for id in ids:
+            self.settings_cache.pop(id, None)
         
     async def get_banned(self):
         users = self.col.find({'ban_status.is_banned': True})
@@ -141,7 +222,7 @@ class Database:
         return False if not chat else chat.get('chat_status')  
 
     async def update_settings(self, id, settings):
-        await self.grp.update_one({'id': int(id)}, {'$set': {'settings': settings}})   
+        await self.write_settings(id, {'$set': {'settings': settings}})   
     
     async def total_chat_count(self):
         count = await self.grp.count_documents({})
@@ -150,101 +231,84 @@ class Database:
     async def get_all_chats(self):
         return self.grp.find({})
 
+    async def get_broadcast_batch(self, kind, after, limit):
+        """Next `limit` user or group documents by _id, after the _id `after`"""
+        col = self.col if kind == 'users' else self.grp
+        query = {'_id': {'$gt': after}} if after else {}
+        return await col.find(query, {'id': 1}).sort('_id', 1).to_list(length=limit)
+
+    async def count_broadcast_remaining(self, kind, after):
+        col = self.col if kind == 'users' else self.grp
+        return await col.count_documents({'_id': {'$gt': after}} if after else {})
+
     async def get_db_size(self):
         return (await mydb.command("dbstats"))['dataSize'] 
 
-    async def get_notcopy_user(self, user_id):
+    async def get_verify_state(self, user_id):
+        """Verification timestamps and premium record of a user, read together
+        and kept for VERIFY_CACHE_TIME seconds"""
         user_id = int(user_id)
-        user = await self.misc.find_one({"user_id": user_id})
-        ist_timezone = pytz.timezone('Asia/Kolkata')
-        if not user:
-            res = {
+        cached = self.verify_cache.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        notcopy, user = await asyncio.gather(
+            self.misc.find_one({"user_id": user_id}),
+            self.users.find_one({"id": user_id})
+        )
+        if not notcopy:
+            notcopy = {
                 "user_id": user_id,
-                "last_verified": datetime.datetime(2020, 5, 17, 0, 0, 0, tzinfo=ist_timezone),
-                "second_time_verified": datetime.datetime(2019, 5, 17, 0, 0, 0, tzinfo=ist_timezone),
+                "last_verified": datetime.datetime(2020, 5, 17, 0, 0, 0, tzinfo=IST),
+                "second_time_verified": datetime.datetime(2019, 5, 17, 0, 0, 0, tzinfo=IST),
             }
-            user = await self.misc.insert_one(res)
-        return user
+            await self.misc.insert_one(notcopy)
+        notcopy.setdefault("second_time_verified", datetime.datetime(2019, 5, 17, 0, 0, 0, tzinfo=IST))
+        notcopy.setdefault("third_time_verified", datetime.datetime(2018, 5, 17, 0, 0, 0, tzinfo=IST))
+        state = {"notcopy": notcopy, "user": user}
+        if len(self.verify_cache) >= 10000:
+            now = time.monotonic()
+            self.verify_cache = {key: value for key, value in self.verify_cache.items() if value[0] > now}
+        self.verify_cache[user_id] = (time.monotonic() + VERIFY_CACHE_TIME, state)
+        return state
+
+    async def get_verify_status(self, user_id, verify_time, third_verify_time):
+        """Every verification decision of the file delivery path from one state read"""
+        state = await self.get_verify_state(user_id)
+        notcopy = state["notcopy"]
+        return {
+            "premium": await self.has_premium_access(user_id),
+            "verified": verified_today(notcopy["last_verified"]),
+            "second_verified": verified_today(notcopy["second_time_verified"]),
+            "second_shortener": next_verify_due(notcopy, "last_verified", "second_time_verified", verify_time),
+            "third_shortener": next_verify_due(notcopy, "second_time_verified", "third_time_verified", third_verify_time),
+        }
+
+    async def get_notcopy_user(self, user_id):
+        return (await self.get_verify_state(user_id))["notcopy"]
 
     async def update_notcopy_user(self, user_id, value:dict):
         user_id = int(user_id)
         myquery = {"user_id": user_id}
         newvalues = {"$set": value}
-        return await self.misc.update_one(myquery, newvalues)
+        result = await self.misc.update_one(myquery, newvalues)
+        self.verify_cache.pop(user_id, None)
+        return result
 
     async def is_user_verified(self, user_id):
         user = await self.get_notcopy_user(user_id)
-        try:
-            pastDate = user["last_verified"]
-        except Exception:
-            user = await self.get_notcopy_user(user_id)
-            pastDate = user["last_verified"]
-        ist_timezone = pytz.timezone('Asia/Kolkata')
-        pastDate = pastDate.astimezone(ist_timezone)
-        current_time = datetime.datetime.now(tz=ist_timezone)
-        seconds_since_midnight = (current_time - datetime.datetime(current_time.year, current_time.month, current_time.day, 0, 0, 0, tzinfo=ist_timezone)).total_seconds()
-        time_diff = current_time - pastDate
-        total_seconds = time_diff.total_seconds()
-        return total_seconds <= seconds_since_midnight
+        return verified_today(user["last_verified"])
 
     async def user_verified(self, user_id):
         user = await self.get_notcopy_user(user_id)
-        try:
-            pastDate = user["second_time_verified"]
-        except Exception:
-            user = await self.get_notcopy_user(user_id)
-            pastDate = user["second_time_verified"]
-        ist_timezone = pytz.timezone('Asia/Kolkata')
-        pastDate = pastDate.astimezone(ist_timezone)
-        current_time = datetime.datetime.now(tz=ist_timezone)
-        seconds_since_midnight = (current_time - datetime.datetime(current_time.year, current_time.month, current_time.day, 0, 0, 0, tzinfo=ist_timezone)).total_seconds()
-        time_diff = current_time - pastDate
-        total_seconds = time_diff.total_seconds()
-        return total_seconds <= seconds_since_midnight
+        return verified_today(user["second_time_verified"])
 
     async def use_second_shortener(self, user_id, time):
         user = await self.get_notcopy_user(user_id)
-        if not user.get("second_time_verified"):
-            ist_timezone = pytz.timezone('Asia/Kolkata')
-            await self.update_notcopy_user(user_id, {"second_time_verified":datetime.datetime(2019, 5, 17, 0, 0, 0, tzinfo=ist_timezone)})
-            user = await self.get_notcopy_user(user_id)
-        if await self.is_user_verified(user_id):
-            try:
-                pastDate = user["last_verified"]
-            except Exception:
-                user = await self.get_notcopy_user(user_id)
-                pastDate = user["last_verified"]
-            ist_timezone = pytz.timezone('Asia/Kolkata')
-            pastDate = pastDate.astimezone(ist_timezone)
-            current_time = datetime.datetime.now(tz=ist_timezone)
-            time_difference = current_time - pastDate
-            if time_difference > datetime.timedelta(seconds=time):
-                pastDate = user["last_verified"].astimezone(ist_timezone)
-                second_time = user["second_time_verified"].astimezone(ist_timezone)
-                return second_time < pastDate
-        return False
+        return next_verify_due(user, "last_verified", "second_time_verified", time)
 
     async def use_third_shortener(self, user_id, time):
         user = await self.get_notcopy_user(user_id)
-        if not user.get("third_time_verified"):
-            ist_timezone = pytz.timezone('Asia/Kolkata')
-            await self.update_notcopy_user(user_id, {"third_time_verified":datetime.datetime(2018, 5, 17, 0, 0, 0, tzinfo=ist_timezone)})
-            user = await self.get_notcopy_user(user_id)
-        if await self.user_verified(user_id):
-            try:
-                pastDate = user["second_time_verified"]
-            except Exception:
-                user = await self.get_notcopy_user(user_id)
-                pastDate = user["second_time_verified"]
-            ist_timezone = pytz.timezone('Asia/Kolkata')
-            pastDate = pastDate.astimezone(ist_timezone)
-            current_time = datetime.datetime.now(tz=ist_timezone)
-            time_difference = current_time - pastDate
-            if time_difference > datetime.timedelta(seconds=time):
-                pastDate = user["second_time_verified"].astimezone(ist_timezone)
-                second_time = user["third_time_verified"].astimezone(ist_timezone)
-                return second_time < pastDate
-        return False
+        return next_verify_due(user, "second_time_verified", "third_time_verified", time)
    
     async def create_verify_id(self, user_id: int, hash):
         res = {"user_id": user_id, "hash":hash, "verified":False}
@@ -289,6 +353,30 @@ class Database:
         
     async def update_user(self, user_data):
         await self.users.update_one({"id": user_data["id"]}, {"$set": user_data}, upsert=True)
+        self.verify_cache.pop(int(user_data["id"]), None)
+        if "expiry_time" in user_data:
+            self.schedule_expiry(user_data["id"], user_data["expiry_time"])
+
+    def schedule_expiry(self, user_id, expiry_time):
+        """Hand a granted or extended premium to the expiry scheduler"""
+        if isinstance(expiry_time, datetime.datetime):
+            if expiry_time.tzinfo is not None:
+                # Keep the heap on the naive local clock of datetime.now()
+                expiry_time = expiry_time.astimezone().replace(tzinfo=None)
+            heapq.heappush(self.expiry_heap, (expiry_time, user_id))
+            self.expiry_rearm.set()
+
+    async def ensure_expiry_index(self):
+        await self.users.create_index('expiry_time')
+
+    async def load_expiries(self, limit):
+        """Load the next `limit` premium expiries into the scheduler heap"""
+        cursor = self.users.find(
+            {"expiry_time": {"$gte": datetime.datetime.now()}}, {"id": 1, "expiry_time": 1}
+        ).sort("expiry_time", 1).limit(limit)
+        expiries = [(user["expiry_time"], user["id"]) async for user in cursor]
+        self.expiry_heap = expiries
+        self.expiry_horizon = expiries[-1][0] if len(expiries) == limit else None
 
 
     async def get_expired(self, current_time):
@@ -300,7 +388,7 @@ class Database:
 
     
     async def has_premium_access(self, user_id):
-        user_data = await self.get_user(user_id)
+        user_data = (await self.get_verify_state(user_id))["user"]
         if user_data:
             expiry_time = user_data.get("expiry_time")
             if expiry_time is None:
@@ -310,6 +398,7 @@ class Database:
                 return True
             else:
                 await self.users.update_one({"id": user_id}, {"$set": {"expiry_time": None}})
+                user_data["expiry_time"] = None
         return False
     
     async def check_remaining_uasge(self, user_id):
@@ -330,6 +419,8 @@ class Database:
         try:
             # Assuming self.client and self.users are set up properly
             result = await self.users.update_one(filter_query, update_data)
+            if "id" in filter_query:
+                self.verify_cache.pop(int(filter_query["id"]), None)
             return result.matched_count == 1
         except Exception as e:
             print(f"Error updating document: {e}")
@@ -368,6 +459,8 @@ class Database:
         expiry_time = datetime.datetime.now() + datetime.timedelta(seconds=seconds)
         user_data = {"id": user_id, "expiry_time": expiry_time, "has_free_trial": True}
         await self.users.update_one({"id": user_id}, {"$set": user_data}, upsert=True)
+        self.verify_cache.pop(int(user_id), None)
+        self.schedule_expiry(user_id, expiry_time)
             
      # JISSHU BOTS
     async def jisshu_set_ads_link(self,link):
@@ -429,7 +522,53 @@ class Database:
         return await self.movies_update_channel.update_one({} , {'$set': {'id': id}} , upsert=True)
 
     async def reset_group_settings(self, id):
-        await self.grp.update_one({'id': int(id)}, {'$set': {'settings': self.default}})
+        await self.write_settings(id, {'$set': {'settings': self.default}})
+
+    async def save_index_job(self, chat, job):
+        await self.index_jobs.update_one({'_id': chat}, {'$set': job}, upsert=True)
+
+    async def get_index_job(self, chat):
+        return await self.index_jobs.find_one({'_id': chat})
+
+    async def get_index_jobs(self):
+        return await self.index_jobs.find({}).to_list(length=None)
+
+    async def delete_index_job(self, chat):
+        await self.index_jobs.delete_one({'_id': chat})
+
+    async def save_broadcast(self, kind, job):
+        await self.broadcasts.update_one({'_id': kind}, {'$set': job}, upsert=True)
+
+    async def get_broadcasts(self):
+        return await self.broadcasts.find({}).to_list(length=None)
+
+    async def delete_broadcast(self, kind):
+        await self.broadcasts.delete_one({'_id': kind})
+
+    async def ensure_imdb_cache_index(self):
+        await self.imdb_cache.create_index('cached_at', expireAfterSeconds=IMDB_CACHE_TIME)
+
+    async def get_imdb_cache(self, key):
+        return await self.imdb_cache.find_one({'_id': key})
+
+    async def set_imdb_cache(self, key, value):
+        await self.imdb_cache.update_one(
+            {'_id': key},
+            {'$set': {'value': value, 'cached_at': datetime.datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def ensure_scheduled_index(self):
+        await self.scheduled.create_index('run_at')
+
+    async def add_scheduled_action(self, action):
+        await self.scheduled.insert_one(action)
+
+    async def get_scheduled_actions(self, until):
+        return await self.scheduled.find({'run_at': {'$lt': until}}).to_list(length=None)
+
+    async def delete_scheduled_actions(self, ids):
+        await self.scheduled.delete_many({'_id': {'$in': ids}})
 
 db = Database()
 
@@ -89,9 +89,20 @@ AUTO_FILTER = is_enabled('AUTO_FILTER', True)
 IS_PM_SEARCH = is_enabled('IS_PM_SEARCH', False)
 IS_SEND_MOVIE_UPDATE = is_enabled('IS_SEND_MOVIE_UPDATE', False) # Don't Change It ( If You Want To Turn It On Then Turn It On By Commands) We Suggest You To Make It Turn Off If You Are Indexing Files First Time.
 MAX_BTN = int(environ.get('MAX_BTN', '8'))
+SETTINGS_CACHE_TIME = int(environ.get('SETTINGS_CACHE_TIME', '30')) # Seconds group settings are served from memory before checking for changes
+VERIFY_CACHE_TIME = int(environ.get('VERIFY_CACHE_TIME', '60')) # Seconds a user's verification and premium state is served from memory
+BROADCAST_WORKERS = int(environ.get('BROADCAST_WORKERS', '20')) # Broadcast messages sent at the same time
+FILE_SEND_WORKERS = int(environ.get('FILE_SEND_WORKERS', '4')) # Files of one batch in flight at once, 1 sends them strictly one after another
+BROADCAST_RATE = int(environ.get('BROADCAST_RATE', '20')) # Most broadcast messages sent per second, lowered on FloodWait
+INDEX_CONCURRENCY = int(environ.get('INDEX_CONCURRENCY', '2')) # Channels indexed at the same time
+SEARCH_CANDIDATES = int(environ.get('SEARCH_CANDIDATES', '500')) # Top matches ranked by relevance, later pages follow index order
+SEARCH_CACHE_TIME = int(environ.get('SEARCH_CACHE_TIME', '600')) # Seconds a search result list is reused for pagination, 0 disables it
+SEARCH_CACHE_IDS = int(environ.get('SEARCH_CACHE_IDS', '200000')) # Total file ids the search cache may hold
 AUTO_DELETE = is_enabled('AUTO_DELETE', True)
 DELETE_TIME = int(environ.get('DELETE_TIME', 1200))
 IMDB = is_enabled('IMDB', False)
+IMDB_WORKERS = int(environ.get('IMDB_WORKERS', '4')) # Threads used for IMDb lookups
+IMDB_CACHE_TIME = int(environ.get('IMDB_CACHE_TIME', '604800')) # Seconds IMDb results are kept in the database
 FILE_CAPTION = environ.get('FILE_CAPTION', f'{script.FILE_CAPTION}')
 IMDB_TEMPLATE = environ.get('IMDB_TEMPLATE', f'{script.IMDB_TEMPLATE_TXT}')
 LONG_IMDB_DESCRIPTION = is_enabled('LONG_IMDB_DESCRIPTION', False)
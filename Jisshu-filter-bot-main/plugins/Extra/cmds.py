@@ -1,7 +1,6 @@
-import asyncio
 from pyrogram import Client, filters, enums
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, BotCommand
-from utils import is_check_admin
+from utils import is_check_admin, scheduler
 from Script import script
 from info import ADMINS, admin_cmds, cmds
 
@@ -44,9 +43,7 @@ async def admin_cmds_handler(client, message):
         sent_message = await message.reply(
             f"<b>Admin All Commands [auto delete in 2 minutes] 👇</b>\n\n{commands_list}{admin_footer}"
         )        
-        await asyncio.sleep(120)
-        await sent_message.delete()
-        await message.delete()
+        await scheduler.delete_later(120, sent_message, message)
     except Exception as e:
         print(f"Error in admin_cmds_handler: {e}")
         await message.reply("An error occurred while displaying admin commands.")
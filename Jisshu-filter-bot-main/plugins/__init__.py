@@ -1,29 +1,76 @@
+import logging
 from aiohttp import web
 from .route import routes
-from asyncio import sleep 
+from asyncio import sleep, wait_for, TimeoutError
 from datetime import datetime
+from heapq import heappop
+from time import monotonic
 from database.users_chats_db import db
 from info import LOG_CHANNEL
 
+logger = logging.getLogger(__name__)
+
+# Upcoming expiries held in memory, and the longest sleep before they are reloaded
+EXPIRY_PRELOAD = 100
+EXPIRY_RELOAD = 3600
+
 async def web_server():
     web_app = web.Application(client_max_size=30000000)
     web_app.add_routes(routes)
     return web_app
 
+async def expire_premium(client, user_id):
+    await db.remove_premium_access(user_id)
+    try:
+        user = await client.get_users(user_id)
+        await client.send_message(
+            chat_id=user_id,
+            text=f"<b>ʜᴇʏ {user.mention},\n\nʏᴏᴜʀ ᴘʀᴇᴍɪᴜᴍ ᴀᴄᴄᴇss ʜᴀs ᴇxᴘɪʀᴇᴅ, ᴛʜᴀɴᴋ ʏᴏᴜ ꜰᴏʀ ᴜsɪɴɢ ᴏᴜʀ sᴇʀᴠɪᴄᴇ 😊\n\nɪꜰ ʏᴏᴜ ᴡᴀɴᴛ ᴛᴏ ᴛᴀᴋᴇ ᴛʜᴇ ᴘʀᴇᴍɪᴜᴍ ᴀɢᴀɪɴ, ᴛʜᴇɴ ᴄʟɪᴄᴋ ᴏɴ ᴛʜᴇ /plan ꜰᴏʀ ᴛʜᴇ ᴅᴇᴛᴀɪʟs ᴏꜰ ᴛʜᴇ ᴘʟᴀɴs...</b>"
+        )
+        await client.send_message(LOG_CHANNEL, text=f"<b>#Premium_Expire\n\nUser name: {user.mention}\nUser id: <code>{user_id}</code>")
+    except Exception as e:
+        print(e)
+
 async def check_expired_premium(client):
+    """Sleeps until the next premium expiry instead of polling for it.
+    Expiries missed while the bot was down are caught up on every reload"""
+    await db.ensure_expiry_index()
     while 1:
-        data = await db.get_expired(datetime.now())
-        for user in data:
-            user_id = user["id"]
-            await db.remove_premium_access(user_id)
+        try:
+            for user in await db.get_expired(datetime.now()):
+                await expire_premium(client, user["id"])
+                await sleep(0.5)
+            await db.load_expiries(EXPIRY_PRELOAD)
+        except Exception:
+            logger.exception("Loading premium expiries failed")
+            await sleep(60)
+            continue
+        reload_at = monotonic() + EXPIRY_RELOAD
+        while monotonic() < reload_at:
             try:
-                user = await client.get_users(user_id)
-                await client.send_message(
-                    chat_id=user_id,
-                    text=f"<b>ʜᴇʏ {user.mention},\n\nʏᴏᴜʀ ᴘʀᴇᴍɪᴜᴍ ᴀᴄᴄᴇss ʜᴀs ᴇxᴘɪʀᴇᴅ, ᴛʜᴀɴᴋ ʏᴏᴜ ꜰᴏʀ ᴜsɪɴɢ ᴏᴜʀ sᴇʀᴠɪᴄᴇ 😊\n\nɪꜰ ʏᴏᴜ ᴡᴀɴᴛ ᴛᴏ ᴛᴀᴋᴇ ᴛʜᴇ ᴘʀᴇᴍɪᴜᴍ ᴀɢᴀɪɴ, ᴛʜᴇɴ ᴄʟɪᴄᴋ ᴏɴ ᴛʜᴇ /plan ꜰᴏʀ ᴛʜᴇ ᴅᴇᴛᴀɪʟs ᴏꜰ ᴛʜᴇ ᴘʟᴀɴs...</b>"
-                )
-                await client.send_message(LOG_CHANNEL, text=f"<b>#Premium_Expire\n\nUser name: {user.mention}\nUser id: <code>{user_id}</code>")
-            except Exception as e:
-                print(e)
-            await sleep(0.5)
-        await sleep(1)
+                db.expiry_rearm.clear()
+                heap = db.expiry_heap
+                if db.expiry_horizon and (not heap or heap[0][0] > db.expiry_horizon):
+                    # Past the loaded expiries, fetch the next ones
+                    break
+                timeout = reload_at - monotonic()
+                if heap:
+                    timeout = min(timeout, (heap[0][0] - datetime.now()).total_seconds())
+                if timeout > 0:
+                    # update_user wakes this up when premium is granted or extended
+                    try:
+                        await wait_for(db.expiry_rearm.wait(), timeout)
+                    except TimeoutError:
+                        pass
+                    continue
+                _, user_id = heappop(heap)
+                user = await db.get_user(user_id)
+                # Skip stale entries, the premium may have been extended or removed since
+                expiry_time = user and user.get("expiry_time")
+                if expiry_time and expiry_time <= datetime.now():
+                    await expire_premium(client, user_id)
+            except Exception:
+                # Rebuild the heap from the database rather than retry a bad entry
+                logger.exception("Premium expiry check failed")
+                await sleep(1)
+                break
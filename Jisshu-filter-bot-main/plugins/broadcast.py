@@ -1,13 +1,17 @@
 from pyrogram import Client, filters
 import datetime
 import time
+import logging
 from database.users_chats_db import db
-from info import ADMINS
+from info import ADMINS, BROADCAST_WORKERS
 from utils import users_broadcast, groups_broadcast, temp, get_readable_time
 import asyncio
-from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup 
+from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
 
-lock = asyncio.Lock()
+logger = logging.getLogger(__name__)
+
+# Users or groups read and checkpointed at a time
+BATCH_SIZE = 500
 
 @Client.on_callback_query(filters.regex(r'^broadcast_cancel'))
 async def broadcast_cancel(bot, query):
@@ -18,86 +22,167 @@ async def broadcast_cancel(bot, query):
     elif ident == 'groups':
         temp.GROUPS_CANCEL = True
         await query.message.edit("ᴛʀʏɪɴɢ ᴛᴏ ᴄᴀɴᴄᴇʟ ɢʀᴏᴜᴘs ʙʀᴏᴀᴅᴄᴀsᴛɪɴɢ...")
-       
+
 @Client.on_message(filters.command("broadcast") & filters.user(ADMINS) & filters.reply)
 async def broadcast_users(bot, message):
-    if lock.locked():
+    if temp.BROADCASTING:
         return await message.reply('Currently broadcast processing, Wait for complete.')
+    # Taken before asking so a second /broadcast can't start while this one waits
+    temp.BROADCASTING.add('users')
+    try:
+        msg = await message.ask('<b>Do you want pin this message in users?</b>', reply_markup=ReplyKeyboardMarkup([['Yes', 'No']], one_time_keyboard=True, resize_keyboard=True))
+        if msg.text == 'Yes':
+            is_pin = True
+        elif msg.text == 'No':
+            is_pin = False
+        else:
+            return await msg.edit('Wrong Response!')
+        await msg.delete()
+        b_sts = await message.reply_text(text='<b>ʙʀᴏᴀᴅᴄᴀsᴛɪɴɢ ʏᴏᴜʀ ᴍᴇssᴀɢᴇs ᴛᴏ ᴜsᴇʀs ⌛️</b>')
+        await Broadcast(bot, 'users', message.reply_to_message, is_pin, b_sts).run()
+    finally:
+        temp.BROADCASTING.discard('users')
 
-    msg = await message.ask('<b>Do you want pin this message in users?</b>', reply_markup=ReplyKeyboardMarkup([['Yes', 'No']], one_time_keyboard=True, resize_keyboard=True))
-    if msg.text == 'Yes':
-        is_pin = True
-    elif msg.text == 'No':
-        is_pin = False
-    else:
-        return await msg.edit('Wrong Response!')
-    await msg.delete()
-    users = await db.get_all_users()
-    b_msg = message.reply_to_message
-    b_sts = await message.reply_text(text='<b>ʙʀᴏᴀᴅᴄᴀsᴛɪɴɢ ʏᴏᴜʀ ᴍᴇssᴀɢᴇs ᴛᴏ ᴜsᴇʀs ⌛️</b>')
-    start_time = time.time()
-    total_users = await db.total_users_count()
-    done = 0
-    blocked = 0
-    deleted = 0
-    failed = 0
-    success = 0
+@Client.on_message(filters.command("grp_broadcast") & filters.user(ADMINS) & filters.reply)
+async def broadcast_group(bot, message):
+    if temp.BROADCASTING:
+        return await message.reply('Currently broadcast processing, Wait for complete.')
+    # Taken before asking so a second /broadcast can't start while this one waits
+    temp.BROADCASTING.add('groups')
+    try:
+        msg = await message.ask('<b>Do you want pin this message in groups?</b>', reply_markup=ReplyKeyboardMarkup([['Yes', 'No']], one_time_keyboard=True, resize_keyboard=True))
+        if msg.text == 'Yes':
+            is_pin = True
+        elif msg.text == 'No':
+            is_pin = False
+        else:
+            return await msg.edit('Wrong Response!')
+        await msg.delete()
+        b_sts = await message.reply_text(text='<b>ʙʀᴏᴀᴅᴄᴀsᴛɪɴɢ ʏᴏᴜʀ ᴍᴇssᴀɢᴇs ᴛᴏ ɢʀᴏᴜᴘs ⏳</b>')
+        await Broadcast(bot, 'groups', message.reply_to_message, is_pin, b_sts).run()
+    finally:
+        temp.BROADCASTING.discard('groups')
 
-    async with lock:
-        async for user in users:
-            time_taken = get_readable_time(time.time()-start_time)
-            if temp.USERS_CANCEL:
-                temp.USERS_CANCEL = False
-                await b_sts.edit(f"Users broadcast Cancelled!\nCompleted in {time_taken}\n\nTotal Users: <code>{total_users}</code>\nCompleted: <code>{done} / {total_users}</code>\nSuccess: <code>{success}</code>")
-                return
-            sts = await users_broadcast(int(user['id']), b_msg, is_pin)
+class Broadcast:
+    """Sends one message to every user or group. BROADCAST_WORKERS sends run at
+    once under the shared broadcast rate limit, dead chats are removed after
+    every batch and progress is checkpointed so a restart resumes it."""
+
+    def __init__(self, bot, kind, b_msg, is_pin, b_sts, after=None, counters=None, elapsed=0):
+        self.bot = bot
+        self.kind = kind
+        self.b_msg = b_msg
+        self.is_pin = is_pin
+        self.b_sts = b_sts
+        self.after = after
+        self.counters = dict.fromkeys(('done', 'success', 'blocked', 'deleted', 'failed'), 0)
+        self.counters.update(counters or {})
+        self.start_time = time.time() - elapsed
+        self.semaphore = asyncio.Semaphore(BROADCAST_WORKERS)
+
+    @property
+    def cancelled(self):
+        return temp.USERS_CANCEL if self.kind == 'users' else temp.GROUPS_CANCEL
+
+    def status(self, total):
+        c = self.counters
+        if self.kind == 'users':
+            return f"Total Users: <code>{total}</code>\nCompleted: <code>{c['done']} / {total}</code>\nSuccess: <code>{c['success']}</code>"
+        return f"Total Groups: <code>{total}</code>\nCompleted: <code>{c['done']} / {total}</code>\nSuccess: <code>{c['success']}</code>\nFailed: <code>{c['failed']}</code>"
+
+    async def checkpoint(self):
+        await db.save_broadcast(self.kind, {
+            'from_chat': self.b_msg.chat.id,
+            'message_id': self.b_msg.id,
+            'is_pin': self.is_pin,
+            'after': self.after,
+            'counters': self.counters,
+            'elapsed': time.time() - self.start_time,
+            'status_chat': self.b_sts.chat.id,
+        })
+
+    async def send(self, chat_id):
+        async with self.semaphore:
+            if self.cancelled:
+                return None
+            if self.kind == 'users':
+                return await users_broadcast(chat_id, self.b_msg, self.is_pin)
+            return await groups_broadcast(chat_id, self.b_msg, self.is_pin)
+
+    async def send_batch(self, batch):
+        ids = [int(doc['id']) for doc in batch]
+        results = await asyncio.gather(*[self.send(chat_id) for chat_id in ids])
+        dead = []
+        c = self.counters
+        for chat_id, sts in zip(ids, results):
+            if sts is None:
+                continue
+            c['done'] += 1
             if sts == 'Success':
-                success += 1
-            elif sts == 'Error':
-                failed += 1
-            done += 1
-            if not done % 80:
-                btn = [[
-                    InlineKeyboardButton('CANCEL', callback_data=f'broadcast_cancel#users')
-                ]]
-                await b_sts.edit(f"Users broadcast in progress...\n\nTotal Users: <code>{total_users}</code>\nCompleted: <code>{done} / {total_users}</code>\nSuccess: <code>{success}</code>", reply_markup=InlineKeyboardMarkup(btn))
-        await b_sts.edit(f"Users broadcast completed.\nCompleted in {time_taken}\n\nTotal Users: <code>{total_users}</code>\nCompleted: <code>{done} / {total_users}</code>\nSuccess: <code>{success}</code>")
+                c['success'] += 1
+            elif sts == 'Blocked':
+                c['blocked'] += 1
+            elif sts == 'Deleted':
+                c['deleted'] += 1
+            else:
+                c['failed'] += 1
+            if self.kind == 'users' and sts in ('Blocked', 'Deleted', 'Invalid'):
+                dead.append(chat_id)
+            elif self.kind == 'groups' and sts == 'Error':
+                dead.append(chat_id)
+        if dead:
+            await (db.delete_users(dead) if self.kind == 'users' else db.delete_chats(dead))
 
-@Client.on_message(filters.command("grp_broadcast") & filters.user(ADMINS) & filters.reply)
-async def broadcast_group(bot, message):
-    msg = await message.ask('<b>Do you want pin this message in groups?</b>', reply_markup=ReplyKeyboardMarkup([['Yes', 'No']], one_time_keyboard=True, resize_keyboard=True))
-    if msg.text == 'Yes':
-        is_pin = True
-    elif msg.text == 'No':
-        is_pin = False
-    else:
-        return await msg.edit('Wrong Response!')
-    await msg.delete()
-    chats = await db.get_all_chats()
-    b_msg = message.reply_to_message
-    b_sts = await message.reply_text(text='<b>ʙʀᴏᴀᴅᴄᴀsᴛɪɴɢ ʏᴏᴜʀ ᴍᴇssᴀɢᴇs ᴛᴏ ɢʀᴏᴜᴘs ⏳</b>')
-    start_time = time.time()
-    total_chats = await db.total_chat_count()
-    done = 0
-    failed = 0
-    success = 0
-    
-    async with lock:
-        async for chat in chats:
-            time_taken = get_readable_time(time.time()-start_time)
-            if temp.GROUPS_CANCEL:
+    async def run(self):
+        temp.BROADCASTING.add(self.kind)
+        if self.kind == 'users':
+            temp.USERS_CANCEL = False
+        else:
+            temp.GROUPS_CANCEL = False
+        btn = [[
+            InlineKeyboardButton('CANCEL', callback_data=f'broadcast_cancel#{self.kind}')
+        ]]
+        title = 'Users' if self.kind == 'users' else 'Groups'
+        try:
+            total = await db.count_broadcast_remaining(self.kind, self.after) + self.counters['done']
+            await self.checkpoint()
+            while not self.cancelled:
+                batch = await db.get_broadcast_batch(self.kind, self.after, BATCH_SIZE)
+                if not batch:
+                    break
+                await self.send_batch(batch)
+                if self.cancelled:
+                    break
+                self.after = batch[-1]['_id']
+                await self.checkpoint()
+                try:
+                    await self.b_sts.edit(f"{title} broadcast in progress...\n\n{self.status(total)}", reply_markup=InlineKeyboardMarkup(btn))
+                except Exception:
+                    pass
+        except Exception as e:
+            logger.exception(f'{title} broadcast failed')
+            await self.b_sts.reply(f'Broadcast stopped due to Error - {e}')
+            return
+        finally:
+            temp.BROADCASTING.discard(self.kind)
+        await db.delete_broadcast(self.kind)
+        time_taken = get_readable_time(time.time()-self.start_time)
+        if self.cancelled:
+            if self.kind == 'users':
+                temp.USERS_CANCEL = False
+            else:
                 temp.GROUPS_CANCEL = False
-                await b_sts.edit(f"Groups broadcast Cancelled!\nCompleted in {time_taken}\n\nTotal Groups: <code>{total_chats}</code>\nCompleted: <code>{done} / {total_chats}</code>\nSuccess: <code>{success}</code>\nFailed: <code>{failed}</code>")
-                return
-            sts = await groups_broadcast(int(chat['id']), b_msg, is_pin)
-            if sts == 'Success':
-                success += 1
-            elif sts == 'Error':
-                failed += 1
-            done += 1
-            if not done % 30:
-                btn = [[
-                    InlineKeyboardButton('CANCEL', callback_data=f'broadcast_cancel#groups')
-                ]]
-                await b_sts.edit(f"Groups groadcast in progress...\n\nTotal Groups: <code>{total_chats}</code>\nCompleted: <code>{done} / {total_chats}</code>\nSuccess: <code>{success}</code>\nFailed: <code>{failed}</code>", reply_markup=InlineKeyboardMarkup(btn))    
-        await b_sts.edit(f"Groups broadcast completed.\nCompleted in {time_taken}\n\nTotal Groups: <code>{total_chats}</code>\nCompleted: <code>{done} / {total_chats}</code>\nSuccess: <code>{success}</code>\nFailed: <code>{failed}</code>")
\ No newline at end of file
+            await self.b_sts.edit(f"{title} broadcast Cancelled!\nCompleted in {time_taken}\n\n{self.status(total)}")
+        else:
+            await self.b_sts.edit(f"{title} broadcast completed.\nCompleted in {time_taken}\n\n{self.status(total)}")
+
+async def resume_broadcasts(bot):
+    """Restart the broadcasts that were running when the bot stopped"""
+    for job in await db.get_broadcasts():
+        try:
+            b_msg = await bot.get_messages(job['from_chat'], job['message_id'])
+            b_sts = await bot.send_message(job['status_chat'], f"<b>Resuming {job['_id']} broadcast after <code>{job['counters']['done']}</code> chats...</b>")
+        except Exception:
+            logger.exception(f"Can't resume {job['_id']} broadcast")
+            continue
+        asyncio.create_task(Broadcast(bot, job['_id'], b_msg, job['is_pin'], b_sts, job['after'], job['counters'], job['elapsed']).run())
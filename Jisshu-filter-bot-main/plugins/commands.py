@@ -16,7 +16,7 @@ from database.config_db import mdb
 from database.topdb import JsTopDB
 from database.jsreferdb import referdb
 from plugins.pm_filter import auto_filter
-from utils import formate_file_name,  get_settings, save_group_settings, is_req_subscribed, is_subscribed, get_size, get_shortlink, is_check_admin, get_status, temp, get_readable_time, save_default_settings
+from utils import formate_file_name,  get_settings, save_group_settings, is_req_subscribed, is_subscribed, get_size, get_shortlink, is_check_admin, get_status, temp, get_readable_time, save_default_settings, send_files, scheduler
 import re
 import base64
 from info import *
@@ -40,10 +40,11 @@ async def start(client:Client, message):
             await message.reply("<b>ʟɪɴᴋ ᴇxᴘɪʀᴇᴅ ᴛʀʏ ᴀɢᴀɪɴ...</b>")
             return  
         ist_timezone = pytz.timezone('Asia/Kolkata')
-        if await db.user_verified(user_id):
+        status = await db.get_verify_status(user_id, settings.get('verify_time', TWO_VERIFY_GAP), settings.get('third_verify_time', THREE_VERIFY_GAP))
+        if status['second_verified']:
             key = "third_time_verified"
         else:
-            key = "second_time_verified" if await db.is_user_verified(user_id) else "last_verified"
+            key = "second_time_verified" if status['verified'] else "last_verified"
         current_time = dt.now(tz=ist_timezone)
         result = await db.update_notcopy_user(user_id, {key:current_time})
         await db.update_verify_id_info(user_id, verify_id, {"verified":True})
@@ -74,9 +75,7 @@ async def start(client:Client, message):
     if message.chat.type in [enums.ChatType.GROUP, enums.ChatType.SUPERGROUP]:
         status = get_status()
         aks=await message.reply_text(f"<b>🔥 ʏᴇs {status},\nʜᴏᴡ ᴄᴀɴ ɪ ʜᴇʟᴘ ʏᴏᴜ??</b>")
-        await asyncio.sleep(600)
-        await aks.delete()
-        await m.delete()
+        await scheduler.delete_later(600, aks, m)
         if not await db.get_chat(message.chat.id):
             total=await client.get_chat_members_count(message.chat.id)
             group_link = await message.chat.export_invite_link()
@@ -241,14 +240,15 @@ async def start(client:Client, message):
             return        
             
     user_id = m.from_user.id
-    if not await db.has_premium_access(user_id):
-        grp_id = int(grp_id)
+    grp_id = int(grp_id)
+    settings = await get_settings(grp_id)
+    status = await db.get_verify_status(user_id, settings.get('verify_time', TWO_VERIFY_GAP), settings.get('third_verify_time', THREE_VERIFY_GAP))
+    if not status['premium']:
         print(f"Group Id - {grp_id}")
-        user_verified = await db.is_user_verified(user_id)
-        settings = await get_settings(grp_id)
+        user_verified = status['verified']
         print(f"Id Settings - {settings}")
-        is_second_shortener = await db.use_second_shortener(user_id, settings.get('verify_time', TWO_VERIFY_GAP)) 
-        is_third_shortener = await db.use_third_shortener(user_id, settings.get('third_verify_time', THREE_VERIFY_GAP))
+        is_second_shortener = status['second_shortener']
+        is_third_shortener = status['third_shortener']
         if settings.get("is_verify", IS_VERIFY) and not user_verified or is_second_shortener or is_third_shortener:
             verify_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=7))
             await db.create_verify_id(user_id, verify_id)
@@ -268,7 +268,7 @@ async def start(client:Client, message):
                 InlineKeyboardButton(text="😁 ʙᴜʏ sᴜʙsᴄʀɪᴘᴛɪᴏɴ - ɴᴏ ɴᴇᴇᴅ ᴛᴏ ᴠᴇʀɪғʏ 😁", callback_data='getpremium'),
             ]]
             reply_markup=InlineKeyboardMarkup(buttons)
-            if await db.user_verified(user_id): 
+            if status['second_verified']: 
                 msg = script.THIRDT_VERIFICATION_TEXT
             else:            
                 msg = script.SECOND_VERIFICATION_TEXT if is_second_shortener else script.VERIFICATION_TEXT
@@ -278,9 +278,7 @@ async def start(client:Client, message):
                 reply_markup=reply_markup,
                 parse_mode=enums.ParseMode.HTML
             )
-            await asyncio.sleep(300) 
-            await d.delete()
-            await m.delete()
+            await scheduler.delete_later(300, d, m)
             return
 
     if data and data.startswith("allfiles"):
@@ -289,42 +287,21 @@ async def start(client:Client, message):
         if not files:
             await message.reply_text("<b>⚠️ ᴀʟʟ ꜰɪʟᴇs ɴᴏᴛ ꜰᴏᴜɴᴅ ⚠️</b>")
             return
-        files_to_delete = []
-        for file in files:
-            user_id = message.from_user.id 
-            grp_id = temp.CHAT.get(user_id)
-            settings = await get_settings(grp_id)
-            CAPTION = settings['caption']
-            f_caption = CAPTION.format(
-                file_name=formate_file_name(file.file_name),
-                file_size=get_size(file.file_size),
-                file_caption=file.caption
-            )
-            btn = [[
-                InlineKeyboardButton("✛ ᴡᴀᴛᴄʜ & ᴅᴏᴡɴʟᴏᴀᴅ ✛", callback_data=f'stream#{file.file_id}')                
-            ]]
-            toDel = await client.send_cached_media(
-                chat_id=message.from_user.id,
-                file_id=file.file_id,
-                caption=f_caption,
-                reply_markup=InlineKeyboardMarkup(btn)
-            )
-            files_to_delete.append(toDel)
-
+        settings = await get_settings(temp.CHAT.get(message.from_user.id))
+        files_to_delete = await send_files(client, message.from_user.id, files, settings['caption'])
         delCap = "<i>ᴀʟʟ {} ꜰɪʟᴇꜱ ᴡɪʟʟ ʙᴇ ᴅᴇʟᴇᴛᴇᴅ ᴀꜰᴛᴇʀ {} ᴛᴏ ᴀᴠᴏɪᴅ ᴄᴏᴘʏʀɪɢʜᴛ ᴠɪᴏʟᴀᴛɪᴏɴs!</i>".format(len(files_to_delete), f'{FILE_AUTO_DEL_TIMER / 60} ᴍɪɴᴜᴛᴇs' if FILE_AUTO_DEL_TIMER >= 60 else f'{FILE_AUTO_DEL_TIMER} sᴇᴄᴏɴᴅs')
         afterDelCap = "<i>ᴀʟʟ {} ꜰɪʟᴇꜱ ᴀʀᴇ ᴅᴇʟᴇᴛᴇᴅ ᴀꜰᴛᴇʀ {} ᴛᴏ ᴀᴠᴏɪᴅ ᴄᴏᴘʏʀɪɢʜᴛ ᴠɪᴏʟᴀᴛɪᴏɴs!</i>".format(len(files_to_delete), f'{FILE_AUTO_DEL_TIMER / 60} ᴍɪɴᴜᴛᴇs' if FILE_AUTO_DEL_TIMER >= 60 else f'{FILE_AUTO_DEL_TIMER} sᴇᴄᴏɴᴅs')
         replyed = await message.reply(
             delCap
         )
-        await asyncio.sleep(FILE_AUTO_DEL_TIMER)
-        for file in files_to_delete:
-            try:
-                await file.delete()
-            except:
-                pass
-        return await replyed.edit(
-            afterDelCap,
+        await scheduler.schedule_delete(
+            message.from_user.id,
+            [file.id for file in files_to_delete],
+            FILE_AUTO_DEL_TIMER,
+            edit_id=replyed.id,
+            edit_text=afterDelCap
         )
+        return
     if not data:
         return
 
@@ -354,9 +331,13 @@ async def start(client:Client, message):
     replyed = await message.reply(
         delCap,
         reply_to_message_id= toDel.id)
-    await asyncio.sleep(FILE_AUTO_DEL_TIMER)
-    await toDel.delete()
-    return await replyed.edit(afterDelCap)
+    await scheduler.schedule_delete(
+        toDel.chat.id,
+        [toDel.id],
+        FILE_AUTO_DEL_TIMER,
+        edit_id=replyed.id,
+        edit_text=afterDelCap
+    )
     
 
 @Client.on_message(filters.command('delete'))
@@ -866,8 +847,7 @@ async def all_settings(client, message):
     ]]
     reply_markup=InlineKeyboardMarkup(btn)
     dlt=await message.reply_text(text, reply_markup=reply_markup, disable_web_page_preview=True)
-    await asyncio.sleep(300)
-    await dlt.delete()
+    await scheduler.delete_later(300, dlt)
 
 
 @Client.on_message(filters.command('set_time_2'))
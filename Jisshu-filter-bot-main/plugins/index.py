@@ -2,33 +2,39 @@ import asyncio
 from pyrogram import Client, filters, enums
 from pyrogram.errors import FloodWait
 from pyrogram.errors.exceptions.bad_request_400 import ChannelInvalid, ChatAdminRequired, UsernameInvalid, UsernameNotModified
-from info import ADMINS, LOG_CHANNEL, CHANNELS
-from database.ia_filterdb import save_file
+from info import ADMINS, LOG_CHANNEL, CHANNELS, INDEX_CONCURRENCY
+from database.ia_filterdb import save_files
+from database.users_chats_db import db
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from utils import temp, get_readable_time
+import logging
 import time
 
-lock = asyncio.Lock()
+logger = logging.getLogger(__name__)
+
+# Files saved per insert_many and seconds between progress edits
+BATCH_SIZE = 200
+PROGRESS_INTERVAL = 10
 
 @Client.on_callback_query(filters.regex(r'^index'))
 async def index_files(bot, query):
     _, ident, chat, lst_msg_id, skip = query.data.split("#")
+    try:
+        chat = int(chat)
+    except:
+        chat = chat
     if ident == 'yes':
         msg = query.message
+        if chat in temp.INDEXING:
+            return await msg.edit('This channel is already being indexed.')
         await msg.edit("<b>Indexing started...</b>")
-        try:
-            chat = int(chat)
-        except:
-            chat = chat
-        await index_files_to_db(int(lst_msg_id), chat, msg, bot, int(skip))
+        await IndexJob(bot, chat, int(lst_msg_id), int(skip), msg).run()
     elif ident == 'cancel':
-        temp.CANCEL = True
+        temp.INDEX_CANCEL.add(chat)
         await query.message.edit("Trying to cancel Indexing...")
 
 @Client.on_message(filters.command('index') & filters.private & filters.incoming & filters.user(ADMINS))
 async def send_for_index(bot, message):
-    if lock.locked():
-        return await message.reply('Wait until previous process complete.')
     i = await message.reply("Forward last message or send last message link.")
     msg = await bot.listen(chat_id=message.chat.id, user_id=message.from_user.id)
     await i.delete()
@@ -54,6 +60,8 @@ async def send_for_index(bot, message):
         return await message.reply(f'Errors - {e}')
     if chat.type != enums.ChatType.CHANNEL:
         return await message.reply("I can index only channels.")
+    if chat_id in temp.INDEXING:
+        return await message.reply('Wait until previous process complete.')
     s = await message.reply("Send skip message number.")
     msg = await bot.listen(chat_id=message.chat.id, user_id=message.from_user.id)
     await s.delete()
@@ -84,59 +92,141 @@ async def channel_info(bot, message):
     text += f'\n**Total:** {len(ids)}'
     await message.reply(text)
 
-async def index_files_to_db(lst_msg_id, chat, msg, bot, skip):
-    start_time = time.time()
-    total_files = 0
-    duplicate = 0
-    errors = 0
-    deleted = 0
-    no_media = 0
-    unsupported = 0
-    current = skip
-    
-    async with lock:
+def index_semaphore():
+    # Kept on temp, plugins are imported twice and must share one limit
+    if temp.INDEX_SEMAPHORE is None:
+        temp.INDEX_SEMAPHORE = asyncio.Semaphore(INDEX_CONCURRENCY)
+    return temp.INDEX_SEMAPHORE
+
+class IndexJob:
+    """Indexes one channel. Progress is checkpointed to the database after
+    every saved batch so an interrupted job resumes where it stopped."""
+
+    def __init__(self, bot, chat, lst_msg_id, current, msg, counters=None):
+        self.bot = bot
+        self.chat = chat
+        self.lst_msg_id = lst_msg_id
+        self.skip = current
+        self.current = current
+        self.msg = msg
+        self.counters = dict.fromkeys(('total_files', 'duplicate', 'errors', 'deleted', 'no_media', 'unsupported'), 0)
+        self.counters.update(counters or {})
+        self.batch = []
+        self.saving = None
+        self.start_time = time.time()
+
+    def status(self):
+        c = self.counters
+        return f"Duplicate Files Skipped: <code>{c['duplicate']}</code>\nDeleted Messages Skipped: <code>{c['deleted']}</code>\nNon-Media messages skipped: <code>{c['no_media'] + c['unsupported']}</code>\nUnsupported Media: <code>{c['unsupported']}</code>\nErrors Occurred: <code>{c['errors']}</code>"
+
+    async def checkpoint(self, current, counters):
+        await db.save_index_job(self.chat, {
+            'lst_msg_id': self.lst_msg_id,
+            'current': current,
+            'counters': counters,
+            'status_chat': self.msg.chat.id,
+        })
+
+    async def save_batch(self, medias, current, counters):
+        saved, duplicate, errors = await save_files(medias)
+        self.counters['total_files'] += saved
+        self.counters['duplicate'] += duplicate
+        self.counters['errors'] += errors
+        counters.update({key: self.counters[key] for key in ('total_files', 'duplicate', 'errors')})
+        await self.checkpoint(current, counters)
+
+    async def flush(self):
+        # One insert_many is kept in flight while the next batch is fetched
+        if self.saving:
+            await self.saving
+        self.saving = asyncio.create_task(self.save_batch(self.batch, self.current, dict(self.counters)))
+        self.batch = []
+
+    async def show_progress(self):
+        btn = [[
+            InlineKeyboardButton('CANCEL', callback_data=f'index#cancel#{self.chat}#{self.lst_msg_id}#{self.skip}')
+        ]]
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            try:
+                await self.msg.edit_text(text=f"Total messages received: <code>{self.current}</code>\nTotal messages saved: <code>{self.counters['total_files']}</code>\n{self.status()}", reply_markup=InlineKeyboardMarkup(btn))
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+            except Exception:
+                pass
+
+    async def index(self):
+        """One pass from the last checkpoint, False if it was cancelled"""
+        c = self.counters
+        async for message in self.bot.iter_messages(self.chat, self.lst_msg_id, self.current):
+            if self.chat in temp.INDEX_CANCEL:
+                return False
+            self.current += 1
+            if message.empty:
+                c['deleted'] += 1
+                continue
+            elif not message.media:
+                c['no_media'] += 1
+                continue
+            elif message.media not in [enums.MessageMediaType.VIDEO, enums.MessageMediaType.DOCUMENT]:
+                c['unsupported'] += 1
+                continue
+            media = getattr(message, message.media.value, None)
+            if not media:
+                c['unsupported'] += 1
+                continue
+            elif media.mime_type not in ['video/mp4', 'video/x-matroska']:
+                c['unsupported'] += 1
+                continue
+            media.caption = message.caption
+            self.batch.append(media)
+            if len(self.batch) >= BATCH_SIZE:
+                await self.flush()
+        return True
+
+    async def run(self):
+        temp.INDEXING.add(self.chat)
+        await self.checkpoint(self.current, dict(self.counters))
+        progress = asyncio.create_task(self.show_progress())
         try:
-            async for message in bot.iter_messages(chat, lst_msg_id, skip):
-                time_taken = get_readable_time(time.time()-start_time)
-                if temp.CANCEL:
-                    temp.CANCEL = False
-                    await msg.edit(f"Successfully Cancelled!\nCompleted in {time_taken}\n\nSaved <code>{total_files}</code> files to Database!\nDuplicate Files Skipped: <code>{duplicate}</code>\nDeleted Messages Skipped: <code>{deleted}</code>\nNon-Media messages skipped: <code>{no_media + unsupported}</code>\nUnsupported Media: <code>{unsupported}</code>\nErrors Occurred: <code>{errors}</code>")
-                    return
-                current += 1
-                if current % 100 == 0:
-                    btn = [[
-                        InlineKeyboardButton('CANCEL', callback_data=f'index#cancel#{chat}#{lst_msg_id}#{skip}')
-                    ]]
-                    await msg.edit_text(text=f"Total messages received: <code>{current}</code>\nTotal messages saved: <code>{total_files}</code>\nDuplicate Files Skipped: <code>{duplicate}</code>\nDeleted Messages Skipped: <code>{deleted}</code>\nNon-Media messages skipped: <code>{no_media + unsupported}</code>\nUnsupported Media: <code>{unsupported}</code>\nErrors Occurred: <code>{errors}</code>", reply_markup=InlineKeyboardMarkup(btn))
-                    await asyncio.sleep(2)
-                if message.empty:
-                    deleted += 1
-                    continue
-                elif not message.media:
-                    no_media += 1
-                    continue
-                elif message.media not in [enums.MessageMediaType.VIDEO, enums.MessageMediaType.DOCUMENT]:
-                    unsupported += 1
-                    continue
-                media = getattr(message, message.media.value, None)
-                if not media:
-                    unsupported += 1
-                    continue
-                elif media.mime_type not in ['video/mp4', 'video/x-matroska']:
-                    unsupported += 1
-                    continue
-                media.caption = message.caption
-                sts = await save_file(media)
-                if sts == 'suc':
-                    total_files += 1
-                elif sts == 'dup':
-                    duplicate += 1
-                elif sts == 'err':
-                    errors += 1
-        except FloodWait as e:
-            await asyncio.sleep(e.x)
+            async with index_semaphore():
+                while True:
+                    try:
+                        completed = await self.index()
+                        await self.flush()
+                        await self.saving
+                        break
+                    except FloodWait as e:
+                        # Drop the unsaved tail and carry on from the last checkpoint
+                        if self.saving:
+                            await self.saving
+                        job = await db.get_index_job(self.chat)
+                        self.current, self.counters = job['current'], job['counters']
+                        self.batch, self.saving = [], None
+                        await asyncio.sleep(e.value)
         except Exception as e:
-            await msg.reply(f'Index canceled due to Error - {e}')
+            # Not retried on restart, it would most likely fail the same way
+            logger.exception(f'Indexing {self.chat} failed')
+            await db.delete_index_job(self.chat)
+            await self.msg.reply(f'Index canceled due to Error - {e}')
+            return
+        finally:
+            progress.cancel()
+            temp.INDEXING.discard(self.chat)
+            temp.INDEX_CANCEL.discard(self.chat)
+        await db.delete_index_job(self.chat)
+        time_taken = get_readable_time(time.time()-self.start_time)
+        if completed:
+            await self.msg.edit(f"Succesfully saved <code>{self.counters['total_files']}</code> to Database!\nCompleted in {time_taken}\n\n{self.status()}")
         else:
-            time_taken = get_readable_time(time.time()-start_time)
-            await msg.edit(f'Succesfully saved <code>{total_files}</code> to Database!\nCompleted in {time_taken}\n\nDuplicate Files Skipped: <code>{duplicate}</code>\nDeleted Messages Skipped: <code>{deleted}</code>\nNon-Media messages skipped: <code>{no_media + unsupported}</code>\nUnsupported Media: <code>{unsupported}</code>\nErrors Occurred: <code>{errors}</code>')
\ No newline at end of file
+            await self.msg.edit(f"Successfully Cancelled!\nCompleted in {time_taken}\n\nSaved <code>{self.counters['total_files']}</code> files to Database!\n{self.status()}")
+
+async def resume_index_jobs(bot):
+    """Restart the indexing jobs that were running when the bot stopped"""
+    for job in await db.get_index_jobs():
+        try:
+            msg = await bot.send_message(job['status_chat'], f"<b>Resuming indexing from message <code>{job['current']}</code>...</b>")
+        except Exception:
+            logger.exception(f"Can't resume indexing {job['_id']}")
+            continue
+        asyncio.create_task(IndexJob(bot, job['_id'], job['lst_msg_id'], job['current'], msg, job['counters']).run())
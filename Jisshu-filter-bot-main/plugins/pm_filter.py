@@ -8,13 +8,13 @@ from info import * #SUBSCRIPTION, PAYPICS, START_IMG, SETTINGS, URL, STICKERS_ID
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, InputMediaPhoto, ChatPermissions, WebAppInfo, InputMediaAnimation, InputMediaPhoto
 from pyrogram import Client, filters, enums
 from pyrogram.errors import * #FloodWait, UserIsBlocked, MessageNotModified, PeerIdInvalid, ChatAdminRequired
-from utils import temp, get_settings, is_check_admin, get_status, get_size, save_group_settings, is_req_subscribed, get_poster, get_status, get_readable_time , imdb , formate_file_name
+from utils import temp, get_settings, is_check_admin, get_status, get_size, save_group_settings, is_req_subscribed, get_poster, get_status, get_readable_time , imdb , formate_file_name, scheduler
 from database.users_chats_db import db
-from database.ia_filterdb import Media, get_search_results, get_bad_files, get_file_details
+from database.ia_filterdb import Media, get_search_results, get_bad_files, get_file_details, tokenize
+from database.spell_index import spell_index
 import random
 lock = asyncio.Lock()
 import traceback
-from fuzzywuzzy import process
 BUTTONS = {}
 FILES_ID = {}
 CAP = {}
@@ -59,8 +59,7 @@ async def group_search(client, message):
             files, n_offset, total = await get_search_results(message.text, offset=0)
             if total != 0:
                 msg = await message.reply_text(script.SUPPORT_GRP_MOVIE_TEXT.format(message.from_user.mention(), total), reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton('ɢᴇᴛ ғɪʟᴇs ғʀᴏᴍ ʜᴇʀᴇ 😉' , url=MOVIE_GROUP_LINK)]]))
-                await asyncio.sleep(300)
-                return await msg.delete()
+                return await scheduler.delete_later(300, msg)
             else: 
                 return
         except Exception as e:
@@ -114,12 +113,7 @@ async def group_search(client, message):
 
     else:
         k=await message.reply_text('<b>⚠️ ᴀᴜᴛᴏ ꜰɪʟᴛᴇʀ ᴍᴏᴅᴇ ɪꜱ ᴏғғ...</b>')
-        await asyncio.sleep(10)
-        await k.delete()
-        try:
-            await message.delete()
-        except:
-            pass
+        await scheduler.delete_later(10, k, message)
 
 @Client.on_callback_query(filters.regex(r"^reffff"))
 async def refercall(bot, query):
@@ -273,10 +267,6 @@ async def seasons_cb_handler(client: Client, query: CallbackQuery):
 async def season_search(client: Client, query: CallbackQuery):
     _, season, key, offset, orginal_offset, req = query.data.split("#")
     seas = int(season.split(' ' , 1)[1])
-    if seas < 10:
-        seas = f'S0{seas}'
-    else:
-        seas = f'S{seas}'
     
     if int(req) != query.from_user.id:
         return await query.answer(script.ALRT_TXT, show_alert=True)	
@@ -287,23 +277,14 @@ async def season_search(client: Client, query: CallbackQuery):
         await query.answer(script.OLD_ALRT_TXT.format(query.from_user.first_name),show_alert=True)
         return 
     search = search.replace("_", " ")
-    files, n_offset, total = await get_search_results(f"{search} {seas}", max_results=int(MAX_BTN), offset=offset)
-    files2, n_offset2, total2 = await get_search_results(f"{search} {season}", max_results=int(MAX_BTN), offset=offset)
-    total += total2
+    files, n_offset, total = await get_search_results(search, max_results=int(MAX_BTN), offset=offset, season=seas)
     try:
         n_offset = int(n_offset)
     except:
-        try: 
-            n_offset = int(n_offset2)
-        except : 
-            n_offset = 0
-    files = [file for file in files if re.search(seas, file.file_name, re.IGNORECASE)]
-    
+        n_offset = 0
     if not files:
-        files = [file for file in files2 if re.search(season, file.file_name, re.IGNORECASE)]
-        if not files:
-            await query.answer(f"sᴏʀʀʏ {season.title()} ɴᴏᴛ ғᴏᴜɴᴅ ғᴏʀ {search}", show_alert=1)
-            return
+        await query.answer(f"sᴏʀʀʏ {season.title()} ɴᴏᴛ ғᴏᴜɴᴅ ғᴏʀ {search}", show_alert=1)
+        return
 
     temp.FILES_ID[key] = files
     reqnxt = query.from_user.id if query.from_user else 0
@@ -393,12 +374,11 @@ async def year_search(client: Client, query: CallbackQuery):
         await query.answer(script.OLD_ALRT_TXT.format(query.from_user.first_name),show_alert=True)
         return 
     search = search.replace("_", " ")
-    files, n_offset, total = await get_search_results(f"{search} {year}", max_results=int(MAX_BTN), offset=offset)
+    files, n_offset, total = await get_search_results(search, max_results=int(MAX_BTN), offset=offset, year=year)
     try:
         n_offset = int(n_offset)
     except:
         n_offset = 0
-    files = [file for file in files if re.search(year, file.file_name, re.IGNORECASE)]
     if not files:
         await query.answer(f"sᴏʀʀʏ ʏᴇᴀʀ {year.title()} ɴᴏᴛ ғᴏᴜɴᴅ ғᴏʀ {search}", show_alert=1)
         return
@@ -491,12 +471,11 @@ async def quality_search(client: Client, query: CallbackQuery):
         await query.answer(script.OLD_ALRT_TXT.format(query.from_user.first_name),show_alert=True)
         return 
     search = search.replace("_", " ")
-    files, n_offset, total = await get_search_results(f"{search} {qul}", max_results=int(MAX_BTN), offset=offset)
+    files, n_offset, total = await get_search_results(search, max_results=int(MAX_BTN), offset=offset, quality=qul)
     try:
         n_offset = int(n_offset)
     except:
         n_offset = 0
-    files = [file for file in files if re.search(qul, file.file_name, re.IGNORECASE)]
     if not files:
         await query.answer(f"sᴏʀʀʏ ǫᴜᴀʟɪᴛʏ {qul.title()} ɴᴏᴛ ғᴏᴜɴᴅ ғᴏʀ {search}", show_alert=1)
         return
@@ -580,7 +559,6 @@ async def languages_cb_handler(client: Client, query: CallbackQuery):
 @Client.on_callback_query(filters.regex(r"^lang_search#"))
 async def lang_search(client: Client, query: CallbackQuery):
     _, lang, key, offset, orginal_offset, req = query.data.split("#")
-    lang2 = lang[:3]
     if int(req) != query.from_user.id:
         return await query.answer(script.ALRT_TXT, show_alert=True)	
     offset = int(offset)
@@ -590,21 +568,13 @@ async def lang_search(client: Client, query: CallbackQuery):
         await query.answer(script.OLD_ALRT_TXT.format(query.from_user.first_name),show_alert=True)
         return 
     search = search.replace("_", " ")
-    files, n_offset, total = await get_search_results(f"{search} {lang}", max_results=int(MAX_BTN), offset=offset)
-    files2, n_offset2, total2 = await get_search_results(f"{search} {lang2}", max_results=int(MAX_BTN), offset=offset)
-    total += total2
+    files, n_offset, total = await get_search_results(search, max_results=int(MAX_BTN), offset=offset, lang=lang)
     try:
         n_offset = int(n_offset)
     except:
-        try: 
-            n_offset = int(n_offset2)
-        except : 
-            n_offset = 0
-    files = [file for file in files if re.search(lang, file.file_name, re.IGNORECASE)]
+        n_offset = 0
     if not files:
-        files = [file for file in files2 if re.search(lang2, file.file_name, re.IGNORECASE)]
-        if not files:
-            return await query.answer(f"sᴏʀʀʏ ʟᴀɴɢᴜᴀɢᴇ {lang.title()} ɴᴏᴛ ғᴏᴜɴᴅ ғᴏʀ {search}", show_alert=1)
+        return await query.answer(f"sᴏʀʀʏ ʟᴀɴɢᴜᴀɢᴇ {lang.title()} ɴᴏᴛ ғᴏᴜɴᴅ ғᴏʀ {search}", show_alert=1)
 
     temp.FILES_ID[key] = files    
     reqnxt = query.from_user.id if query.from_user else 0
@@ -677,12 +647,7 @@ async def advantage_spoll_choker(bot, query):
         await auto_filter(bot, query, k)
     else:
         k = await query.message.edit(script.NO_RESULT_TXT)
-        await asyncio.sleep(60)
-        await k.delete()
-        try:
-            await query.message.reply_to_message.delete()
-        except:
-            pass
+        await scheduler.delete_later(60, k, query.message.reply_to_message)
 
 @Client.on_callback_query(filters.regex(r"^cfiles"))
 async def pmfile_cb(client, query):
@@ -1136,8 +1101,7 @@ async def cb_handler(client: Client, query: CallbackQuery):
             ]]
             reply_markup = InlineKeyboardMarkup(buttons)
             d = await query.message.edit_reply_markup(reply_markup)
-            await asyncio.sleep(300)
-            await d.delete()
+            await scheduler.delete_later(300, d)
         else:
             await query.message.edit_text("<b>ꜱᴏᴍᴇᴛʜɪɴɢ ᴡᴇɴᴛ ᴡʀᴏɴɢ</b>")
             
@@ -1388,22 +1352,12 @@ async def cb_handler(client: Client, query: CallbackQuery):
         return
 	    
 async def ai_spell_check(wrong_name):
-    async def search_movie(wrong_name):
-        search_results = imdb.search_movie(wrong_name)
-        movie_list = [movie['title'] for movie in search_results]
-        return movie_list
-    movie_list = await search_movie(wrong_name)
-    if not movie_list:
+    movie = spell_index.correct(tokenize(wrong_name))
+    if not movie:
         return
-    for _ in range(5):
-        closest_match = process.extractOne(wrong_name, movie_list)
-        if not closest_match or closest_match[1] <= 80:
-            return 
-        movie = closest_match[0]
-        files, offset, total_results = await get_search_results(movie)
-        if files:
-            return movie
-        movie_list.remove(movie)
+    files, offset, total_results = await get_search_results(movie)
+    if files:
+        return movie
     return
 	
 async def auto_filter(client, msg, spoll=False , pm_mode = False):
@@ -1544,12 +1498,7 @@ async def auto_filter(client, msg, spoll=False , pm_mode = False):
             if settings['auto_delete']:
                 k = await message.reply_photo(photo=imdb.get('poster'), caption=cap[:1024] + links + del_msg, parse_mode=enums.ParseMode.HTML, reply_markup=InlineKeyboardMarkup(btn))
               #  await delSticker(st)
-                await asyncio.sleep(DELETE_TIME)
-                await k.delete()
-                try:
-                    await message.delete()
-                except:
-                    pass
+                await scheduler.delete_later(DELETE_TIME, k, message)
             else:
                 await message.reply_photo(photo=imdb.get('poster'), caption=cap[:1024] + links + js_ads, reply_markup=InlineKeyboardMarkup(btn))                    
         except (MediaEmpty, PhotoInvalidDimensions, WebpageMediaEmpty):
@@ -1558,28 +1507,19 @@ async def auto_filter(client, msg, spoll=False , pm_mode = False):
             if settings["auto_delete"]:
                 k = await message.reply_photo(photo=poster, caption=cap[:1024] + links + js_ads, parse_mode=enums.ParseMode.HTML, reply_markup=InlineKeyboardMarkup(btn))
                 #await delSticker(st)
-                await asyncio.sleep(DELETE_TIME)
-                await k.delete()
-                try:
-                    await message.delete()
-                except:
-                    pass
+                await scheduler.delete_later(DELETE_TIME, k, message)
             else:
                 await message.reply_photo(photo=poster, caption=cap[:1024] + links + js_ads, parse_mode=enums.ParseMode.HTML, reply_markup=InlineKeyboardMarkup(btn))
         except Exception as e:
             print(e)
             if settings["auto_delete"]:
                 #await delSticker(st)
+                k = None
                 try:
                     k = await message.reply_text(cap + links + js_ads, parse_mode=enums.ParseMode.HTML, reply_markup=InlineKeyboardMarkup(btn), disable_web_page_preview=True)
                 except Exception as e:
                     print("error", e)
-                await asyncio.sleep(DELETE_TIME)
-                await k.delete()
-                try:
-                    await message.delete()
-                except:
-                    pass
+                await scheduler.delete_later(DELETE_TIME, k, message)
             else:
                 await message.reply_text(cap + links + js_ads, parse_mode=enums.ParseMode.HTML, reply_markup=InlineKeyboardMarkup(btn), disable_web_page_preview=True)
     else:
@@ -1587,61 +1527,17 @@ async def auto_filter(client, msg, spoll=False , pm_mode = False):
        # await delSticker(st)
         if settings['auto_delete']:
           #  await delSticker(st)
-            await asyncio.sleep(DELETE_TIME)
-            await k.delete()
-            try:
-                await message.delete()
-            except:
-                pass
+            await scheduler.delete_later(DELETE_TIME, k, message)
     return 
 
 
 async def advantage_spell_chok(message):
-    mv_id = message.id
+    """Reply that nothing was found. The spell index already had its say in
+    ai_spell_check, so there is no slower IMDb lookup for suggestions"""
     search = message.text
-    chat_id = message.chat.id
-    settings = await get_settings(chat_id)
-    query = re.sub(
-        r"\b(pl(i|e)*?(s|z+|ease|se|ese|(e+)s(e)?)|((send|snd|giv(e)?|gib)(\sme)?)|movie(s)?|new|latest|br((o|u)h?)*|^h(e|a)?(l)*(o)*|mal(ayalam)?|t(h)?amil|file|that|find|und(o)*|kit(t(i|y)?)?o(w)?|thar(u)?(o)*w?|kittum(o)*|aya(k)*(um(o)*)?|full\smovie|any(one)|with\ssubtitle(s)?)",
-        "", message.text, flags=re.IGNORECASE)
-    query = query.strip() + " movie"
-    try:
-        movies = await get_poster(search, bulk=True)
-    except:
-        k = await message.reply(script.I_CUDNT.format(message.from_user.mention))
-        await asyncio.sleep(60)
-        await k.delete()
-        try:
-            await message.delete()
-        except:
-            pass
-        return
-    if not movies:
-        google = search.replace(" ", "+")
-        button = [[
-            InlineKeyboardButton("🔍 ᴄʜᴇᴄᴋ sᴘᴇʟʟɪɴɢ ᴏɴ ɢᴏᴏɢʟᴇ 🔍", url=f"https://www.google.com/search?q={google}")
-        ]]
-        k = await message.reply_text(text=script.I_CUDNT.format(search), reply_markup=InlineKeyboardMarkup(button))
-        await asyncio.sleep(120)
-        await k.delete()
-        try:
-            await message.delete()
-        except:
-            pass
-        return
-    user = message.from_user.id if message.from_user else 0
-    buttons = [[
-        InlineKeyboardButton(text=movie.get('title'), callback_data=f"spol#{movie.movieID}#{user}")
-    ]
-        for movie in movies
-    ]
-    buttons.append(
-        [InlineKeyboardButton(text="🚫 ᴄʟᴏsᴇ 🚫", callback_data='close_data')]
-    )
-    d = await message.reply_text(text=script.CUDNT_FND.format(message.from_user.mention), reply_markup=InlineKeyboardMarkup(buttons), reply_to_message_id=message.id)
-    await asyncio.sleep(120)
-    await d.delete()
-    try:
-        await message.delete()
-    except:
-        pass
+    google = search.replace(" ", "+")
+    button = [[
+        InlineKeyboardButton("🔍 ᴄʜᴇᴄᴋ sᴘᴇʟʟɪɴɢ ᴏɴ ɢᴏᴏɢʟᴇ 🔍", url=f"https://www.google.com/search?q={google}")
+    ]]
+    k = await message.reply_text(text=script.I_CUDNT.format(search), reply_markup=InlineKeyboardMarkup(button))
+    await scheduler.delete_later(120, k, message)
@@ -1,13 +1,17 @@
 import logging
 from pyrogram.errors import InputUserDeactivated, UserNotParticipant, FloodWait, UserIsBlocked, PeerIdInvalid
-from info import AUTH_CHANNEL, LONG_IMDB_DESCRIPTION, IS_VERIFY , START_IMG
+from info import AUTH_CHANNEL, LONG_IMDB_DESCRIPTION, IS_VERIFY , START_IMG, IMDB_WORKERS, FILE_SEND_WORKERS, BROADCAST_RATE
 from imdb import Cinemagoer
 import asyncio
-from pyrogram.types import Message
+from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram import enums
 import pytz, re, os 
+import threading
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor
 from shortzy import Shortzy
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Any
 from database.users_chats_db import db
 
@@ -17,16 +21,22 @@ logger.setLevel(logging.INFO)
 
 BANNED = {}
 imdb = Cinemagoer() 
+imdb_pool = ThreadPoolExecutor(max_workers=IMDB_WORKERS, thread_name_prefix='imdb')
+imdb_local = threading.local()
+imdb_lookups = {}
  
 class temp(object):
     ME = None
     CURRENT=int(os.environ.get("SKIP", 2))
-    CANCEL = False
+    INDEXING = set()
+    INDEX_CANCEL = set()
+    INDEX_SEMAPHORE = None
     U_NAME = None
     B_NAME = None
     B_LINK = None
     SETTINGS = {}
     FILES_ID = {}
+    BROADCASTING = set()
     USERS_CANCEL = False
     GROUPS_CANCEL = False    
     CHAT = {}
@@ -66,38 +76,39 @@ async def is_subscribed(bot, user_id, channel_id):
     return False
 
 
-async def get_poster(query, bulk=False, id=False, file=None):
-    if not id:
-        query = (query.strip()).lower()
-        title = query
-        year = re.findall(r'[1-2]\d{3}$', query, re.IGNORECASE)
-        if year:
-            year = list_to_str(year[:1])
-            title = (query.replace(year, "")).strip()
-        elif file is not None:
-            year = re.findall(r'[1-2]\d{3}', file, re.IGNORECASE)
-            if year:
-                year = list_to_str(year[:1]) 
-        else:
-            year = None
-        movieid = imdb.search_movie(title.lower(), results=10)
-        if not movieid:
-            return None
-        if year:
-            filtered=list(filter(lambda k: str(k.get('year')) == str(year), movieid))
-            if not filtered:
-                filtered = movieid
-        else:
+class ImdbResult(dict):
+    """A cached IMDb search result, used like the Cinemagoer Movie it came from"""
+
+    @property
+    def movieID(self):
+        return self['movieID']
+
+def imdb_client():
+    """Cinemagoer instance of the current IMDb pool thread"""
+    if not hasattr(imdb_local, 'client'):
+        imdb_local.client = Cinemagoer()
+    return imdb_local.client
+
+def imdb_search(title, year):
+    movieid = imdb_client().search_movie(title.lower(), results=10)
+    if not movieid:
+        return []
+    if year:
+        filtered=list(filter(lambda k: str(k.get('year')) == str(year), movieid))
+        if not filtered:
             filtered = movieid
-        movieid=list(filter(lambda k: k.get('kind') in ['movie', 'tv series'], filtered))
-        if not movieid:
-            movieid = filtered
-        if bulk:
-            return movieid
-        movieid = movieid[0].movieID
     else:
-        movieid = query
-    movie = imdb.get_movie(movieid)
+        filtered = movieid
+    movieid=list(filter(lambda k: k.get('kind') in ['movie', 'tv series'], filtered))
+    if not movieid:
+        movieid = filtered
+    return [
+        {'movieID': movie.movieID, 'title': movie.get('title'), 'year': movie.get('year'), 'kind': movie.get('kind')}
+        for movie in movieid
+    ]
+
+def imdb_movie(movieid):
+    movie = imdb_client().get_movie(movieid)
     if movie.get("original air date"):
         date = movie["original air date"]
     elif movie.get("year"):
@@ -144,45 +155,86 @@ async def get_poster(query, bulk=False, id=False, file=None):
         'url':f'https://www.imdb.com/title/tt{movieid}'
     }
 
+async def imdb_fetch(key, func, *args):
+    result = await asyncio.get_running_loop().run_in_executor(imdb_pool, func, *args)
+    await db.set_imdb_cache(key, result)
+    return result
+
+async def imdb_lookup(key, func, *args):
+    """Run a blocking Cinemagoer lookup in the IMDb thread pool. Results are cached
+    in the database and callers asking for the same key at once share one lookup"""
+    cached = await db.get_imdb_cache(key)
+    if cached:
+        return cached['value']
+    task = imdb_lookups.get(key)
+    if task is None:
+        task = asyncio.ensure_future(imdb_fetch(key, func, *args))
+        imdb_lookups[key] = task
+
+        def done(t):
+            imdb_lookups.pop(key, None)
+            if not t.cancelled():
+                t.exception()
+
+        task.add_done_callback(done)
+    return await asyncio.shield(task)
+
+async def get_poster(query, bulk=False, id=False, file=None):
+    if not id:
+        query = (query.strip()).lower()
+        title = query
+        year = re.findall(r'[1-2]\d{3}$', query, re.IGNORECASE)
+        if year:
+            year = list_to_str(year[:1])
+            title = (query.replace(year, "")).strip()
+        elif file is not None:
+            year = re.findall(r'[1-2]\d{3}', file, re.IGNORECASE)
+            if year:
+                year = list_to_str(year[:1]) 
+        else:
+            year = None
+        title = ' '.join(title.split())
+        movieid = await imdb_lookup(f"search_{title}_{year or ''}", imdb_search, title, year)
+        if not movieid:
+            return None
+        if bulk:
+            return [ImdbResult(movie) for movie in movieid]
+        movieid = movieid[0]['movieID']
+    else:
+        movieid = query
+    return await imdb_lookup(f"movie_{movieid}", imdb_movie, movieid)
+
 async def users_broadcast(user_id, message, is_pin):
+    """Copy a broadcast message to a user. Blocked, Deleted and Invalid users
+    can be removed from the database by the caller"""
     try:
-        m=await message.copy(chat_id=user_id)
+        m = await send_limited(user_id, lambda: message.copy(chat_id=user_id), broadcast_bucket)
         if is_pin:
-            await m.pin(both_sides=True)
-        return True, "Success"
-    except FloodWait as e:
-        await asyncio.sleep(e.x)
-        return await users_broadcast(user_id, message)
+            await send_limited(user_id, lambda: m.pin(both_sides=True), broadcast_bucket)
+        return "Success"
     except InputUserDeactivated:
-        await db.delete_user(int(user_id))
         logging.info(f"{user_id}-Removed from Database, since deleted account.")
-        return False, "Deleted"
+        return "Deleted"
     except UserIsBlocked:
-        await db.delete_user(int(user_id))
         logging.info(f"{user_id} - Removed from Database, since Blocked the bot.")
-        await db.delete_user(user_id)
-        return False, "Blocked"
+        return "Blocked"
     except PeerIdInvalid:
-        await db.delete_user(int(user_id))
         logging.info(f"{user_id} - PeerIdInvalid")
-        return False, "Error"
+        return "Invalid"
     except Exception as e:
-        return False, "Error"
+        return "Error"
 
 async def groups_broadcast(chat_id, message, is_pin):
+    """Copy a broadcast message to a group, Error groups can be removed by the caller"""
     try:
-        m = await message.copy(chat_id=chat_id)
+        m = await send_limited(chat_id, lambda: message.copy(chat_id=chat_id), broadcast_bucket)
         if is_pin:
             try:
-                await m.pin()
+                await send_limited(chat_id, lambda: m.pin(), broadcast_bucket)
             except:
                 pass
         return "Success"
-    except FloodWait as e:
-        await asyncio.sleep(e.x)
-        return await groups_broadcast(chat_id, message)
     except Exception as e:
-        await db.delete_chat(chat_id)
         logging.info(f"{chat_id}-Removed from Database.")
         return "Error"
 
@@ -191,9 +243,7 @@ async def get_settings(group_id):
     return settings
     
 async def save_group_settings(group_id, key, value):
-    current = await get_settings(group_id)
-    current[key] = value
-    await db.update_settings(group_id, current) 
+    await db.update_setting(group_id, key, value)
 
 def get_size(size):
     units = ["Bytes", "KB", "MB", "GB", "TB", "PB", "EB"]
@@ -314,3 +364,221 @@ async def save_default_settings(id):
     await db.reset_group_settings(id)
     current = await db.get_settings(id)
     temp.SETTINGS.update({id: current})
+
+class TokenBucket:
+    """Lets `rate` sends per second through on average, in bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            self.refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.refill()
+            self.tokens -= 1
+
+    def pause(self, seconds):
+        """Hold every send back for `seconds`, after a FloodWait. Workers that
+        hit the same FloodWait don't add to the wait"""
+        self.refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+# Telegram allows bots about 30 messages a second overall and short bursts
+# into a single chat at roughly one message a second
+send_bucket = TokenBucket(25, 30)
+chat_buckets = {}
+
+def chat_bucket(chat_id):
+    bucket = chat_buckets.get(chat_id)
+    if bucket is None:
+        if len(chat_buckets) >= 10000:
+            # Buckets that have filled up again are the same as new ones
+            for key, value in list(chat_buckets.items()):
+                value.refill()
+                if value.tokens >= value.capacity:
+                    del chat_buckets[key]
+        bucket = chat_buckets[chat_id] = TokenBucket(1, 20)
+    return bucket
+
+class AdaptiveBucket(TokenBucket):
+    """TokenBucket that halves its rate on every FloodWait and creeps back up
+    to the starting rate as sends go through"""
+
+    def __init__(self, rate, capacity):
+        super().__init__(rate, capacity)
+        self.max_rate = rate
+
+    async def acquire(self):
+        await super().acquire()
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 1000)
+
+    def pause(self, seconds):
+        # Tokens only go negative while paused, so the rate is halved once per FloodWait
+        self.refill()
+        if self.tokens >= 0:
+            self.rate = max(1, self.rate / 2)
+        super().pause(seconds)
+
+broadcast_bucket = AdaptiveBucket(BROADCAST_RATE, BROADCAST_RATE)
+
+async def send_limited(chat_id, send, bucket=None):
+    """Run `send()` under the per-chat limit and the global one, send_bucket
+    unless another `bucket` is given, retrying after FloodWait"""
+    chat = chat_bucket(chat_id)
+    bucket = bucket or send_bucket
+    while True:
+        await chat.acquire()
+        await bucket.acquire()
+        try:
+            return await send()
+        except FloodWait as e:
+            chat.pause(e.value)
+            bucket.pause(e.value)
+            await asyncio.sleep(e.value)
+
+async def send_files(client, chat_id, files, caption, workers=FILE_SEND_WORKERS):
+    """Send cached files to a chat with up to `workers` sends in flight.
+    Each send goes out only after the one before it did, so the files normally
+    arrive in order. Telegram doesn't promise that for requests in flight at
+    once, workers=1 sends strictly one after another. caption is the group's
+    caption template, files that fail to send are skipped.
+    Returns the sent messages in the order of files"""
+    semaphore = asyncio.Semaphore(workers)
+    dispatched = [asyncio.Event() for _ in files]
+
+    async def send(i, file):
+        f_caption = caption.format(
+            file_name=formate_file_name(file.file_name),
+            file_size=get_size(file.file_size),
+            file_caption=file.caption
+        )
+        btn = [[
+            InlineKeyboardButton("✛ ᴡᴀᴛᴄʜ & ᴅᴏᴡɴʟᴏᴀᴅ ✛", callback_data=f'stream#{file.file_id}')
+        ]]
+
+        def dispatch():
+            dispatched[i].set()
+            return client.send_cached_media(
+                chat_id=chat_id,
+                file_id=file.file_id,
+                caption=f_caption,
+                reply_markup=InlineKeyboardMarkup(btn)
+            )
+
+        if i:
+            await dispatched[i - 1].wait()
+        async with semaphore:
+            try:
+                return await send_limited(chat_id, dispatch)
+            except Exception:
+                logger.exception(f'Failed to send {file.file_id} to {chat_id}')
+                return None
+            finally:
+                dispatched[i].set()
+
+    sent = await asyncio.gather(*[send(i, file) for i, file in enumerate(files)])
+    return [message for message in sent if message]
+
+class ActionScheduler:
+    """Deletes messages, and edits a notice about it, at a later time.
+    Actions are saved to the database so they survive restarts. The ones due
+    in the next SCHEDULE_WINDOW seconds are kept in a heap, and all due
+    deletes of a chat are sent as one delete_messages call."""
+
+    SCHEDULE_WINDOW = 600
+
+    def __init__(self):
+        self.heap = []
+        self.horizon = None
+        self.wake = asyncio.Event()
+
+    async def schedule_delete(self, chat_id, message_ids, delay, edit_id=None, edit_text=None):
+        """Delete message_ids from chat_id after `delay` seconds, then edit
+        message edit_id to edit_text if given"""
+        action = {
+            'run_at': datetime.utcnow() + timedelta(seconds=delay),
+            'chat_id': chat_id,
+            'message_ids': list(message_ids),
+            'edit_id': edit_id,
+            'edit_text': edit_text,
+        }
+        await db.add_scheduled_action(action)
+        if self.horizon and action['run_at'] < self.horizon:
+            heapq.heappush(self.heap, (action['run_at'], action['_id'], action))
+            self.wake.set()
+
+    async def delete_later(self, delay, *messages):
+        """Delete pyrogram messages after `delay` seconds, None entries are skipped"""
+        by_chat = {}
+        for message in messages:
+            if message:
+                by_chat.setdefault(message.chat.id, []).append(message.id)
+        for chat_id, message_ids in by_chat.items():
+            await self.schedule_delete(chat_id, message_ids, delay)
+
+    async def delete_messages(self, client, chat_id, message_ids):
+        try:
+            await send_limited(chat_id, lambda: client.delete_messages(chat_id, message_ids))
+        except Exception as e:
+            if len(message_ids) == 1:
+                logger.warning(f'Scheduled delete in {chat_id} failed - {e}')
+                return
+            # One message we may not delete fails the whole call, retry them one by one
+            for message_id in message_ids:
+                await self.delete_messages(client, chat_id, [message_id])
+
+    async def run_actions(self, client, actions):
+        by_chat = {}
+        for action in actions:
+            by_chat.setdefault(action['chat_id'], []).append(action)
+        for chat_id, chat_actions in by_chat.items():
+            message_ids = [message_id for action in chat_actions for message_id in action['message_ids']]
+            for i in range(0, len(message_ids), 100):
+                await self.delete_messages(client, chat_id, message_ids[i:i + 100])
+            for action in chat_actions:
+                if action.get('edit_id'):
+                    try:
+                        await send_limited(chat_id, lambda: client.edit_message_text(chat_id, action['edit_id'], action['edit_text']))
+                    except Exception as e:
+                        logger.warning(f'Scheduled edit in {chat_id} failed - {e}')
+        await db.delete_scheduled_actions([action['_id'] for action in actions])
+
+    async def run(self, client):
+        """Load the actions of the next window, overdue ones included, and run them as they fall due"""
+        await db.ensure_scheduled_index()
+        while True:
+            self.horizon = datetime.utcnow() + timedelta(seconds=self.SCHEDULE_WINDOW)
+            self.heap = [(action['run_at'], action['_id'], action) for action in await db.get_scheduled_actions(self.horizon)]
+            heapq.heapify(self.heap)
+            while True:
+                self.wake.clear()
+                now = datetime.utcnow()
+                due = []
+                while self.heap and self.heap[0][0] <= now:
+                    due.append(heapq.heappop(self.heap)[2])
+                if due:
+                    try:
+                        await self.run_actions(client, due)
+                    except Exception:
+                        logger.exception('Scheduled actions failed')
+                    continue
+                if now >= self.horizon:
+                    break
+                next_run = self.heap[0][0] if self.heap else self.horizon
+                try:
+                    await asyncio.wait_for(self.wake.wait(), (min(next_run, self.horizon) - now).total_seconds())
+                except asyncio.TimeoutError:
+                    pass
+
+scheduler = ActionScheduler()